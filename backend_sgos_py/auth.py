@@ -1,19 +1,121 @@
+import asyncio
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from models import Usuario
 from schemas import TokenData
 from config import settings
+from monitor_sql import registrar_usuario
 
 # Configuração de segurança
 security = HTTPBearer()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+@dataclass(frozen=True)
+class Principal:
+    """Dados do usuário autenticado mantidos em cache (sem sessão do banco)"""
+    id: int
+    username: str
+    nome_completo: str
+    perfil: str
+    ativo: bool
+
+    @classmethod
+    def from_usuario(cls, usuario: Usuario) -> "Principal":
+        return cls(
+            id=usuario.id,
+            username=usuario.username,
+            nome_completo=usuario.nome_completo,
+            perfil=usuario.perfil,
+            ativo=usuario.ativo
+        )
+
+    async def carregar(self, db: AsyncSession) -> Optional[Usuario]:
+        """Obtém o Usuario do ORM correspondente, para handlers que precisam dele"""
+        return await db.get(Usuario, self.id)
+
+class PrincipalCache:
+    """Cache LRU com TTL dos usuários autenticados, indexado pelo username do token"""
+
+    def __init__(self, ttl_seconds: int = 60, max_size: int = 1024):
+        self.ttl = ttl_seconds
+        self.max_size = max_size
+        self._itens: "OrderedDict[str, tuple]" = OrderedDict()
+        # Incrementada a cada invalidação: uma leitura do banco que cruzou uma escrita não é guardada
+        self.geracao = 0
+
+    def get(self, username: str) -> Optional[Principal]:
+        item = self._itens.get(username)
+        if item is None:
+            return None
+        principal, expira_em = item
+        if expira_em < time.monotonic():
+            del self._itens[username]
+            return None
+        self._itens.move_to_end(username)
+        return principal
+
+    def set(self, principal: Principal, geracao: Optional[int] = None):
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        if geracao is not None and geracao != self.geracao:
+            return
+        self._itens[principal.username] = (principal, time.monotonic() + self.ttl)
+        self._itens.move_to_end(principal.username)
+        while len(self._itens) > self.max_size:
+            self._itens.popitem(last=False)
+
+    def invalidate(self, username: Optional[str] = None, usuario_id: Optional[int] = None):
+        """Remove o usuário do cache pelo username e/ou pelo id"""
+        self.geracao += 1
+        if username is not None:
+            self._itens.pop(username, None)
+        if usuario_id is not None:
+            for chave in [k for k, (p, _) in self._itens.items() if p.id == usuario_id]:
+                del self._itens[chave]
+
+    def clear(self):
+        self._itens.clear()
+
+principal_cache = PrincipalCache(
+    ttl_seconds=settings.principal_cache_ttl_seconds,
+    max_size=settings.principal_cache_max_size
+)
+
+def invalidar_principal(usuario_id: int, *usernames: str):
+    """
+    Invalida o cache do usuário; chamar depois do commit que o alterou, desativou
+    ou removeu (antes dele, outra requisição poderia recarregar a linha antiga).
+    Informar também o username anterior quando ele mudar.
+    """
+    for username in usernames:
+        principal_cache.invalidate(username=username)
+    principal_cache.invalidate(usuario_id=usuario_id)
+
+async def _resolver_principal(db: AsyncSession, username: str) -> Optional[Principal]:
+    """Busca o principal no cache ou, na falta, no banco"""
+    principal = principal_cache.get(username)
+    if principal is not None:
+        return principal
+    geracao = principal_cache.geracao
+    user = await db.scalar(select(Usuario).where(Usuario.username == username))
+    if user is None:
+        return None
+    principal = Principal.from_usuario(user)
+    principal_cache.set(principal, geracao)
+    return principal
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica se a senha está correta usando bcrypt"""
     try:
@@ -30,12 +132,96 @@ def get_password_hash(password: str) -> str:
         print(f"⚠️ Erro ao gerar hash da senha: {e}")
         raise e
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[Usuario]:
-    """Autentica o usuário"""
-    user = db.query(Usuario).filter(Usuario.username == username).first()
+class PasswordPool:
+    """
+    Executor dedicado e limitado para o bcrypt (verificação e geração de hash),
+    para que logins não bloqueiem o event loop. Quando há mais de
+    workers + max_queue operações pendentes, rejeita na hora com 503.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 32):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()  # pendentes é decrementado na thread do worker
+        self.pendentes = 0
+        self.concluidos = 0
+        self.rejeitados = 0
+
+    async def run(self, func, *args):
+        if self.pendentes >= self.workers + self.max_queue:
+            self.rejeitados += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servidor ocupado, tente novamente em instantes",
+                headers={"Retry-After": "1"},
+            )
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        with self._lock:
+            self.pendentes += 1
+        # A vaga é liberada quando o job termina no executor, não quando quem aguarda
+        # retorna: se a requisição for cancelada, o bcrypt continua ocupando o worker
+        futuro = self._executor.submit(func, *args)
+        futuro.add_done_callback(self._liberar)
+        return await asyncio.wrap_future(futuro)
+
+    def _liberar(self, futuro):
+        with self._lock:
+            self.pendentes -= 1
+            self.concluidos += 1
+
+    def stats(self) -> dict:
+        em_uso = min(self.pendentes, self.workers)
+        return {
+            "workers": self.workers,
+            "max_fila": self.max_queue,
+            "em_uso": em_uso,
+            "na_fila": self.pendentes - em_uso,
+            "utilizacao": round(em_uso / self.workers, 2) if self.workers else 0,
+            "concluidos": self.concluidos,
+            "rejeitados": self.rejeitados
+        }
+
+    def prometheus(self) -> str:
+        """Utilização do pool no formato texto do Prometheus"""
+        dados = self.stats()
+        return "\n".join([
+            "# HELP sgos_password_pool_busy Workers do bcrypt ocupados",
+            "# TYPE sgos_password_pool_busy gauge",
+            f"sgos_password_pool_busy {dados['em_uso']}",
+            "# HELP sgos_password_pool_queued Operações de bcrypt aguardando worker",
+            "# TYPE sgos_password_pool_queued gauge",
+            f"sgos_password_pool_queued {dados['na_fila']}",
+            "# HELP sgos_password_pool_rejected_total Operações de bcrypt rejeitadas por fila cheia",
+            "# TYPE sgos_password_pool_rejected_total counter",
+            f"sgos_password_pool_rejected_total {dados['rejeitados']}",
+        ]) + "\n"
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+password_pool = PasswordPool(
+    workers=settings.password_pool_workers,
+    max_queue=settings.password_pool_max_queue
+)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password executado no pool do bcrypt, fora do event loop"""
+    return await password_pool.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash executado no pool do bcrypt, fora do event loop"""
+    return await password_pool.run(get_password_hash, password)
+
+async def authenticate_user_async(db: AsyncSession, username: str, password: str) -> Optional[Usuario]:
+    """Autentica o usuário, com a verificação da senha no pool do bcrypt"""
+    user = await db.scalar(select(Usuario).where(Usuario.username == username))
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return None
     if not user.ativo:
         return None
@@ -67,12 +253,12 @@ def verify_token(token: str) -> Optional[TokenData]:
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> Usuario:
-    """Obtém o usuário atual baseado no token"""
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """Obtém o usuário atual baseado no token (em cache por alguns segundos)"""
     if not settings.enable_token_validation:
         # Se a validação de token estiver desabilitada, retorna um usuário padrão
-        return db.query(Usuario).filter(Usuario.username == "admin").first()
+        return await _resolver_principal(db, "admin")
     
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -87,7 +273,7 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(Usuario).filter(Usuario.username == token_data.username).first()
+    user = await _resolver_principal(db, token_data.username)
     if user is None:
         raise credentials_exception
     if not user.ativo:
@@ -96,9 +282,10 @@ async def get_current_user(
             detail="Usuário inativo"
         )
     
+    registrar_usuario(user.id)
     return user
 
-async def get_current_active_user(current_user: Usuario = Depends(get_current_user)) -> Usuario:
+async def get_current_active_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     """Verifica se o usuário atual está ativo"""
     if not current_user.ativo:
         raise HTTPException(
@@ -107,7 +294,22 @@ async def get_current_active_user(current_user: Usuario = Depends(get_current_us
         )
     return current_user
 
-def check_admin_permission(current_user: Usuario = Depends(get_current_active_user)) -> Usuario:
+async def get_current_usuario_db(
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+) -> Usuario:
+    """Usuario do ORM do usuário atual, para handlers que precisam de todos os campos"""
+    usuario = await current_user.carregar(db)
+    if usuario is None:
+        principal_cache.invalidate(username=current_user.username)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Credenciais inválidas",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return usuario
+
+def check_admin_permission(current_user: Principal = Depends(get_current_active_user)) -> Principal:
     """Verifica se o usuário tem permissão de administrador"""
     if current_user.perfil != "ADMIN":
         raise HTTPException(
@@ -0,0 +1,123 @@
+"""
+Busca textual das ordens de serviço
+
+No SQLite usa uma tabela virtual FTS5 (ordem_servico_fts) com conteúdo
+externo, mantida em sincronia com ordem_servico por triggers e com tokenizador
+unicode61 sem acentos ("manutencao" encontra "manutenção"). No MySQL usa um
+índice FULLTEXT (a insensibilidade a acentos vem da collation da tabela).
+Cada palavra do termo é buscada por prefixo e os resultados são ordenados por
+relevância. Sem índice disponível, volta ao LIKE '%termo%' nas quatro colunas.
+"""
+
+import re
+from typing import Optional, Tuple
+from sqlalchemy import column, inspect, literal_column, or_, table, text
+from sqlalchemy.engine import Engine
+from models import OrdemServico
+
+TABELA_FTS = "ordem_servico_fts"
+INDICE_FULLTEXT = "ft_ordem_servico_busca"
+COLUNAS = ("problema_apresentado", "causa_da_avaria", "sistema_afetado", "hodometro")
+
+_PALAVRA = re.compile(r"\w+", re.UNICODE)
+
+# Dialeto com índice de busca pronto ("sqlite", "mysql") ou None para o LIKE
+_modo: Optional[str] = None
+
+_fts = table(TABELA_FTS, column("rowid"))
+
+
+def _sql_sqlite() -> list:
+    colunas = ", ".join(COLUNAS)
+    novos = ", ".join(f"new.{coluna}" for coluna in COLUNAS)
+    antigos = ", ".join(f"old.{coluna}" for coluna in COLUNAS)
+    remover = (
+        f"INSERT INTO {TABELA_FTS}({TABELA_FTS}, rowid, {colunas}) "
+        f"VALUES ('delete', old.id, {antigos});"
+    )
+    inserir = f"INSERT INTO {TABELA_FTS}(rowid, {colunas}) VALUES (new.id, {novos});"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {TABELA_FTS}_ai AFTER INSERT ON ordem_servico BEGIN {inserir} END",
+        f"CREATE TRIGGER IF NOT EXISTS {TABELA_FTS}_ad AFTER DELETE ON ordem_servico BEGIN {remover} END",
+        f"CREATE TRIGGER IF NOT EXISTS {TABELA_FTS}_au AFTER UPDATE OF {colunas} ON ordem_servico "
+        f"BEGIN {remover} {inserir} END",
+    ]
+
+
+def _preparar_sqlite(engine: Engine) -> bool:
+    with engine.begin() as conn:
+        existe = inspect(conn).has_table(TABELA_FTS)
+        if not existe:
+            try:
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE {TABELA_FTS} USING fts5({', '.join(COLUNAS)}, "
+                    f"content='ordem_servico', content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                ))
+            except Exception as e:
+                print(f"⚠️ FTS5 indisponível, busca de OS usará LIKE: {e}")
+                return False
+        for sql in _sql_sqlite():
+            conn.execute(text(sql))
+        if not existe:
+            conn.execute(text(f"INSERT INTO {TABELA_FTS}({TABELA_FTS}) VALUES ('rebuild')"))
+            print(f"🔎 Índice de busca {TABELA_FTS} criado")
+    return True
+
+
+def _preparar_mysql(engine: Engine) -> bool:
+    indices = {indice["name"] for indice in inspect(engine).get_indexes("ordem_servico")}
+    if INDICE_FULLTEXT not in indices:
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"ALTER TABLE ordem_servico ADD FULLTEXT INDEX {INDICE_FULLTEXT} ({', '.join(COLUNAS)})"
+            ))
+        print(f"🔎 Índice FULLTEXT {INDICE_FULLTEXT} criado")
+    return True
+
+
+def preparar_busca(engine: Engine):
+    """Executado no startup: cria o índice de busca do banco, se suportado"""
+    global _modo
+    dialeto = engine.dialect.name
+    pronto = False
+    if dialeto == "sqlite":
+        pronto = _preparar_sqlite(engine)
+    elif dialeto == "mysql":
+        pronto = _preparar_mysql(engine)
+    _modo = dialeto if pronto else None
+
+
+def _palavras(termo: str) -> list:
+    return _PALAVRA.findall(termo or "")
+
+
+def _filtro_like(termo: str):
+    return or_(*(getattr(OrdemServico, coluna).contains(termo) for coluna in COLUNAS))
+
+
+def aplicar_busca(query, termo: str) -> Tuple[object, Optional[object]]:
+    """
+    Aplica a busca ao SELECT de OrdemServico.
+    Retorna a query filtrada e a expressão de relevância para o ORDER BY
+    (None quando a busca cai no LIKE).
+    """
+    palavras = _palavras(termo)
+    if _modo is None or not palavras:
+        return query.where(_filtro_like(termo)), None
+
+    if _modo == "sqlite":
+        # "palavra"* = prefixo; palavras separadas por espaço = todas devem aparecer
+        consulta = " ".join('"{}"*'.format(palavra.replace('"', '""')) for palavra in palavras)
+        query = query.join(_fts, _fts.c.rowid == OrdemServico.id).where(
+            literal_column(TABELA_FTS).op("MATCH")(consulta)
+        )
+        # rank do FTS5 = bm25 (menor é mais relevante)
+        return query, literal_column(f"{TABELA_FTS}.rank").asc()
+
+    from sqlalchemy.dialects.mysql import match
+    relevancia = match(
+        *(getattr(OrdemServico, coluna) for coluna in COLUNAS),
+        against=" ".join(f"+{palavra}*" for palavra in palavras)
+    ).in_boolean_mode()
+    return query.where(relevancia), relevancia.desc()
@@ -0,0 +1,186 @@
+"""
+Cache dos agregados (dashboard e resumos) invalidado pelas escritas
+
+Cada entrada é marcada com as tabelas ("veiculo") ou colunas ("veiculo.marca")
+de que depende. Os listeners de sessão anotam em after_flush o que foi escrito
+pelo ORM (a tabela, para inserções e remoções, ou as colunas alteradas, para
+updates) e, no after_commit, descartam as entradas afetadas; um rollback
+descarta as anotações. Uma dependência de tabela é afetada por qualquer
+escrita nela; uma de coluna, por inserções, remoções e updates dessa coluna. Escritas feitas por outros processos só são
+vistas após agregados_cache_ttl_seconds, a idade máxima de qualquer entrada.
+
+O recálculo é single-flight: requisições que chegam enquanto um valor está
+sendo calculado aguardam esse mesmo cálculo em vez de repetir as consultas.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Tuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from config import settings
+
+
+class CacheAgregados:
+    """Valores agregados por chave, com as tabelas/colunas de que dependem e idade máxima"""
+
+    def __init__(self, ttl_seconds: int = 60, max_size: int = 256):
+        self.ttl = ttl_seconds
+        self.max_size = max_size
+        self._itens: "OrderedDict[tuple, tuple]" = OrderedDict()  # chave -> (valor, dependencias, expira_em)
+        self._calculando: Dict[tuple, asyncio.Future] = {}
+        # Incrementada a cada invalidação: um cálculo que cruzou uma escrita não é guardado
+        self._versoes: Dict[str, int] = {}
+
+        # Contadores
+        self.acertos = 0
+        self.calculos = 0
+        self.aguardando = 0
+        self.invalidacoes = 0
+
+    def _versao(self, dependencias: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._versoes.get(dependencia.partition(".")[0], 0) for dependencia in dependencias)
+
+    def get(self, chave: tuple):
+        """Retorna (valor, True) se houver entrada válida, senão (None, False)"""
+        item = self._itens.get(chave)
+        if item is None:
+            return None, False
+        valor, _, expira_em = item
+        if expira_em < time.monotonic():
+            del self._itens[chave]
+            return None, False
+        self._itens.move_to_end(chave)
+        return valor, True
+
+    def set(self, chave: tuple, valor: Any, dependencias: Iterable[str]):
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        self._itens[chave] = (valor, frozenset(dependencias), time.monotonic() + self.ttl)
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.max_size:
+            self._itens.popitem(last=False)
+
+    async def obter(self, chave: tuple, dependencias: Tuple[str, ...], calcular: Callable[[], Awaitable[Any]]) -> Any:
+        """Valor em cache ou calculado por calcular(); chamadas simultâneas compartilham um único cálculo"""
+        while True:
+            valor, encontrado = self.get(chave)
+            if encontrado:
+                self.acertos += 1
+                return valor
+
+            pendente = self._calculando.get(chave)
+            if pendente is None:
+                break
+            self.aguardando += 1
+            try:
+                return await asyncio.shield(pendente)
+            except asyncio.CancelledError:
+                # Só repete se quem calculava foi cancelado; o cancelamento desta requisição propaga
+                if not pendente.cancelled():
+                    raise
+
+        pendente = asyncio.get_running_loop().create_future()
+        self._calculando[chave] = pendente
+        versao = self._versao(dependencias)
+        try:
+            valor = await calcular()
+        except asyncio.CancelledError:
+            pendente.cancel()
+            raise
+        except Exception as e:
+            pendente.set_exception(e)
+            # Evita o aviso de exceção não lida quando ninguém aguardava
+            pendente.exception()
+            raise
+        else:
+            pendente.set_result(valor)
+            self.calculos += 1
+            if self._versao(dependencias) == versao:
+                self.set(chave, valor, dependencias)
+            return valor
+        finally:
+            self._calculando.pop(chave, None)
+
+    def invalidate(self, escritas: Iterable[str]):
+        """Descarta as entradas afetadas pelas escritas ("tabela" ou "tabela.coluna")"""
+        escritas = set(escritas)
+        if not escritas:
+            return
+        for tabela in {escrita.partition(".")[0] for escrita in escritas}:
+            self._versoes[tabela] = self._versoes.get(tabela, 0) + 1
+        afetadas = [
+            chave for chave, item in self._itens.items()
+            if any(_afetada(dependencia, escritas) for dependencia in item[1])
+        ]
+        for chave in afetadas:
+            del self._itens[chave]
+            self.invalidacoes += 1
+
+    def clear(self):
+        self._itens.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna os contadores do cache"""
+        return {
+            "entradas": len(self._itens),
+            "calculando": len(self._calculando),
+            "acertos": self.acertos,
+            "calculos": self.calculos,
+            "aguardando": self.aguardando,
+            "invalidacoes": self.invalidacoes
+        }
+
+
+cache_agregados = CacheAgregados(
+    ttl_seconds=settings.agregados_cache_ttl_seconds,
+    max_size=settings.agregados_cache_max_size
+)
+
+
+def _tabela(obj):
+    tabela = getattr(obj, "__table__", None)
+    return tabela.name if tabela is not None else None
+
+
+def _colunas_alteradas(obj):
+    """Colunas com valor alterado em um objeto dirty, no formato tabela.coluna"""
+    tabela = _tabela(obj)
+    estado = inspect(obj)
+    return {
+        f"{tabela}.{atributo.key}"
+        for atributo in estado.mapper.column_attrs
+        if estado.attrs[atributo.key].history.has_changes()
+    }
+
+
+def _afetada(dependencia: str, escritas: set) -> bool:
+    """Escrita em "tabela" afeta todas as dependências da tabela; em "tabela.coluna", a coluna e a tabela"""
+    if dependencia in escritas:
+        return True
+    tabela, _, coluna = dependencia.partition(".")
+    if coluna:
+        return tabela in escritas
+    return any(escrita.partition(".")[0] == tabela for escrita in escritas)
+
+
+@event.listens_for(Session, "after_flush")
+def _registrar_tabelas(session, flush_context):
+    """Acumula na sessão as tabelas e colunas escritas até o commit"""
+    escritas = session.info.setdefault("agregados_tabelas", set())
+    escritas.update(_tabela(obj) for obj in session.new)
+    escritas.update(_tabela(obj) for obj in session.deleted)
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            escritas.update(_colunas_alteradas(obj))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_tabelas(session):
+    cache_agregados.invalidate(session.info.pop("agregados_tabelas", None) or ())
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_tabelas(session):
+    session.info.pop("agregados_tabelas", None)
@@ -0,0 +1,150 @@
+"""
+Totais das listagens sem COUNT(*) a cada página
+
+- Sem filtros: contador por tabela, carregado com um COUNT(*) e atualizado a cada
+  commit com as inserções e remoções feitas pelo ORM; é recalculado a cada
+  contagem_resync_seconds para corrigir alterações feitas por outros processos.
+- Com filtros: cache LRU com TTL curto, indexado pela tabela e pelo SQL + parâmetros
+  dos filtros; qualquer escrita na tabela descarta as contagens dela.
+- with_total=false dispensa o total (padrão quando a página vem por cursor).
+
+Totais vindos do contador ou do cache são informados como estimados (total_exato=false).
+"""
+
+import time
+from collections import Counter, OrderedDict
+from typing import Optional, Tuple
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from config import settings
+from database import engine
+
+
+class ContagemCache:
+    """Cache LRU com TTL das contagens filtradas, indexado por (tabela, filtros)"""
+
+    def __init__(self, ttl_seconds: int = 10, max_size: int = 512):
+        self.ttl = ttl_seconds
+        self.max_size = max_size
+        self._itens: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def get(self, chave: tuple) -> Optional[int]:
+        item = self._itens.get(chave)
+        if item is None:
+            return None
+        total, expira_em = item
+        if expira_em < time.monotonic():
+            del self._itens[chave]
+            return None
+        self._itens.move_to_end(chave)
+        return total
+
+    def set(self, chave: tuple, total: int):
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        self._itens[chave] = (total, time.monotonic() + self.ttl)
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.max_size:
+            self._itens.popitem(last=False)
+
+    def invalidate(self, tabela: str):
+        for chave in [chave for chave in self._itens if chave[0] == tabela]:
+            del self._itens[chave]
+
+    def clear(self):
+        self._itens.clear()
+
+
+class ContadorTabelas:
+    """Total estimado de linhas por tabela, mantido pelos commits do ORM"""
+
+    def __init__(self, resync_seconds: int = 300):
+        self.resync = resync_seconds
+        self._totais = {}  # tabela -> (total, carregado_em)
+
+    def get(self, tabela: str) -> Optional[int]:
+        item = self._totais.get(tabela)
+        if item is None or item[1] + self.resync < time.monotonic():
+            return None
+        return item[0]
+
+    def set(self, tabela: str, total: int):
+        self._totais[tabela] = (total, time.monotonic())
+
+    def ajustar(self, tabela: str, delta: int):
+        item = self._totais.get(tabela)
+        if item is not None:
+            self._totais[tabela] = (max(item[0] + delta, 0), item[1])
+
+    def clear(self):
+        self._totais.clear()
+
+
+contagem_cache = ContagemCache(
+    ttl_seconds=settings.contagem_cache_ttl_seconds,
+    max_size=settings.contagem_cache_max_size
+)
+contador_tabelas = ContadorTabelas(resync_seconds=settings.contagem_resync_seconds)
+
+
+def _tabela(obj) -> Optional[str]:
+    tabela = getattr(obj, "__table__", None)
+    return tabela.name if tabela is not None else None
+
+
+@event.listens_for(Session, "after_flush")
+def _registrar_alteracoes(session, flush_context):
+    """Acumula na sessão as inserções/remoções até o commit"""
+    deltas = session.info.setdefault("contagem_deltas", Counter())
+    alteradas = session.info.setdefault("contagem_tabelas", set())
+    for obj in session.new:
+        deltas[_tabela(obj)] += 1
+    for obj in session.deleted:
+        deltas[_tabela(obj)] -= 1
+    alteradas.update(_tabela(obj) for obj in session.dirty if session.is_modified(obj))
+    alteradas.update(deltas)
+
+
+@event.listens_for(Session, "after_commit")
+def _aplicar_alteracoes(session):
+    deltas = session.info.pop("contagem_deltas", None) or {}
+    for tabela, delta in deltas.items():
+        if delta:
+            contador_tabelas.ajustar(tabela, delta)
+    for tabela in session.info.pop("contagem_tabelas", None) or ():
+        contagem_cache.invalidate(tabela)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_alteracoes(session):
+    session.info.pop("contagem_deltas", None)
+    session.info.pop("contagem_tabelas", None)
+
+
+async def contar_total(db, query, modelo, with_total: Optional[bool], cursor: Optional[str]) -> Tuple[Optional[int], bool]:
+    """
+    Total da listagem: (total, total_exato).
+    with_total None = só calcula quando a página não vem por cursor.
+    """
+    if with_total is None:
+        with_total = not cursor
+    if not with_total:
+        return None, False
+
+    tabela = modelo.__tablename__
+    if query.whereclause is None:
+        total = contador_tabelas.get(tabela)
+        if total is not None:
+            return total, False
+        total = await db.scalar(select(func.count()).select_from(modelo))
+        contador_tabelas.set(tabela, total)
+        return total, True
+
+    compilada = query.compile(dialect=engine.dialect)
+    chave = (tabela, str(compilada), tuple(sorted((k, repr(v)) for k, v in compilada.params.items())))
+    total = contagem_cache.get(chave)
+    if total is not None:
+        return total, False
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    contagem_cache.set(chave, total)
+    return total, True
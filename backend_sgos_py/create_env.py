@@ -25,6 +25,7 @@ ACCESS_TOKEN_EXPIRE_MINUTES=30
 
 # Configurações de Banco de Dados
 DATABASE_URL=sqlite:///./sgos.db
+LOG_DATABASE_URL=sqlite:///./sgos_logs.db
 
 # Configurações de Reset de Senha
 PASSWORD_RESET_TOKEN_EXPIRE_MINUTES=15
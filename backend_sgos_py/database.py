@@ -1,15 +1,80 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
 from config import settings
 
+_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+_SYNCHRONOUS = ("OFF", "NORMAL", "FULL", "EXTRA")
+_TEMP_STORE = ("DEFAULT", "FILE", "MEMORY")
+
+def _opcao_pragma(nome: str, valor: str, validos) -> str:
+    valor = valor.upper()
+    if valor not in validos:
+        raise ValueError(f"Valor inválido para SQLITE_{nome.upper()}: {valor}")
+    return valor
+
+def pragmas_sqlite() -> dict:
+    """PRAGMAs do perfil do SQLite configurado em Settings, na ordem em que são aplicados"""
+    return {
+        "journal_mode": _opcao_pragma("journal_mode", settings.sqlite_journal_mode, _JOURNAL_MODES),
+        "synchronous": _opcao_pragma("synchronous", settings.sqlite_synchronous, _SYNCHRONOUS),
+        "busy_timeout": settings.sqlite_busy_timeout_ms,
+        "cache_size": -settings.sqlite_cache_size_kb,  # negativo = tamanho em KiB
+        "mmap_size": settings.sqlite_mmap_size_mb * 1024 * 1024,
+        "temp_store": _opcao_pragma("temp_store", settings.sqlite_temp_store, _TEMP_STORE),
+        "foreign_keys": "ON" if settings.sqlite_foreign_keys else "OFF",
+    }
+
+def _em_memoria(url) -> bool:
+    return url.database in (None, "", ":memory:") or "mode=memory" in str(url)
+
+def _opcoes_engine(database_url) -> dict:
+    """Pool adequado ao banco: SQLite em arquivo usa um pool pequeno, sem pre_ping/recycle"""
+    url = make_url(database_url)
+    if url.get_backend_name() != "sqlite":
+        return {"pool_pre_ping": True, "pool_recycle": 300}
+    if _em_memoria(url):
+        # Banco em memória só existe dentro da conexão: todos compartilham uma única
+        return {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": settings.sqlite_pool_size,
+        "max_overflow": settings.sqlite_max_overflow,
+        "connect_args": {"check_same_thread": False},
+    }
+
+def configurar_sqlite(engine):
+    """Aplica o perfil de PRAGMAs do SQLite a cada nova conexão do pool (sync ou async)"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if sync_engine.dialect.name != "sqlite":
+        return
+    pragmas = pragmas_sqlite()
+
+    @event.listens_for(sync_engine, "connect")
+    def _aplicar_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for nome, valor in pragmas.items():
+            cursor.execute(f"PRAGMA {nome}={valor}")
+        cursor.close()
+
+def pragmas_efetivos(engine) -> dict:
+    """Lê de uma conexão os valores dos PRAGMAs realmente em vigor"""
+    with engine.connect() as conn:
+        valores = {nome: conn.exec_driver_sql(f"PRAGMA {nome}").scalar() for nome in pragmas_sqlite()}
+    valores["synchronous"] = _SYNCHRONOUS[valores["synchronous"]]
+    valores["temp_store"] = _TEMP_STORE[valores["temp_store"]]
+    valores["foreign_keys"] = "ON" if valores["foreign_keys"] else "OFF"
+    return valores
+
 # Criar engine do banco de dados
 engine = create_engine(
     settings.database_url,
-    pool_pre_ping=True,
-    pool_recycle=300,
-    echo=False
+    echo=False,
+    **_opcoes_engine(settings.database_url)
 )
+configurar_sqlite(engine)
 
 # Criar sessão
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -17,6 +82,51 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Base para os modelos
 Base = declarative_base()
 
+# Drivers assíncronos equivalentes aos drivers síncronos da DATABASE_URL
+_DRIVERS_ASYNC = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql+mysqldb": "mysql+aiomysql",
+}
+
+def url_async(database_url: str):
+    """Converte a URL síncrona (sqlite/pymysql) para o driver assíncrono correspondente"""
+    url = make_url(database_url)
+    driver = _DRIVERS_ASYNC.get(url.drivername)
+    if driver is None:
+        raise ValueError(f"Sem driver assíncrono para {url.drivername}; use DATABASE_ASYNC=false")
+    return url.set(drivername=driver)
+
+# Engine e sessão assíncronos usados pelos routers (DATABASE_ASYNC=true)
+async_engine = create_async_engine(
+    url_async(settings.database_url),
+    echo=False,
+    **_opcoes_engine(settings.database_url)
+) if settings.database_async else None
+if async_engine is not None:
+    configurar_sqlite(async_engine)
+
+# expire_on_commit=False: objetos continuam legíveis após o commit sem novo SELECT implícito
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+) if settings.database_async else None
+
+# Engine separado para os logs da API e de erro (mesmo perfil do SQLite:
+# com WAL e synchronous=NORMAL perder os últimos logs num crash é aceitável)
+log_engine = create_engine(
+    settings.log_database_url,
+    echo=False,
+    **_opcoes_engine(settings.log_database_url)
+)
+configurar_sqlite(log_engine)
+
+LogSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=log_engine)
+
+# Base dos modelos de log (criados no banco de logs)
+LogBase = declarative_base()
+
 # Dependency para obter a sessão do banco
 def get_db():
     db = SessionLocal()
@@ -24,3 +134,88 @@ def get_db():
         yield db
     finally:
         db.close()
+
+class SessaoSincrona:
+    """
+    Expõe um Session síncrono com a interface awaitable do AsyncSession.
+    Usado com DATABASE_ASYNC=false para que os routers tenham um único código
+    durante a migração (as consultas continuam bloqueando o event loop).
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None, **kwargs):
+        return self.sync_session.execute(statement, params, **kwargs)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return self.sync_session.scalar(statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return self.sync_session.scalars(statement, params, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return self.sync_session.get(entity, ident, **kwargs)
+
+    async def delete(self, instance):
+        self.sync_session.delete(instance)
+
+    async def flush(self, objects=None):
+        self.sync_session.flush(objects)
+
+    async def refresh(self, instance, attribute_names=None):
+        self.sync_session.refresh(instance, attribute_names)
+
+    async def commit(self):
+        self.sync_session.commit()
+
+    async def rollback(self):
+        self.sync_session.rollback()
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self.sync_session, *args, **kwargs)
+
+    async def close(self):
+        self.sync_session.close()
+
+# Dependency dos routers: AsyncSession ou, com DATABASE_ASYNC=false, Session síncrono adaptado
+async def get_async_db():
+    if settings.database_async:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield SessaoSincrona(db)
+        finally:
+            db.close()
+
+def sincronizar_esquema(bind, metadata):
+    """
+    Adiciona em tabelas já existentes as colunas e índices novos dos modelos.
+    O create_all só cria tabelas inexistentes; colunas novas entram como anuláveis.
+    """
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            
+            colunas = {coluna["name"] for coluna in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in colunas:
+                    tipo = column.type.compile(dialect=bind.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {tipo}"))
+                    print(f"🔧 Coluna {table.name}.{column.name} adicionada")
+            
+            indices = {indice["name"] for indice in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indices:
+                    index.create(conn)
+                    print(f"🔧 Índice {index.name} criado")
@@ -3,10 +3,11 @@ import string
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from models import Usuario, PasswordResetToken
-from auth import get_password_hash
+from auth import get_password_hash_async, invalidar_principal
 from config import settings
 from jinja2 import Environment, FileSystemLoader
 import os
@@ -33,10 +34,10 @@ def generate_reset_code() -> str:
     """Gera um código de 6 dígitos para recuperação de senha"""
     return ''.join(secrets.choice(string.digits) for _ in range(6))
 
-def create_password_reset_token(db: Session, email: str) -> Optional[str]:
+async def create_password_reset_token(db: AsyncSession, email: str) -> Optional[str]:
     """Cria um token de recuperação de senha para o usuário"""
     # Buscar usuário pelo email
-    usuario = db.query(Usuario).filter(Usuario.email == email).first()
+    usuario = await db.scalar(select(Usuario).where(Usuario.email == email))
     if not usuario:
         return None
     
@@ -55,7 +56,7 @@ def create_password_reset_token(db: Session, email: str) -> Optional[str]:
     )
     
     db.add(reset_token)
-    db.commit()
+    await db.commit()
     
     return reset_code
 
@@ -84,56 +85,61 @@ async def send_password_reset_email(email: str, reset_code: str, nome_usuario: s
     fm = FastMail(conf)
     await fm.send_message(message)
 
-def verify_reset_token(db: Session, token: str) -> Optional[Usuario]:
+async def verify_reset_token(db: AsyncSession, token: str) -> Optional[Usuario]:
     """Verifica se o token de recuperação é válido"""
-    reset_token = db.query(PasswordResetToken).filter(
-        PasswordResetToken.token == token,
-        PasswordResetToken.used == False,
-        PasswordResetToken.expires_at > datetime.utcnow()
-    ).first()
+    reset_token = await db.scalar(
+        select(PasswordResetToken)
+        .options(joinedload(PasswordResetToken.usuario))
+        .where(
+            PasswordResetToken.token == token,
+            PasswordResetToken.used == False,
+            PasswordResetToken.expires_at > datetime.utcnow()
+        )
+    )
     
     if not reset_token:
         return None
     
     return reset_token.usuario
 
-def use_reset_token(db: Session, token: str) -> bool:
+async def use_reset_token(db: AsyncSession, token: str) -> bool:
     """Marca o token como usado"""
-    reset_token = db.query(PasswordResetToken).filter(
+    reset_token = await db.scalar(select(PasswordResetToken).where(
         PasswordResetToken.token == token
-    ).first()
+    ))
     
     if reset_token:
         reset_token.used = True
-        db.commit()
+        await db.commit()
         return True
     
     return False
 
-def reset_user_password(db: Session, token: str, new_password: str) -> bool:
+async def reset_user_password(db: AsyncSession, token: str, new_password: str) -> bool:
     """Redefine a senha do usuário usando o token"""
-    usuario = verify_reset_token(db, token)
+    usuario = await verify_reset_token(db, token)
     if not usuario:
         return False
     
     # Atualizar senha
-    usuario.hashed_password = get_password_hash(new_password)
+    usuario.hashed_password = await get_password_hash_async(new_password)
     
     # Marcar token como usado
-    use_reset_token(db, token)
+    await use_reset_token(db, token)
     
-    db.commit()
+    await db.commit()
+    invalidar_principal(usuario.id, usuario.username)
     return True
 
-async def process_password_reset_request(db: Session, email: str) -> bool:
+async def process_password_reset_request(db: AsyncSession, email: str) -> bool:
     """Processa uma solicitação de recuperação de senha"""
     # Buscar usuário
-    usuario = db.query(Usuario).filter(Usuario.email == email).first()
+    usuario = await db.scalar(select(Usuario).where(Usuario.email == email))
     if not usuario:
         return False
     
     # Criar token
-    reset_code = create_password_reset_token(db, email)
+    reset_code = await create_password_reset_token(db, email)
     if not reset_code:
         return False
     
@@ -0,0 +1,177 @@
+"""
+Particionamento por período das tabelas de log (log_api e log_erro)
+
+Cada período (dia ou mês, no horário do Brasil) tem sua própria tabela,
+por exemplo log_api_20240131 ou log_erro_202401, criada a partir do modelo
+LogAPI/LogErro. A retenção remove partições inteiras com DROP TABLE, sem
+varrer linhas, e as consultas só abrem as partições do intervalo pedido.
+"""
+
+import re
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import MetaData, Table, inspect
+from sqlalchemy.engine import Engine
+from models import LogAPI, LogErro
+from config import settings
+from database import sincronizar_esquema
+from utils.timezone_utils import get_current_brasil_time, convert_utc_to_brasil
+
+PERIODO_DIA = "day"
+PERIODO_MES = "month"
+
+_FORMATOS = {
+    PERIODO_DIA: "%Y%m%d",
+    PERIODO_MES: "%Y%m",
+}
+
+# Tabelas-modelo das partições, indexadas pelo nome base
+_MODELOS = {
+    LogAPI.__tablename__: LogAPI.__table__,
+    LogErro.__tablename__: LogErro.__table__,
+}
+
+_metadata = MetaData()
+_tabelas: Dict[str, Table] = {}
+_lock = threading.Lock()
+
+
+def periodo_configurado() -> str:
+    """Retorna o período de particionamento configurado (day ou month)"""
+    periodo = settings.log_partition_period
+    if periodo not in _FORMATOS:
+        raise ValueError(f"Período de partição inválido: {periodo}")
+    return periodo
+
+
+def retencao_dias(base: str) -> int:
+    """Dias de retenção configurados para a tabela base"""
+    if base == LogErro.__tablename__:
+        return settings.log_erro_retention_days
+    return settings.log_api_retention_days
+
+
+def _para_data(momento) -> date:
+    """Converte datetime (com ou sem timezone) para a data local do Brasil"""
+    if momento is None:
+        return get_current_brasil_time().date()
+    if isinstance(momento, datetime):
+        if momento.tzinfo is not None:
+            momento = convert_utc_to_brasil(momento) or momento
+        return momento.date()
+    return momento
+
+
+def nome_particao(base: str, momento=None, periodo: Optional[str] = None) -> str:
+    """Nome da partição da tabela base que contém o momento informado"""
+    periodo = periodo or periodo_configurado()
+    return f"{base}_{_para_data(momento).strftime(_FORMATOS[periodo])}"
+
+
+def nomes_no_intervalo(base: str, inicio, fim=None, periodo: Optional[str] = None) -> List[str]:
+    """Nomes das partições (existentes ou não) que cobrem o intervalo [inicio, fim]"""
+    periodo = periodo or periodo_configurado()
+    dia = _para_data(inicio)
+    ultimo = _para_data(fim)
+    nomes = []
+    while dia <= ultimo:
+        nome = nome_particao(base, dia, periodo)
+        if nome not in nomes:
+            nomes.append(nome)
+        dia += timedelta(days=1)
+    return nomes
+
+
+def _padrao(base: str) -> re.Pattern:
+    return re.compile(rf"^{base}_(\d{{8}}|\d{{6}})$")
+
+
+def _inicio_particao(nome: str, base: str) -> Optional[date]:
+    """Primeiro dia coberto pela partição, a partir do sufixo do nome"""
+    match = _padrao(base).match(nome)
+    if not match:
+        return None
+    sufixo = match.group(1)
+    if len(sufixo) == 8:
+        return datetime.strptime(sufixo, "%Y%m%d").date()
+    return datetime.strptime(sufixo, "%Y%m").date()
+
+
+def _fim_particao(inicio: date, sufixo_len: int) -> date:
+    """Último dia coberto pela partição"""
+    if sufixo_len == 8:
+        return inicio
+    proximo_mes = (inicio.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return proximo_mes - timedelta(days=1)
+
+
+def listar_particoes(bind, base: str) -> List[str]:
+    """Partições existentes da tabela base, em ordem cronológica"""
+    padrao = _padrao(base)
+    return sorted(nome for nome in inspect(bind).get_table_names() if padrao.match(nome))
+
+
+def particoes_no_intervalo(bind, base: str, inicio, fim=None) -> List[str]:
+    """Partições existentes que podem conter registros do intervalo [inicio, fim]"""
+    existentes = set(listar_particoes(bind, base))
+    nomes = set()
+    for periodo in (PERIODO_DIA, PERIODO_MES):
+        nomes.update(n for n in nomes_no_intervalo(base, inicio, fim, periodo) if n in existentes)
+    return sorted(nomes)
+
+
+def tabela_particao(base: str, nome: str) -> Table:
+    """Objeto Table da partição, com as colunas e índices do modelo"""
+    with _lock:
+        tabela = _tabelas.get(nome)
+        if tabela is None:
+            modelo = _MODELOS[base]
+            tabela = Table(nome, _metadata, *[coluna._copy() for coluna in modelo.columns])
+            _tabelas[nome] = tabela
+        return tabela
+
+
+def remover_particoes_expiradas(bind, hoje: Optional[date] = None) -> List[str]:
+    """
+    Remove as partições cujo período terminou antes do limite de retenção.
+    Retorna os nomes removidos.
+    """
+    hoje = hoje or get_current_brasil_time().date()
+    removidas = []
+    for base in _MODELOS:
+        limite = hoje - timedelta(days=retencao_dias(base))
+        for nome in listar_particoes(bind, base):
+            inicio = _inicio_particao(nome, base)
+            sufixo_len = len(nome) - len(base) - 1
+            if _fim_particao(inicio, sufixo_len) >= limite:
+                continue
+            tabela = tabela_particao(base, nome)
+            tabela.drop(bind, checkfirst=True)
+            with _lock:
+                _tabelas.pop(nome, None)
+                _metadata.remove(tabela)
+            removidas.append(nome)
+    return removidas
+
+
+def preparar_particoes(engine: Engine):
+    """
+    Executado no startup: adiciona colunas novas do modelo às partições
+    existentes e aplica a política de retenção.
+    """
+    metadata = MetaData()
+    for base in _MODELOS:
+        modelo = _MODELOS[base]
+        for nome in listar_particoes(engine, base):
+            Table(nome, metadata, *[coluna._copy() for coluna in modelo.columns])
+    sincronizar_esquema(engine, metadata)
+
+    for nome in remover_particoes_expiradas(engine):
+        print(f"🗑️ Partição de log {nome} removida (retenção)")
+
+
+def union_all_sql(particoes: Iterable[str], colunas: str, where: str = "") -> str:
+    """SELECT ... UNION ALL sobre as partições, para uso em consultas SQL cruas"""
+    partes = [f"SELECT {colunas} FROM {nome} {where}".strip() for nome in particoes]
+    return " UNION ALL ".join(partes)
@@ -0,0 +1,140 @@
+"""
+Agregado por minuto dos logs da API (tabela log_api_minuto)
+
+Cada lote gravado pelo log_sink é resumido em memória por
+(minuto, rota, método, classe de status) e somado à tabela com um upsert,
+de modo que estatísticas de 30 dias leem alguns milhares de linhas em vez
+de varrer todas as partições de log_api.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, select, update, insert
+from sqlalchemy.orm import Session
+from models import LogAPIMinuto
+from config import settings
+from metrics import ROTA_DESCONHECIDA
+from utils.timezone_utils import get_current_brasil_time, convert_utc_to_brasil
+
+# Limites superiores (ms) dos buckets do histograma e a coluna correspondente
+BUCKETS_MS: Tuple[Tuple[Optional[int], str], ...] = (
+    (10, "bucket_10ms"),
+    (50, "bucket_50ms"),
+    (100, "bucket_100ms"),
+    (250, "bucket_250ms"),
+    (500, "bucket_500ms"),
+    (1000, "bucket_1000ms"),
+    (2500, "bucket_2500ms"),
+    (5000, "bucket_5000ms"),
+    (None, "bucket_inf"),
+)
+
+CHAVE = ("minuto", "rota", "metodo", "classe_status")
+SOMAS = ("total", "erros", "soma_tempo") + tuple(coluna for _, coluna in BUCKETS_MS)
+
+_tabela = LogAPIMinuto.__table__
+
+
+def _minuto(momento) -> datetime:
+    """Trunca no minuto, no horário do Brasil e sem timezone (como gravado)"""
+    if momento is None:
+        momento = get_current_brasil_time()
+    if momento.tzinfo is not None:
+        momento = convert_utc_to_brasil(momento) or momento
+    return momento.replace(second=0, microsecond=0, tzinfo=None)
+
+
+def _coluna_bucket(tempo_ms: int) -> str:
+    for limite, coluna in BUCKETS_MS:
+        if limite is None or tempo_ms <= limite:
+            return coluna
+    return BUCKETS_MS[-1][1]
+
+
+def acumular(registros: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Resume registros de log_api em linhas de log_api_minuto"""
+    agregados: Dict[Tuple, Dict[str, Any]] = {}
+    for registro in registros:
+        status_code = registro["status_code"]
+        chave = (
+            _minuto(registro.get("created_at")),
+            registro.get("rota") or ROTA_DESCONHECIDA,
+            registro["metodo"],
+            f"{status_code // 100}xx",
+        )
+        linha = agregados.get(chave)
+        if linha is None:
+            linha = dict(zip(CHAVE, chave))
+            linha.update({coluna: 0.0 for coluna in SOMAS})
+            linha["tempo_min"] = None
+            linha["tempo_max"] = None
+            agregados[chave] = linha
+
+        peso = registro.get("peso_amostra") or 1.0
+        tempo = registro["tempo_resposta"]
+        linha["total"] += peso
+        if status_code >= 400 or registro.get("app_status") == "error":
+            linha["erros"] += peso
+        linha["soma_tempo"] += tempo * peso
+        linha[_coluna_bucket(tempo)] += peso
+        linha["tempo_min"] = tempo if linha["tempo_min"] is None else min(linha["tempo_min"], tempo)
+        linha["tempo_max"] = tempo if linha["tempo_max"] is None else max(linha["tempo_max"], tempo)
+    return list(agregados.values())
+
+
+def gravar(db: Session, linhas: List[Dict[str, Any]]):
+    """Soma as linhas agregadas à tabela (upsert), na transação da sessão"""
+    if not linhas:
+        return
+
+    dialeto = db.get_bind().dialect.name
+    if dialeto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(_tabela)
+        novos = stmt.excluded
+        valores = {coluna: _tabela.c[coluna] + novos[coluna] for coluna in SOMAS}
+        valores["tempo_min"] = func.min(func.coalesce(_tabela.c.tempo_min, novos.tempo_min), novos.tempo_min)
+        valores["tempo_max"] = func.max(func.coalesce(_tabela.c.tempo_max, novos.tempo_max), novos.tempo_max)
+        db.execute(stmt.on_conflict_do_update(index_elements=list(CHAVE), set_=valores), linhas)
+    elif dialeto == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(_tabela)
+        novos = stmt.inserted
+        valores = {coluna: _tabela.c[coluna] + novos[coluna] for coluna in SOMAS}
+        valores["tempo_min"] = func.least(func.coalesce(_tabela.c.tempo_min, novos.tempo_min), novos.tempo_min)
+        valores["tempo_max"] = func.greatest(func.coalesce(_tabela.c.tempo_max, novos.tempo_max), novos.tempo_max)
+        db.execute(stmt.on_duplicate_key_update(**valores), linhas)
+    else:
+        # Outros bancos: UPDATE e, se não havia linha, INSERT
+        for linha in linhas:
+            filtro = [_tabela.c[coluna] == linha[coluna] for coluna in CHAVE]
+            existente = db.execute(select(_tabela.c.tempo_min, _tabela.c.tempo_max).where(*filtro)).first()
+            if existente is None:
+                db.execute(insert(_tabela), [linha])
+                continue
+            valores = {coluna: _tabela.c[coluna] + linha[coluna] for coluna in SOMAS}
+            valores["tempo_min"] = min(v for v in (existente.tempo_min, linha["tempo_min"]) if v is not None)
+            valores["tempo_max"] = max(v for v in (existente.tempo_max, linha["tempo_max"]) if v is not None)
+            db.execute(update(_tabela).where(*filtro).values(**valores))
+
+
+def remover_antigos(bind, hoje=None) -> int:
+    """Remove minutos mais antigos que a retenção configurada; retorna as linhas removidas"""
+    hoje = hoje or get_current_brasil_time().date()
+    limite = datetime.combine(hoje - timedelta(days=settings.log_rollup_retention_days), datetime.min.time())
+    with bind.begin() as conn:
+        resultado = conn.execute(delete(_tabela).where(_tabela.c.minuto < limite))
+    return resultado.rowcount or 0
+
+
+def percentil_buckets(buckets: Dict[str, float], p: float) -> Optional[int]:
+    """Limite superior (ms) do bucket que contém o percentil p; None se acima de 5 s ou sem dados"""
+    total = sum(buckets.values())
+    if not total:
+        return None
+    acumulado = 0.0
+    for limite, coluna in BUCKETS_MS:
+        acumulado += buckets.get(coluna) or 0
+        if acumulado >= p * total:
+            return limite
+    return None
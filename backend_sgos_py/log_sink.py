@@ -0,0 +1,286 @@
+"""
+Gravação assíncrona e em lote dos logs da API (LogAPI), de erro (LogErro) e
+das consultas lentas (LogQueryLenta)
+
+O middleware apenas enfileira os registros; uma única task asyncio os grava
+com um INSERT em lote a cada N registros ou M milissegundos, na partição
+do período de cada registro (ver log_partitions). As consultas lentas vão
+para uma tabela única, sem partição.
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import insert
+from database import LogSessionLocal, log_engine
+from models import LogAPI, LogErro, LogQueryLenta
+from config import settings
+import log_partitions
+import log_rollup
+import query_lenta
+
+# Tipos de registro aceitos pela fila
+TIPO_API = "api"
+TIPO_ERRO = "erro"
+TIPO_QUERY_LENTA = "query_lenta"
+
+_TABELAS_BASE = {
+    TIPO_API: LogAPI.__tablename__,
+    TIPO_ERRO: LogErro.__tablename__,
+}
+
+# Tipos gravados em uma tabela única, sem partição por período
+_TABELAS_SIMPLES = {
+    TIPO_QUERY_LENTA: LogQueryLenta.__table__,
+}
+
+# Políticas de estouro da fila
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_BLOCK = "block"
+
+# Marcador usado para encerrar a task de gravação
+_FIM = object()
+
+
+class LogSink:
+    """Fila limitada em memória com gravação periódica em lote no banco"""
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        batch_size: int = 200,
+        flush_interval_ms: int = 500,
+        overflow: str = OVERFLOW_DROP_OLDEST
+    ):
+        if overflow not in (OVERFLOW_DROP_OLDEST, OVERFLOW_BLOCK):
+            raise ValueError(f"Política de estouro inválida: {overflow}")
+
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.overflow = overflow
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._particoes: set = set()
+        # Registros de listeners (enqueue_nowait) recebidos antes de start(): entram na fila no startup
+        self._aguardando_inicio: deque = deque()
+
+        # Contadores
+        self.enfileirados = 0
+        self.gravados = 0
+        self.descartados = 0
+        self.falhas = 0
+        self.lotes = 0
+
+    @classmethod
+    def from_settings(cls) -> "LogSink":
+        """Cria o sink a partir das configurações da aplicação"""
+        return cls(
+            max_size=settings.log_queue_max_size,
+            batch_size=settings.log_batch_size,
+            flush_interval_ms=settings.log_flush_interval_ms,
+            overflow=settings.log_queue_overflow
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Inicia a task de gravação (chamado no startup da aplicação)"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+        while self._aguardando_inicio:
+            self._put_descartando(self._aguardando_inicio.popleft())
+
+    async def stop(self):
+        """Grava os registros pendentes e encerra a task (chamado no shutdown)"""
+        if not self.running:
+            return
+        # O marcador sempre entra na fila, mesmo com a política drop_oldest
+        await self._queue.put(_FIM)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def enqueue(self, tipo: str, registro: Dict[str, Any]):
+        """Enfileira um registro de log do tipo 'api' ou 'erro'"""
+        item = (tipo, registro)
+
+        if not self.running:
+            # Sem a task ativa (scripts, testes), grava diretamente fora do event loop
+            await asyncio.to_thread(self._write_batch, [item])
+            return
+
+        if self.overflow == OVERFLOW_BLOCK:
+            await self._queue.put(item)
+            self.enfileirados += 1
+        else:
+            self._put_descartando(item)
+
+    def enqueue_nowait(self, tipo: str, registro: Dict[str, Any]):
+        """
+        Versão síncrona de enqueue, para listeners do SQLAlchemy. Nunca espera:
+        com a fila cheia descarta o mais antigo, qualquer que seja a política.
+        Chamado de outra thread, repassa ao event loop do sink. Sem a task
+        ativa (antes do startup, depois do shutdown) guarda o registro em
+        memória até o próximo start(), também com no máximo max_size itens.
+        """
+        item = (tipo, registro)
+
+        if not self.running:
+            # Nunca grava aqui: o listener roda dentro da consulta, no caminho da requisição
+            self._aguardando_inicio.append(item)
+            while len(self._aguardando_inicio) > self.max_size:
+                self._aguardando_inicio.popleft()
+                self.descartados += 1
+            return
+
+        try:
+            mesmo_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            mesmo_loop = False
+        if mesmo_loop:
+            self._put_descartando(item)
+        else:
+            self._loop.call_soon_threadsafe(self._put_descartando, item)
+
+    def _put_descartando(self, item: Tuple[str, Dict[str, Any]]):
+        """Coloca o item na fila; se estiver cheia, descarta o registro mais antigo"""
+        if self._queue is None:
+            return
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                break
+            except asyncio.QueueFull:
+                try:
+                    descartado = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    continue
+                if descartado is _FIM:
+                    # Nunca descartar o marcador de encerramento: o descartado é o registro novo
+                    self._queue.put_nowait(descartado)
+                    self.descartados += 1
+                    return
+                self.descartados += 1
+
+        self.enfileirados += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna os contadores do sink"""
+        return {
+            "ativo": self.running,
+            "pendentes": self._queue.qsize() if self._queue else 0,
+            "aguardando_inicio": len(self._aguardando_inicio),
+            "capacidade": self.max_size,
+            "politica_estouro": self.overflow,
+            "enfileirados": self.enfileirados,
+            "gravados": self.gravados,
+            "descartados": self.descartados,
+            "falhas": self.falhas,
+            "lotes": self.lotes
+        }
+
+    async def _run(self):
+        """Loop de gravação: junta até batch_size registros ou espera flush_interval"""
+        loop = asyncio.get_running_loop()
+        encerrar = False
+
+        while not encerrar:
+            item = await self._queue.get()
+            if item is _FIM:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    proximo = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if proximo is _FIM:
+                    encerrar = True
+                    break
+                batch.append(proximo)
+
+            await self._flush(batch)
+
+        # Gravar o que ainda estiver na fila no encerramento
+        restante = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _FIM:
+                restante.append(item)
+        for inicio in range(0, len(restante), self.batch_size):
+            await self._flush(restante[inicio:inicio + self.batch_size])
+
+    async def _flush(self, batch: List[Tuple[str, Dict[str, Any]]]):
+        """Grava um lote fora do event loop"""
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+        except Exception as e:
+            # Se houver erro ao salvar os logs, apenas imprimir (não quebrar a aplicação)
+            self.falhas += len(batch)
+            print(f"Erro ao gravar lote de logs: {e}")
+
+    def _write_batch(self, batch: List[Tuple[str, Dict[str, Any]]]):
+        """Grava o lote em uma única transação: um INSERT em lote por partição (ou tabela) e o upsert do agregado por minuto"""
+        por_particao: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        simples: Dict[str, List[Dict[str, Any]]] = {}
+        for tipo, registro in batch:
+            if tipo in _TABELAS_SIMPLES:
+                simples.setdefault(tipo, []).append(registro)
+                continue
+            base = _TABELAS_BASE[tipo]
+            nome = log_partitions.nome_particao(base, registro.get("created_at"))
+            por_particao.setdefault((base, nome), []).append(registro)
+
+        self._garantir_particoes(por_particao.keys())
+        agregados = log_rollup.acumular(registro for tipo, registro in batch if tipo == TIPO_API)
+
+        db = LogSessionLocal()
+        try:
+            for (base, nome), registros in por_particao.items():
+                db.execute(insert(log_partitions.tabela_particao(base, nome)), registros)
+            for tipo, registros in simples.items():
+                db.execute(insert(_TABELAS_SIMPLES[tipo]), registros)
+            log_rollup.gravar(db, agregados)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self.gravados += len(batch)
+        self.lotes += 1
+
+    def _garantir_particoes(self, chaves):
+        """Cria partições ainda não vistas; a cada partição nova aplica a retenção"""
+        novas = [chave for chave in chaves if chave[1] not in self._particoes]
+        if not novas:
+            return
+        with log_engine.begin() as conn:
+            for base, nome in novas:
+                log_partitions.tabela_particao(base, nome).create(conn, checkfirst=True)
+        self._particoes.update(nome for _, nome in novas)
+
+        removidas = log_partitions.remover_particoes_expiradas(log_engine)
+        self._particoes.difference_update(removidas)
+        log_rollup.remover_antigos(log_engine)
+        query_lenta.remover_antigas(log_engine)
+
+
+# Instância única usada pelo middleware e pelo lifespan da aplicação
+log_sink = LogSink.from_settings()
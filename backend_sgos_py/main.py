@@ -1,21 +1,56 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from fastapi.exceptions import RequestValidationError
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import uvicorn
-from database import engine
-from models import Base
-from routers import auth, usuarios, veiculos, ordens_servico, servicos_realizados, pecas_utilizadas, encerrar_os, retirada_viatura
+from database import engine, async_engine, log_engine, sincronizar_esquema, pragmas_efetivos
+from models import Base, LogAPIMinuto, LogQueryLenta
+from log_partitions import preparar_particoes
+import migrar_datas
+import migrar_numeros
+import migrar_logs
+import query_lenta
+from busca_os import preparar_busca
+from versoes import preparar_versoes
+from routers import auth, usuarios, veiculos, ordens_servico, servicos_realizados, pecas_utilizadas, encerrar_os, retirada_viatura, dashboard, catalogos
 from config import settings
-from middleware import log_api_middleware
+from middleware import LogAPIMiddleware, http_exception_log_handler, validation_exception_log_handler
+from log_sink import log_sink
+from cache_agregados import cache_agregados
+from metrics import metricas_api
+from auth import password_pool
+from monitor_sql import instrumentar_engine, configurar_modo_estrito
 
 # Criar tabelas no banco de dados
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    # Antes das migrações, que também podem gerar consultas lentas
+    LogQueryLenta.__table__.create(bind=log_engine, checkfirst=True)
+    query_lenta.remover_antigas(log_engine)
+    if engine.dialect.name == "sqlite":
+        pragmas = ", ".join(f"{nome}={valor}" for nome, valor in pragmas_efetivos(engine).items())
+        print(f"🗄️ SQLite ({type(engine.pool).__name__}): {pragmas}")
     Base.metadata.create_all(bind=engine)
+    sincronizar_esquema(engine, Base.metadata)
+    migrar_datas.imprimir_relatorio(migrar_datas.migrar_colunas_data(engine), detalhar=False)
+    migrar_numeros.imprimir_relatorio(migrar_numeros.migrar_colunas_numericas(engine), detalhar=False)
+    preparar_busca(engine)
+    preparar_versoes(engine, Base.metadata)
+    preparar_particoes(log_engine)
+    LogAPIMinuto.__table__.create(bind=log_engine, checkfirst=True)
+    migrar_logs.imprimir_relatorio(migrar_logs.migrar_logs_legados(engine, log_engine))
     print("✅ Banco de dados inicializado!")
+    await log_sink.start()
     yield
     # Shutdown
+    await log_sink.stop()
+    password_pool.shutdown()
+    if async_engine is not None:
+        await async_engine.dispose()
+    print(f"📝 Logs gravados: {log_sink.gravados} | descartados: {log_sink.descartados}")
     print("🔄 Aplicação finalizada!")
 
 # Criar aplicação FastAPI
@@ -26,8 +61,16 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Contagem das consultas SQL por requisição (banco principal)
+instrumentar_engine(engine)
+if async_engine is not None:
+    instrumentar_engine(async_engine.sync_engine)
+configurar_modo_estrito()
+
 # Adicionar middleware de logging da API
-app.middleware("http")(log_api_middleware)
+app.add_middleware(LogAPIMiddleware)
+app.add_exception_handler(StarletteHTTPException, http_exception_log_handler)
+app.add_exception_handler(RequestValidationError, validation_exception_log_handler)
 
 # Configurar CORS
 app.add_middleware(
@@ -47,6 +90,8 @@ app.include_router(servicos_realizados.router, prefix="/api/v1")
 app.include_router(pecas_utilizadas.router, prefix="/api/v1")
 app.include_router(encerrar_os.router, prefix="/api/v1")
 app.include_router(retirada_viatura.router, prefix="/api/v1")
+app.include_router(dashboard.router, prefix="/api/v1")
+app.include_router(catalogos.router, prefix="/api/v1")
 
 @app.get("/")
 async def root():
@@ -68,9 +113,32 @@ async def health_check():
     return {
         "status": "success",
         "message": "API funcionando normalmente",
-        "timestamp": "2024-01-01T00:00:00"
+        "timestamp": "2024-01-01T00:00:00",
+        "data": {
+            "log_sink": log_sink.stats(),
+            "cache_agregados": cache_agregados.stats(),
+            "password_pool": password_pool.stats()
+        }
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métricas de latência, status e requisições em andamento no formato do Prometheus"""
+    return PlainTextResponse(
+        metricas_api.prometheus() + password_pool.prometheus(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@app.get("/metrics/resumo")
+async def metrics_resumo():
+    """Resumo das métricas por rota com percentis p50/p90/p99 (ms)"""
+    from utils.response_utils import create_success_response
+    
+    return create_success_response(
+        data=metricas_api.resumo(),
+        message="Métricas recuperadas com sucesso"
+    )
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
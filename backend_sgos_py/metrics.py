@@ -0,0 +1,169 @@
+"""
+Métricas em memória da API: histogramas de latência por rota, contadores
+de status e requisições em andamento
+
+Alimentadas pelo LogAPIMiddleware sem nenhum acesso ao banco e expostas em
+/metrics (formato texto do Prometheus) e /metrics/resumo (JSON com p50/p90/p99).
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Limites superiores dos buckets em segundos: escala logarítmica de 0,5 ms a ~46 s,
+# dobrando a cada dois buckets (erro relativo dos percentis abaixo de ~41%)
+BUCKETS: Tuple[float, ...] = tuple(0.0005 * 2 ** (i / 2) for i in range(34))
+
+# Template usado quando a requisição não casou com nenhuma rota (evita explodir a cardinalidade)
+ROTA_DESCONHECIDA = "<sem_rota>"
+
+PERCENTIS = (0.5, 0.9, 0.99)
+
+
+class Histograma:
+    """Histograma de latência com buckets fixos"""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.contagens = [0] * (len(buckets) + 1)  # último = acima do maior bucket
+        self.total = 0
+        self.soma = 0.0
+        self.maximo = 0.0
+
+    def observar(self, segundos: float):
+        indice = _bucket_index(self.buckets, segundos)
+        self.contagens[indice] += 1
+        self.total += 1
+        self.soma += segundos
+        if segundos > self.maximo:
+            self.maximo = segundos
+
+    def percentil(self, p: float) -> Optional[float]:
+        """Estimativa do percentil p (0 a 1) por interpolação linear dentro do bucket"""
+        if self.total == 0:
+            return None
+        alvo = p * self.total
+        acumulado = 0
+        for indice, contagem in enumerate(self.contagens):
+            if contagem and acumulado + contagem >= alvo:
+                inferior = self.buckets[indice - 1] if indice > 0 else 0.0
+                superior = self.buckets[indice] if indice < len(self.buckets) else self.maximo
+                fracao = (alvo - acumulado) / contagem
+                return min(inferior + (superior - inferior) * fracao, self.maximo)
+            acumulado += contagem
+        return self.maximo
+
+    def cumulativos(self) -> List[int]:
+        """Contagens acumuladas por bucket (formato 'le' do Prometheus), incluindo +Inf"""
+        resultado = []
+        acumulado = 0
+        for contagem in self.contagens:
+            acumulado += contagem
+            resultado.append(acumulado)
+        return resultado
+
+
+def _bucket_index(buckets: Tuple[float, ...], valor: float) -> int:
+    """Busca binária do primeiro bucket com limite >= valor"""
+    inicio, fim = 0, len(buckets)
+    while inicio < fim:
+        meio = (inicio + fim) // 2
+        if buckets[meio] < valor:
+            inicio = meio + 1
+        else:
+            fim = meio
+    return inicio
+
+
+class MetricasAPI:
+    """Registro das métricas da API (usado apenas no event loop, sem locks)"""
+
+    def __init__(self):
+        self.iniciado_em = time.time()
+        self.latencias: Dict[Tuple[str, str], Histograma] = {}
+        self.status: Dict[Tuple[str, str, int], int] = {}
+        self.em_andamento: Dict[str, int] = {}
+
+    def inicio_requisicao(self, metodo: str):
+        self.em_andamento[metodo] = self.em_andamento.get(metodo, 0) + 1
+
+    def fim_requisicao(self, metodo: str, rota: Optional[str], status_code: int, segundos: float):
+        self.em_andamento[metodo] = self.em_andamento.get(metodo, 1) - 1
+        rota = rota or ROTA_DESCONHECIDA
+
+        histograma = self.latencias.get((metodo, rota))
+        if histograma is None:
+            histograma = self.latencias[(metodo, rota)] = Histograma()
+        histograma.observar(segundos)
+
+        chave = (metodo, rota, status_code)
+        self.status[chave] = self.status.get(chave, 0) + 1
+
+    def resumo(self) -> Dict:
+        """Resumo em JSON: contagem e percentis (em ms) por método e rota"""
+        rotas = []
+        for (metodo, rota), histograma in sorted(self.latencias.items(), key=lambda item: (item[0][1], item[0][0])):
+            percentis = {
+                f"p{int(p * 100)}": _em_ms(histograma.percentil(p)) for p in PERCENTIS
+            }
+            rotas.append({
+                "metodo": metodo,
+                "rota": rota,
+                "requisicoes": histograma.total,
+                "media_ms": _em_ms(histograma.soma / histograma.total),
+                "max_ms": _em_ms(histograma.maximo),
+                **percentis,
+                "status": {
+                    str(status): total
+                    for (m, r, status), total in sorted(self.status.items())
+                    if m == metodo and r == rota
+                }
+            })
+        return {
+            "uptime_s": int(time.time() - self.iniciado_em),
+            "em_andamento": sum(self.em_andamento.values()),
+            "rotas": rotas
+        }
+
+    def prometheus(self) -> str:
+        """Exporta as métricas no formato texto do Prometheus (0.0.4)"""
+        linhas = [
+            "# HELP sgos_http_request_duration_seconds Latência das requisições HTTP por rota",
+            "# TYPE sgos_http_request_duration_seconds histogram",
+        ]
+        for (metodo, rota), histograma in sorted(self.latencias.items()):
+            rotulos = f'method="{metodo}",route="{_escapar(rota)}"'
+            cumulativos = histograma.cumulativos()
+            for limite, acumulado in zip(histograma.buckets, cumulativos):
+                linhas.append(f'sgos_http_request_duration_seconds_bucket{{{rotulos},le="{limite:.6g}"}} {acumulado}')
+            linhas.append(f'sgos_http_request_duration_seconds_bucket{{{rotulos},le="+Inf"}} {cumulativos[-1]}')
+            linhas.append(f"sgos_http_request_duration_seconds_sum{{{rotulos}}} {histograma.soma:.6f}")
+            linhas.append(f"sgos_http_request_duration_seconds_count{{{rotulos}}} {histograma.total}")
+
+        linhas.append("# HELP sgos_http_requests_total Requisições HTTP por rota e status")
+        linhas.append("# TYPE sgos_http_requests_total counter")
+        for (metodo, rota, status), total in sorted(self.status.items()):
+            linhas.append(
+                f'sgos_http_requests_total{{method="{metodo}",route="{_escapar(rota)}",status="{status}"}} {total}'
+            )
+
+        linhas.append("# HELP sgos_http_requests_in_flight Requisições HTTP em andamento")
+        linhas.append("# TYPE sgos_http_requests_in_flight gauge")
+        for metodo, total in sorted(self.em_andamento.items()):
+            linhas.append(f'sgos_http_requests_in_flight{{method="{metodo}"}} {total}')
+
+        return "\n".join(linhas) + "\n"
+
+
+def _em_ms(segundos: Optional[float]) -> Optional[float]:
+    if segundos is None:
+        return None
+    return round(segundos * 1000, 2)
+
+
+def _escapar(valor: str) -> str:
+    """Escapa valores de rótulo do Prometheus"""
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Instância única usada pelo middleware e pelos endpoints de métricas
+metricas_api = MetricasAPI()
@@ -1,216 +1,347 @@
 """
 Middleware para logging automático de todas as requisições da API e erros
-Versão que NÃO interfere com o body da requisição
+Middleware ASGI puro: repassa o body da resposta sem bufferizar
 """
 
+import re
+import random
 import time
+from functools import lru_cache
 import traceback
 import json
-from typing import Callable
-from fastapi import Request, Response
-from sqlalchemy.orm import Session
-from database import SessionLocal
-from models import LogAPI, LogErro
-
-async def log_api_middleware(request: Request, call_next: Callable) -> Response:
-    
+from typing import Any, Dict, Optional
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.exception_handlers import http_exception_handler, request_validation_exception_handler
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from log_sink import log_sink, TIPO_API, TIPO_ERRO
+from config import settings
+from metrics import metricas_api
+from utils.timezone_utils import get_current_brasil_time
+from utils.rotas import valor_por_rota
+from monitor_sql import ConsultasRequisicao, iniciar_contagem, encerrar_contagem, contagem_atual
+from utils.log_context import (
+    iniciar_contexto_log, encerrar_contexto_log, registrar_metadados_log, obter_metadados_log
+)
+
+# Quantidade máxima de bytes da resposta mantida para extrair status/mensagem
+RESPONSE_PREFIX_LIMIT = 4096
+
+# Campos de primeiro nível procurados no prefixo quando o JSON foi truncado
+_CAMPO_JSON = re.compile(r'"(status|message|detail|error)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+# Mapear códigos de status comuns para mensagens mais descritivas
+STATUS_MESSAGES = {
+    400: "Bad Request - Requisição inválida",
+    401: "Unauthorized - Não autenticado",
+    403: "Forbidden - Acesso negado",
+    404: "Not Found - Recurso não encontrado",
+    405: "Method Not Allowed - Método não permitido",
+    422: "Unprocessable Entity - Dados inválidos",
+    500: "Internal Server Error - Erro interno do servidor"
+}
+
+
+class LogAPIMiddleware:
     """
     Middleware para capturar e logar todas as requisições da API e erros
-    SEM interferir com o body da requisição
+    SEM interferir com o body da requisição nem da resposta.
+    As mensagens http.response.body são repassadas como chegam; apenas os
+    primeiros RESPONSE_PREFIX_LIMIT bytes são guardados para o log.
+    Status e mensagem vêm preferencialmente dos metadados gravados em
+    request.state pelos helpers de resposta (utils.log_context); o prefixo
+    só é decodificado para respostas que não passaram por eles.
     """
-    start_time = time.time()
-    
-    # Capturar informações da requisição (sem tocar no body)
-    endpoint = str(request.url.path)
-    metodo = request.method
-    ip_address = request.client.host if request.client else "unknown"
-    user_agent = request.headers.get("user-agent", "")
-    # Capturar dados da requisição (sem tocar no body)
-    request_data = None
-    try:
-        # Capturar headers importantes (como no curl)
-        important_headers = {}
-        for header_name in ['accept', 'content-type', 'authorization', 'user-agent']:
-            header_value = request.headers.get(header_name)
-            if header_value:
-                important_headers[header_name] = header_value
-        
-        # Capturar informações básicas da requisição sem consumir o body
-        request_info = {
-            # "url": str(request.url),
-            # "method": request.method,
-            "headers": important_headers,  # Apenas headers importantes
-            "query_params": dict(request.query_params),
-            "path_params": dict(request.path_params)
-        }
-        
-        request_data = str(request_info)[:1000]  # Limitar a 1000 caracteres
-    except Exception as e:
-        request_data = f"Erro ao capturar dados da requisição: {str(e)}"
-    
-    # Executar a requisição
-    try:
-        response = await call_next(request)
-        
-        # Capturar o body da resposta usando body_iterator
-        body = b""
-        async for chunk in response.body_iterator:
-            body += chunk
-        
-        response_body_text = body.decode() if body else f"Status: {response.status_code}"
-        
-        # Recriar o body_iterator para que a resposta possa ser enviada
-        async def recreate_body_iterator():
-            yield body
-        
-        response.body_iterator = recreate_body_iterator()
-        
-        # Calcular tempo de resposta
-        process_time = int((time.time() - start_time) * 1000)  # Em milissegundos
-        
-        # Capturar dados da resposta
-        response_data = None
-        app_status = None  # Status da aplicação (success/error)
-        
+
+    def __init__(self, app: ASGIApp, prefix_limit: int = RESPONSE_PREFIX_LIMIT):
+        self.app = app
+        self.prefix_limit = prefix_limit
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        state = scope.setdefault("state", {})
+        request = Request(scope)
+
+        # Capturar informações da requisição (sem tocar no body)
+        endpoint = request.url.path
+        metodo = request.method
+        ip_address = request.client.host if request.client else "unknown"
+        user_agent = request.headers.get("user-agent", "")
+        metricas_api.inicio_requisicao(metodo)
+
+        # Estado da resposta preenchido à medida que as mensagens passam
+        status_code = 500
+        content_type = ""
+        primeiro_byte: Optional[float] = None
+        total_bytes = 0
+        prefixo = bytearray()
+        # Modo estrito: body do 500 que substitui a resposta de quem passou do orçamento de consultas
+        body_orcamento: Optional[bytes] = None
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, content_type, primeiro_byte, total_bytes, body_orcamento
+            if message["type"] == "http.response.start" and consultas.orcamento_excedido:
+                body_orcamento = _resposta_orcamento_excedido(consultas.orcamento_excedido)
+                message = {"type": "http.response.start", "status": 500, "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body_orcamento)).encode()),
+                ]}
+            elif message["type"] == "http.response.body" and body_orcamento is not None:
+                # Descarta o body original e envia o do 500 no lugar da última parte
+                if message.get("more_body", False):
+                    return
+                message = {"type": "http.response.body", "body": body_orcamento}
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                primeiro_byte = time.perf_counter()
+                for nome, valor in message.get("headers", []):
+                    if nome.lower() == b"content-type":
+                        content_type = valor.decode("latin-1")
+                        break
+                if settings.sql_metrics_headers:
+                    message = {**message, "headers": [
+                        *message.get("headers", []),
+                        (b"x-db-queries", str(consultas.total).encode()),
+                        (b"x-db-time-ms", f"{consultas.tempo_ms:.1f}".encode()),
+                    ]}
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                total_bytes += len(chunk)
+                falta = self.prefix_limit - len(prefixo)
+                if falta > 0 and chunk:
+                    prefixo.extend(chunk[:falta])
+            await send(message)
+
+        token = iniciar_contexto_log(state)
+        token_sql = iniciar_contagem(metodo, scope)
+        consultas = contagem_atual()
         try:
-            # Extrair apenas a mensagem do response_data
-            if response_body_text and response_body_text != f"Status: {response.status_code}":
-                response_json = json.loads(response_body_text)
-                if isinstance(response_json, dict):
-                    # Capturar o status da aplicação
-                    if 'status' in response_json:
-                        app_status = response_json['status']
-                    
-                    # Procurar por campos de mensagem
-                    if 'message' in response_json:
-                        response_data = response_json['message']
-                    elif 'detail' in response_json:
-                        response_data = response_json['detail']
-                    elif 'error' in response_json:
-                        response_data = response_json['error']
-                    elif 'status' in response_json:
-                        response_data = f"Status: {response_json['status']}"
-                    else:
-                        response_data = response_body_text[:500]
-                else:
-                    response_data = response_body_text[:500]
-            else:
-                response_data = f"Status: {response.status_code} - Sem body disponível"
-        except json.JSONDecodeError:
-            response_data = response_body_text[:500] if response_body_text else f"Status: {response.status_code}"
+            await self.app(scope, receive, send_wrapper)
         except Exception as e:
-            response_data = f"Erro ao processar resposta: {str(e)}"
-        
+            # Em caso de erro, calcular tempo e salvar logs
+            process_time = int((time.perf_counter() - start_time) * 1000)
+
+            # Capturar stack trace completo
+            stack_trace = traceback.format_exc()
+
+            # Salvar log da API com erro
+            await save_api_log(
+                endpoint=endpoint,
+                rota=getattr(scope.get("route"), "path", None),
+                metodo=metodo,
+                status_code=500,  # Erro interno
+                tempo_resposta=process_time,
+                ip_address=ip_address,
+                user_agent=user_agent,
+                request_data=_capturar_request_data(request),
+                response_data=f"Erro: {str(e)}",
+                bytes_resposta=total_bytes,
+                tempo_primeiro_byte=_em_ms(start_time, primeiro_byte),
+                consultas=consultas,
+                request=request
+            )
+
+            # Salvar log de erro detalhado
+            await save_error_log(
+                endpoint=endpoint,
+                metodo=metodo,
+                erro=str(e),
+                stack_trace=stack_trace,
+                ip_address=ip_address,
+                request=request
+            )
+
+            # Re-levantar a exceção
+            raise
+        finally:
+            encerrar_contexto_log(token)
+            encerrar_contagem(token_sql)
+            # Métricas em memória: registradas para toda requisição, sem amostragem
+            rota = getattr(scope.get("route"), "path", None)
+            metricas_api.fim_requisicao(
+                metodo,
+                rota,
+                status_code,
+                time.perf_counter() - start_time
+            )
+
+        # Calcular tempo de resposta (até o último chunk enviado)
+        process_time = int((time.perf_counter() - start_time) * 1000)
+
+        texto = bytes(prefixo).decode("utf-8", errors="replace")
+        metadados = obter_metadados_log(state)
+        if metadados is not None:
+            campos = {"message": metadados["message"]}
+            if metadados["status"] is not None:
+                campos["status"] = metadados["status"]
+            erro_app = metadados["error"]
+        else:
+            # Resposta montada fora dos helpers: extrair do prefixo
+            truncado = total_bytes > len(prefixo)
+            campos = _extrair_campos(texto, truncado, content_type)
+            erro_app = campos.get("status") == "error"
+        app_status = campos.get("status")
+        erro = status_code >= 400 or erro_app
+
+        # Amostragem por rota: erros são sempre registrados com peso 1
+        peso_amostra = 1.0
+        if not erro:
+            taxa = taxa_amostragem(metodo, rota or endpoint)
+            if taxa <= 0 or (taxa < 1 and random.random() >= taxa):
+                return
+            peso_amostra = 1 / taxa
+
+        # Capturar dados da resposta
+        if not texto:
+            response_data = f"Status: {status_code} - Sem body disponível"
+        elif "message" in campos:
+            response_data = campos["message"]
+        elif "detail" in campos:
+            response_data = campos["detail"]
+        elif "error" in campos:
+            response_data = campos["error"]
+        elif "status" in campos:
+            response_data = f"Status: {campos['status']}"
+        else:
+            response_data = texto[:500]
+
         # Salvar log da API no banco de dados
         await save_api_log(
             endpoint=endpoint,
+            rota=rota,
             metodo=metodo,
-            status_code=response.status_code,
+            status_code=status_code,
             tempo_resposta=process_time,
             ip_address=ip_address,
             user_agent=user_agent,
-            request_data=request_data,
+            request_data=_capturar_request_data(request),
             response_data=response_data,
             app_status=app_status,  # Status da aplicação (success/error)
+            peso_amostra=peso_amostra,
+            bytes_resposta=total_bytes,
+            tempo_primeiro_byte=_em_ms(start_time, primeiro_byte),
+            consultas=consultas,
             request=request
         )
-        
+
         # Se o status code indica erro (4xx ou 5xx) OU se a resposta contém erro no JSON, também salvar no log de erro
-        should_log_error = response.status_code >= 400
-        
-        # Verificar se a resposta contém erro mesmo com status 200
-        if not should_log_error and response_body_text:
-            try:
-                response_json = json.loads(response_body_text)
-                if isinstance(response_json, dict) and response_json.get('status') == 'error':
-                    should_log_error = True
-            except:
-                pass
-        
-        if should_log_error:
-            # Tentar extrair mensagem de erro da resposta
-            error_message = f"HTTP {response.status_code}"
-            
-            # Mapear códigos de status comuns para mensagens mais descritivas
-            status_messages = {
-                400: "Bad Request - Requisição inválida",
-                401: "Unauthorized - Não autenticado",
-                403: "Forbidden - Acesso negado",
-                404: "Not Found - Recurso não encontrado",
-                405: "Method Not Allowed - Método não permitido",
-                422: "Unprocessable Entity - Dados inválidos",
-                500: "Internal Server Error - Erro interno do servidor"
-            }
-            
-            try:
-                if response_body_text:
-                    # Tentar parsear como JSON para extrair mensagem de erro
-                    try:
-                        response_json = json.loads(response_body_text)
-                        if isinstance(response_json, dict):
-                            # Procurar por campos comuns de erro
-                            if 'detail' in response_json:
-                                error_message = f"HTTP {response.status_code}: {response_json['detail']}"
-                            elif 'message' in response_json:
-                                error_message = f"HTTP {response.status_code}: {response_json['message']}"
-                            elif 'error' in response_json:
-                                error_message = f"HTTP {response.status_code}: {response_json['error']}"
-                            else:
-                                # Se não encontrar campos específicos, usar a resposta completa
-                                error_message = f"HTTP {response.status_code}: {response_body_text[:200]}"
-                    except json.JSONDecodeError:
-                        # Se não for JSON, usar o texto da resposta
-                        error_message = f"HTTP {response.status_code}: {response_body_text[:200]}"
-                else:
-                    # Se não há body, usar mensagem padrão baseada no status code
-                    error_message = status_messages.get(response.status_code, f"HTTP {response.status_code}")
-            except Exception:
-                # Se houver erro ao processar, usar mensagem padrão baseada no status code
-                error_message = status_messages.get(response.status_code, f"HTTP {response.status_code}")
-            
+        if erro:
+            if not texto:
+                # Se não há body, usar mensagem padrão baseada no status code
+                error_message = STATUS_MESSAGES.get(status_code, f"HTTP {status_code}")
+            elif "detail" in campos:
+                error_message = f"HTTP {status_code}: {campos['detail']}"
+            elif "message" in campos:
+                error_message = f"HTTP {status_code}: {campos['message']}"
+            elif "error" in campos:
+                error_message = f"HTTP {status_code}: {campos['error']}"
+            else:
+                error_message = f"HTTP {status_code}: {texto[:200]}"
+
             await save_error_log(
                 endpoint=endpoint,
                 metodo=metodo,
                 erro=error_message,
-                stack_trace=f"Resposta: {response_body_text or 'N/A'}",
+                stack_trace=f"Resposta: {texto or 'N/A'}",
                 ip_address=ip_address,
                 request=request
             )
-        
-        return response
-        
+
+
+async def http_exception_log_handler(request: Request, exc: StarletteHTTPException):
+    """Registra o detail da HTTPException para o log e delega ao handler padrão"""
+    registrar_metadados_log(None, exc.detail, error=True, state=request.scope.setdefault("state", {}))
+    return await http_exception_handler(request, exc)
+
+
+async def validation_exception_log_handler(request: Request, exc: RequestValidationError):
+    """Registra os erros de validação para o log e delega ao handler padrão"""
+    registrar_metadados_log(None, exc.errors(), error=True, state=request.scope.setdefault("state", {}))
+    return await request_validation_exception_handler(request, exc)
+
+
+@lru_cache(maxsize=512)
+def taxa_amostragem(metodo: str, rota: str) -> float:
+    """
+    Taxa de amostragem (0 a 1) para o template de rota, conforme
+    settings.log_sampling_rates (ver utils.rotas.valor_por_rota).
+    Sem regra, registra 100%.
+    """
+    return valor_por_rota(settings.log_sampling_rates, metodo, rota, 1.0)
+
+
+def _capturar_request_data(request: Request) -> str:
+    """Resume headers importantes e parâmetros da requisição (sem consumir o body)"""
+    try:
+        # Capturar headers importantes (como no curl)
+        important_headers = {}
+        for header_name in ['accept', 'content-type', 'authorization', 'user-agent']:
+            header_value = request.headers.get(header_name)
+            if header_value:
+                important_headers[header_name] = header_value
+
+        request_info = {
+            "headers": important_headers,  # Apenas headers importantes
+            "query_params": dict(request.query_params),
+            "path_params": dict(request.path_params)
+        }
+
+        return str(request_info)[:1000]  # Limitar a 1000 caracteres
     except Exception as e:
-        # Em caso de erro, calcular tempo e salvar logs
-        process_time = int((time.time() - start_time) * 1000)
-        
-        # Capturar stack trace completo
-        stack_trace = traceback.format_exc()
-        
-        # Salvar log da API com erro
-        await save_api_log(
-            endpoint=endpoint,
-            metodo=metodo,
-            status_code=500,  # Erro interno
-            tempo_resposta=process_time,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            request_data=request_data,
-            response_data=f"Erro: {str(e)}",
-            request=request
-        )
-        
-        # Salvar log de erro detalhado
-        await save_error_log(
-            endpoint=endpoint,
-            metodo=metodo,
-            erro=str(e),
-            stack_trace=stack_trace,
-            ip_address=ip_address,
-            request=request
-        )
-        
-        # Re-levantar a exceção
-        raise
+        return f"Erro ao capturar dados da requisição: {str(e)}"
+
+
+def _extrair_campos(texto: str, truncado: bool, content_type: str) -> Dict[str, Any]:
+    """
+    Extrai status/message/detail/error do prefixo da resposta.
+    Com o body completo usa json.loads; se o prefixo foi truncado, procura os
+    campos de texto por expressão regular (as respostas padronizadas trazem
+    status e message no início do objeto).
+    """
+    if not texto or "json" not in content_type:
+        return {}
+
+    if not truncado:
+        try:
+            response_json = json.loads(texto)
+        except json.JSONDecodeError:
+            return {}
+        if not isinstance(response_json, dict):
+            return {}
+        return {
+            campo: response_json[campo]
+            for campo in ("status", "message", "detail", "error")
+            if campo in response_json
+        }
+
+    campos: Dict[str, Any] = {}
+    for campo, valor in _CAMPO_JSON.findall(texto):
+        if campo not in campos:
+            try:
+                campos[campo] = json.loads(f'"{valor}"')
+            except json.JSONDecodeError:
+                campos[campo] = valor
+    return campos
+
+
+def _resposta_orcamento_excedido(motivo: str) -> bytes:
+    """Body JSON do 500 enviado quando a requisição passa do orçamento de consultas (modo estrito)"""
+    from utils.response_utils import create_error_response
+
+    resposta = create_error_response("Orçamento de consultas SQL excedido", {"errors": [motivo]})
+    return json.dumps(resposta, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _em_ms(inicio: float, fim: Optional[float]) -> Optional[int]:
+    """Converte o intervalo entre dois perf_counter() em milissegundos"""
+    if fim is None:
+        return None
+    return int((fim - inicio) * 1000)
 
 async def save_api_log(
     endpoint: str,
@@ -222,16 +353,17 @@ async def save_api_log(
     request_data: str = None,
     response_data: str = None,
     app_status: str = None,
+    rota: str = None,
+    peso_amostra: float = 1.0,
+    bytes_resposta: int = None,
+    tempo_primeiro_byte: int = None,
+    consultas: Optional[ConsultasRequisicao] = None,
     request: Request = None
 ):
     """
-    Salva o log da API no banco de dados
+    Enfileira o log da API para gravação em lote
     """
-    db = None
     try:
-        # Criar nova sessão do banco
-        db = SessionLocal()
-        
         # Tentar obter usuário atual (se autenticado)
         usuario_id = None
         try:
@@ -263,28 +395,31 @@ async def save_api_log(
             response_data = str(response_data)[:1000] if response_data is not None else None
 
         # Criar log da API
-        log_entry = LogAPI(
-            endpoint=endpoint,
-            metodo=metodo,
-            status_code=status_code,
-            app_status=app_status,  # Status da aplicação (success/error)
-            tempo_resposta=tempo_resposta,
-            usuario_id=usuario_id,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            request_data=request_data,
-            response_data=response_data
-        )
-
-        db.add(log_entry)
-        db.commit()
+        await log_sink.enqueue(TIPO_API, {
+            "endpoint": endpoint,
+            "rota": rota,
+            "metodo": metodo,
+            "status_code": status_code,
+            "app_status": app_status,  # Status da aplicação (success/error)
+            "tempo_resposta": tempo_resposta,
+            "usuario_id": usuario_id,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "request_data": request_data,
+            "response_data": response_data,
+            "peso_amostra": peso_amostra,
+            "bytes_resposta": bytes_resposta,
+            "tempo_primeiro_byte": tempo_primeiro_byte,
+            "consultas_sql": consultas.total if consultas else None,
+            "tempo_sql": round(consultas.tempo_ms) if consultas else None,
+            "sql_mais_lento": consultas.mais_lenta_sql if consultas else None,
+            "tempo_sql_mais_lento": round(consultas.mais_lenta_ms) if consultas else None,
+            "created_at": get_current_brasil_time()
+        })
         
     except Exception as e:
         # Se houver erro ao salvar o log, apenas imprimir (não quebrar a aplicação)
         print(f"Erro ao salvar log da API: {e}")
-    finally:
-        if db:
-            db.close()
 
 async def save_error_log(
     endpoint: str,
@@ -295,13 +430,9 @@ async def save_error_log(
     request: Request = None
 ):
     """
-    Salva o log de erro no banco de dados
+    Enfileira o log de erro para gravação em lote
     """
-    db = None
     try:
-        # Criar nova sessão do banco
-        db = SessionLocal()
-        
         # Tentar obter usuário atual (se autenticado)
         usuario_id = None
         try:
@@ -317,21 +448,16 @@ async def save_error_log(
             usuario_id = None
         
         # Criar log de erro
-        log_entry = LogErro(
-            endpoint=endpoint,
-            metodo=metodo,
-            erro=erro[:1000] if erro else "Erro desconhecido",  # Limitar a 1000 caracteres
-            stack_trace=stack_trace[:5000] if stack_trace else None,  # Limitar a 5000 caracteres
-            usuario_id=usuario_id,
-            ip_address=ip_address or "unknown"
-        )
-        
-        db.add(log_entry)
-        db.commit()
+        await log_sink.enqueue(TIPO_ERRO, {
+            "endpoint": endpoint,
+            "metodo": metodo,
+            "erro": erro[:1000] if erro else "Erro desconhecido",  # Limitar a 1000 caracteres
+            "stack_trace": stack_trace[:5000] if stack_trace else None,  # Limitar a 5000 caracteres
+            "usuario_id": usuario_id,
+            "ip_address": ip_address or "unknown",
+            "created_at": get_current_brasil_time()
+        })
         
     except Exception as e:
         # Se houver erro ao salvar o log, apenas imprimir (não quebrar a aplicação)
         print(f"Erro ao salvar log de erro: {e}")
-    finally:
-        if db:
-            db.close()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Migração das colunas de data gravadas como texto para DATE
+
+OrdemServico.data, EncerrarOS.data_da_manutencao e RetiradaViatura.data eram
+String(10) com formatos misturados (DD/MM/YYYY, YYYY-MM-DD e até data e hora).
+O backfill reescreve cada valor como YYYY-MM-DD e, no MySQL, altera o tipo da
+coluna para DATE. Valores que não puderem ser convertidos vão para a quarentena
+(tabela data_invalida, com o texto original) e a coluna recebe a data de
+criação do registro (created_at, ou hoje se vazio): a coluna é NOT NULL e um
+texto fora do formato quebraria a leitura da linha pelo ORM. Corrija a data
+pelo sistema e consulte o original em data_invalida.
+
+Executado no startup (idempotente: só lê as linhas fora do formato ISO) e
+também pode ser rodado à parte para ver o relatório completo.
+"""
+
+from typing import Dict, List, Tuple
+from datetime import date
+from sqlalchemy import Date, DateTime, String, func, insert, inspect, or_, select, text, type_coerce, update
+from sqlalchemy.engine import Engine
+from models import OrdemServico, EncerrarOS, RetiradaViatura, DataInvalida
+from utils.date_utils import parse_data
+from utils.timezone_utils import get_current_brasil_time
+
+COLUNAS_DATA = (
+    (OrdemServico.__table__, "data"),
+    (EncerrarOS.__table__, "data_da_manutencao"),
+    (RetiradaViatura.__table__, "data"),
+)
+
+
+def _tipo_date(bind, tabela: str, coluna: str) -> bool:
+    """Verdadeiro se a coluna já é DATE no banco"""
+    for info in inspect(bind).get_columns(tabela):
+        if info["name"] == coluna:
+            return isinstance(info["type"], Date) and not isinstance(info["type"], DateTime)
+    return False
+
+
+def _fora_do_formato(coluna):
+    """Filtro das linhas cujo texto não está em YYYY-MM-DD"""
+    texto = type_coerce(coluna, String)
+    return or_(
+        func.length(texto) != 10,
+        func.substr(texto, 5, 1) != "-",
+        func.substr(texto, 8, 1) != "-",
+    )
+
+
+def _data_substituta(created_at) -> date:
+    """Data gravada no lugar de um valor inválido: a de criação do registro (ou hoje)"""
+    return parse_data(created_at) or get_current_brasil_time().date()
+
+
+def migrar_colunas_data(engine: Engine) -> Dict[str, Dict]:
+    """
+    Converte os valores para YYYY-MM-DD e, no MySQL, o tipo para DATE.
+    Retorna por coluna o total convertido e as linhas em quarentena (id, valor, substituta).
+    """
+    relatorio = {}
+    for tabela, nome in COLUNAS_DATA:
+        if not inspect(engine).has_table(tabela.name):
+            continue
+        coluna = tabela.c[nome]
+        chave = f"{tabela.name}.{nome}"
+        convertidas = 0
+        invalidas: List[Tuple[int, str, date]] = []
+
+        if engine.dialect.name != "sqlite" and _tipo_date(engine, tabela.name, nome):
+            continue
+
+        with engine.begin() as conn:
+            linhas = conn.execute(
+                select(tabela.c.id, type_coerce(coluna, String), type_coerce(tabela.c.created_at, String))
+                .where(_fora_do_formato(coluna))
+            ).all()
+            for id_, valor, created_at in linhas:
+                convertida = parse_data(valor)
+                if convertida is None:
+                    convertida = _data_substituta(created_at)
+                    conn.execute(insert(DataInvalida.__table__).values(
+                        tabela=tabela.name, coluna=nome, registro_id=id_,
+                        valor_original=str(valor)[:100], valor_substituto=convertida,
+                    ))
+                    invalidas.append((id_, valor, convertida))
+                else:
+                    convertidas += 1
+                conn.execute(update(tabela).where(tabela.c.id == id_).values({nome: convertida}))
+
+            if engine.dialect.name == "mysql":
+                conn.execute(text(f"ALTER TABLE {tabela.name} MODIFY COLUMN {nome} DATE NOT NULL"))
+                print(f"🔧 Coluna {chave} alterada para DATE")
+
+        if convertidas or invalidas:
+            relatorio[chave] = {"convertidas": convertidas, "invalidas": invalidas}
+    return relatorio
+
+
+def imprimir_relatorio(relatorio: Dict[str, Dict], detalhar: bool = True):
+    for chave, dados in relatorio.items():
+        if dados["convertidas"]:
+            print(f"📅 {chave}: {dados['convertidas']} data(s) convertida(s) para YYYY-MM-DD")
+        if dados["invalidas"]:
+            print(
+                f"⚠️ {chave}: {len(dados['invalidas'])} valor(es) sem formato de data reconhecido"
+                " movido(s) para data_invalida (coluna preenchida com a data de criação do registro)"
+            )
+            if not detalhar:
+                continue
+            for id_, valor, substituta in dados["invalidas"]:
+                print(f"   id={id_}: {valor!r} -> {substituta.isoformat()}")
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    DataInvalida.__table__.create(bind=engine, checkfirst=True)
+    resultado = migrar_colunas_data(engine)
+    if not resultado:
+        print("✅ Todas as colunas de data já estão no formato YYYY-MM-DD")
+    imprimir_relatorio(resultado)
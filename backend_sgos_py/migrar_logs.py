@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Migração dos logs antigos do banco principal para o banco de logs
+
+Antes do banco separado (LOG_DATABASE_URL), log_api e log_erro ficavam no
+banco principal. Esta migração copia essas linhas para as partições do banco
+de logs (log_api_AAAAMMDD, log_erro_AAAAMM...) e soma os logs da API ao
+agregado por minuto (log_api_minuto), que é o que --stats lê. Linhas já fora
+da retenção das partições só entram no agregado (se ainda dentro da retenção
+dele). Cada lote copiado é removido do banco principal e, ao final, as tabelas
+antigas são apagadas.
+
+Executado no startup (sem as tabelas antigas, não faz nada) e também pode ser
+rodado à parte.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List
+from sqlalchemy import MetaData, Table, delete, insert, inspect, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from models import LogAPI, LogErro
+import log_partitions
+import log_rollup
+from config import settings
+from utils.timezone_utils import get_current_brasil_time
+
+TAMANHO_LOTE = 1000
+
+# Tabelas antigas do banco principal -> modelo das partições
+TABELAS_LEGADAS = (LogAPI.__table__, LogErro.__table__)
+
+
+def _limite(dias: int) -> datetime:
+    hoje = get_current_brasil_time().date()
+    return datetime.combine(hoje - timedelta(days=dias), datetime.min.time())
+
+
+def _migrar_tabela(engine: Engine, log_engine: Engine, modelo: Table) -> Dict[str, int]:
+    base = modelo.name
+    # Reflete a tabela antiga: ela não tem as colunas criadas depois (rota, peso_amostra...)
+    legada = Table(base, MetaData(), autoload_with=engine)
+    colunas = [coluna.name for coluna in legada.columns if coluna.name != "id" and coluna.name in modelo.c]
+    limite_particao = _limite(log_partitions.retencao_dias(base))
+    limite_rollup = _limite(settings.log_rollup_retention_days)
+    relatorio = {"copiadas": 0, "agregadas": 0, "expiradas": 0}
+    criadas = set()
+
+    while True:
+        with engine.connect() as conn:
+            linhas = conn.execute(
+                select(legada.c.id, *(legada.c[coluna] for coluna in colunas))
+                .order_by(legada.c.id)
+                .limit(TAMANHO_LOTE)
+            ).mappings().all()
+        if not linhas:
+            break
+
+        por_particao: Dict[str, List[Dict]] = {}
+        para_rollup = []
+        for linha in linhas:
+            registro = {coluna: linha[coluna] for coluna in colunas}
+            created_at = registro.get("created_at")
+            if created_at is not None and created_at < limite_particao:
+                relatorio["expiradas"] += 1
+            else:
+                nome = log_partitions.nome_particao(base, created_at)
+                por_particao.setdefault(nome, []).append(registro)
+            if base == LogAPI.__tablename__ and (created_at is None or created_at >= limite_rollup):
+                para_rollup.append(registro)
+
+        # Grava no banco de logs antes de remover do principal: uma falha no meio
+        # repete no máximo este lote na próxima execução
+        with log_engine.begin() as conn:
+            for nome in por_particao:
+                if nome not in criadas:
+                    log_partitions.tabela_particao(base, nome).create(conn, checkfirst=True)
+                    criadas.add(nome)
+        with Session(log_engine) as db:
+            for nome, registros in por_particao.items():
+                db.execute(insert(log_partitions.tabela_particao(base, nome)), registros)
+            log_rollup.gravar(db, log_rollup.acumular(para_rollup))
+            db.commit()
+        with engine.begin() as conn:
+            conn.execute(delete(legada).where(legada.c.id.in_([linha["id"] for linha in linhas])))
+
+        relatorio["copiadas"] += sum(len(registros) for registros in por_particao.values())
+        relatorio["agregadas"] += len(para_rollup)
+
+    legada.drop(engine)
+    return relatorio
+
+
+def migrar_logs_legados(engine: Engine, log_engine: Engine) -> Dict[str, Dict[str, int]]:
+    """Move log_api/log_erro do banco principal para o banco de logs; retorna contagens por tabela"""
+    if engine.url == log_engine.url:
+        return {}
+    relatorio = {}
+    for modelo in TABELAS_LEGADAS:
+        if inspect(engine).has_table(modelo.name):
+            relatorio[modelo.name] = _migrar_tabela(engine, log_engine, modelo)
+    return relatorio
+
+
+def imprimir_relatorio(relatorio: Dict[str, Dict[str, int]]):
+    for tabela, dados in relatorio.items():
+        print(
+            f"📦 {tabela}: {dados['copiadas']} log(s) antigo(s) movido(s) para o banco de logs"
+            f" ({dados['expiradas']} fora da retenção, {dados['agregadas']} no agregado por minuto)"
+        )
+
+
+if __name__ == "__main__":
+    from database import engine, log_engine
+    from models import LogAPIMinuto
+
+    LogAPIMinuto.__table__.create(bind=log_engine, checkfirst=True)
+    resultado = migrar_logs_legados(engine, log_engine)
+    if not resultado:
+        print("✅ Nenhum log antigo no banco principal")
+    imprimir_relatorio(resultado)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Backfill das colunas numéricas derivadas dos campos em texto
+
+    ordem_servico.hodometro                     -> hodometro_km (km)
+    peca_utilizada.qtd                          -> qtd_unidades (unidades)
+    servico_realizado.tempo_de_servico_realizado -> tempo_minutos (minutos)
+    encerrar_os.tempo_total                     -> tempo_total_minutos (minutos)
+
+Registros novos já recebem o valor numérico pelo modelo (@validates); aqui
+são preenchidas as linhas antigas, para que totais, médias e variações do
+hodômetro sejam calculados com SUM/MAX no banco. Executado no startup
+(só lê as linhas ainda sem valor numérico) e também pode ser rodado à parte
+para listar os valores que não puderam ser convertidos.
+"""
+
+from typing import Dict, List, Tuple
+from sqlalchemy import inspect, select, update
+from sqlalchemy.engine import Engine
+from models import OrdemServico, PecaUtilizada, ServicoRealizado, EncerrarOS
+from utils.numero_utils import parse_inteiro, parse_minutos
+
+# (tabela, coluna de texto, coluna numérica, conversor)
+COLUNAS_NUMERICAS = (
+    (OrdemServico.__table__, "hodometro", "hodometro_km", parse_inteiro),
+    (PecaUtilizada.__table__, "qtd", "qtd_unidades", parse_inteiro),
+    (ServicoRealizado.__table__, "tempo_de_servico_realizado", "tempo_minutos", parse_minutos),
+    (EncerrarOS.__table__, "tempo_total", "tempo_total_minutos", parse_minutos),
+)
+
+
+def migrar_colunas_numericas(engine: Engine) -> Dict[str, Dict]:
+    """Preenche as colunas numéricas vazias; retorna convertidas e inválidas por coluna"""
+    relatorio = {}
+    for tabela, origem, destino, converter in COLUNAS_NUMERICAS:
+        colunas = {coluna["name"] for coluna in inspect(engine).get_columns(tabela.name)}
+        if destino not in colunas:
+            continue
+        convertidas = 0
+        invalidas: List[Tuple[int, str]] = []
+
+        with engine.begin() as conn:
+            linhas = conn.execute(
+                select(tabela.c.id, tabela.c[origem])
+                .where(tabela.c[destino].is_(None), tabela.c[origem].is_not(None))
+            ).all()
+            for id_, valor in linhas:
+                numero = converter(valor)
+                if numero is None:
+                    invalidas.append((id_, valor))
+                    continue
+                conn.execute(update(tabela).where(tabela.c.id == id_).values({destino: numero}))
+                convertidas += 1
+
+        if convertidas or invalidas:
+            relatorio[f"{tabela.name}.{origem}"] = {"convertidas": convertidas, "invalidas": invalidas}
+    return relatorio
+
+
+def imprimir_relatorio(relatorio: Dict[str, Dict], detalhar: bool = True):
+    for chave, dados in relatorio.items():
+        if dados["convertidas"]:
+            print(f"🔢 {chave}: {dados['convertidas']} valor(es) numérico(s) preenchido(s)")
+        if dados["invalidas"]:
+            print(f"⚠️ {chave}: {len(dados['invalidas'])} valor(es) que não são número/duração")
+            if not detalhar:
+                print("   Detalhes: python migrar_numeros.py")
+                continue
+            for id_, valor in dados["invalidas"]:
+                print(f"   id={id_}: {valor!r}")
+
+
+if __name__ == "__main__":
+    from database import Base, engine, sincronizar_esquema
+
+    sincronizar_esquema(engine, Base.metadata)
+    resultado = migrar_colunas_numericas(engine)
+    if not resultado:
+        print("✅ Todas as colunas numéricas já estão preenchidas")
+    imprimir_relatorio(resultado)
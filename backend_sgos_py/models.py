@@ -1,11 +1,16 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, Float, String, Text, Boolean, Date, DateTime, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
-from database import Base
+from database import Base, LogBase
 from utils.timezone_utils import brasil_now
+from utils.numero_utils import parse_inteiro, parse_minutos
 
 class Usuario(Base):
     __tablename__ = "usuario"
+    __table_args__ = (
+        # Ordenação estável da paginação por cursor: (campo, id)
+        Index("ix_usuario_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), unique=True, nullable=False, index=True)
@@ -36,16 +41,21 @@ class PasswordResetToken(Base):
     created_at = Column(DateTime(timezone=True), default=brasil_now())
     
     # Relacionamentos
-    usuario = relationship("Usuario", back_populates="password_reset_tokens")
+    # Muitos-para-um com lazy="raise_on_sql": quem lê declara joinedload/selectinload na
+    # consulta; um acesso sem carregamento falha em vez de gerar um SELECT por linha (N+1)
+    usuario = relationship("Usuario", back_populates="password_reset_tokens", lazy="raise_on_sql")
 
 class Veiculo(Base):
     __tablename__ = "veiculo"
+    __table_args__ = (
+        Index("ix_veiculo_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     marca = Column(String(50), nullable=False)
     modelo = Column(String(50), nullable=False)
     placa = Column(String(10), unique=True, nullable=False, index=True)
-    su_cia_viatura = Column(String(50), nullable=False)
+    su_cia_viatura = Column(String(50), nullable=False, index=True)
     patrimonio = Column(String(20), unique=True, nullable=False, index=True)
     ano_fabricacao = Column(String(4))
     cor = Column(String(30))
@@ -62,15 +72,20 @@ class Veiculo(Base):
 
 class OrdemServico(Base):
     __tablename__ = "ordem_servico"
+    __table_args__ = (
+        Index("ix_ordem_servico_data_id", "data", "id"),
+        Index("ix_ordem_servico_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    data = Column(String(10), nullable=False, index=True)
+    data = Column(Date, nullable=False, index=True)
     veiculo_id = Column(Integer, ForeignKey("veiculo.id"), nullable=False, index=True)
     hodometro = Column(String(10), nullable=False)
+    hodometro_km = Column(Integer, index=True)  # preenchido a partir de hodometro
     problema_apresentado = Column(Text, nullable=False)
     sistema_afetado = Column(String(50), nullable=False)
     causa_da_avaria = Column(Text, nullable=False)
-    manutencao = Column(String(20), nullable=False)
+    manutencao = Column(String(20), nullable=False, index=True)
     usuario_id = Column(Integer, ForeignKey("usuario.id"), nullable=False, index=True)
     perfil = Column(String(20), nullable=False)
     situacao_os = Column(String(20), default="ABERTA", index=True)
@@ -78,74 +93,131 @@ class OrdemServico(Base):
     updated_at = Column(DateTime(timezone=True), default=brasil_now(), onupdate=brasil_now())
     
     # Relacionamentos
-    veiculo = relationship("Veiculo", back_populates="ordens_servico")
-    usuario = relationship("Usuario", back_populates="ordens_servico")
+    veiculo = relationship("Veiculo", back_populates="ordens_servico", lazy="raise_on_sql")
+    usuario = relationship("Usuario", back_populates="ordens_servico", lazy="raise_on_sql")
     servicos_realizados = relationship("ServicoRealizado", back_populates="ordem_servico")
     pecas_utilizadas = relationship("PecaUtilizada", back_populates="ordem_servico")
     encerramentos = relationship("EncerrarOS", back_populates="ordem_servico")
+    
+    @validates("hodometro")
+    def _atualizar_hodometro_km(self, key, valor):
+        self.hodometro_km = parse_inteiro(valor)
+        return valor
 
 class ServicoRealizado(Base):
     __tablename__ = "servico_realizado"
+    __table_args__ = (
+        Index("ix_servico_realizado_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     servico_realizado = Column(String(200), nullable=False)
     tempo_de_servico_realizado = Column(String(10), nullable=False)
+    tempo_minutos = Column(Integer)  # preenchido a partir de tempo_de_servico_realizado
     abrir_os_id = Column(Integer, ForeignKey("ordem_servico.id"), nullable=False, index=True)
     usuario_id = Column(Integer, ForeignKey("usuario.id"), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), default=brasil_now())
     
     # Relacionamentos
-    ordem_servico = relationship("OrdemServico", back_populates="servicos_realizados")
-    usuario = relationship("Usuario", back_populates="servicos_realizados")
+    ordem_servico = relationship("OrdemServico", back_populates="servicos_realizados", lazy="raise_on_sql")
+    usuario = relationship("Usuario", back_populates="servicos_realizados", lazy="raise_on_sql")
+    
+    @validates("tempo_de_servico_realizado")
+    def _atualizar_tempo_minutos(self, key, valor):
+        self.tempo_minutos = parse_minutos(valor)
+        return valor
 
 class PecaUtilizada(Base):
     __tablename__ = "peca_utilizada"
+    __table_args__ = (
+        Index("ix_peca_utilizada_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     peca_utilizada = Column(String(200), nullable=False)
     num_ficha = Column(String(50), nullable=False, index=True)
     qtd = Column(String(10), nullable=False)
+    qtd_unidades = Column(Integer)  # preenchido a partir de qtd
     abrir_os_id = Column(Integer, ForeignKey("ordem_servico.id"), nullable=False, index=True)
     usuario_id = Column(Integer, ForeignKey("usuario.id"), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), default=brasil_now())
     
     # Relacionamentos
-    ordem_servico = relationship("OrdemServico", back_populates="pecas_utilizadas")
-    usuario = relationship("Usuario", back_populates="pecas_utilizadas")
+    ordem_servico = relationship("OrdemServico", back_populates="pecas_utilizadas", lazy="raise_on_sql")
+    usuario = relationship("Usuario", back_populates="pecas_utilizadas", lazy="raise_on_sql")
+    
+    @validates("qtd")
+    def _atualizar_qtd_unidades(self, key, valor):
+        self.qtd_unidades = parse_inteiro(valor)
+        return valor
 
 class EncerrarOS(Base):
     __tablename__ = "encerrar_os"
+    __table_args__ = (
+        Index("ix_encerrar_os_data_da_manutencao_id", "data_da_manutencao", "id"),
+        Index("ix_encerrar_os_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     nome_mecanico = Column(String(100), nullable=False, index=True)
-    data_da_manutencao = Column(String(10), nullable=False)
+    data_da_manutencao = Column(Date, nullable=False, index=True)
     situacao_os = Column(String(20), default="FECHADA", index=True)
     tempo_total = Column(String(10), nullable=False)
+    tempo_total_minutos = Column(Integer)  # preenchido a partir de tempo_total
     usuario_id = Column(Integer, ForeignKey("usuario.id"), nullable=False, index=True)
     abrir_os_id = Column(Integer, ForeignKey("ordem_servico.id"), nullable=False, index=True)
     modelo_veiculo = Column(String(50), nullable=False)
     created_at = Column(DateTime(timezone=True), default=brasil_now())
     
     # Relacionamentos
-    ordem_servico = relationship("OrdemServico", back_populates="encerramentos")
-    usuario = relationship("Usuario", back_populates="encerramentos_os")
+    ordem_servico = relationship("OrdemServico", back_populates="encerramentos", lazy="raise_on_sql")
+    usuario = relationship("Usuario", back_populates="encerramentos_os", lazy="raise_on_sql")
     retiradas_viatura = relationship("RetiradaViatura", back_populates="encerramento_os")
+    
+    @validates("tempo_total")
+    def _atualizar_tempo_total_minutos(self, key, valor):
+        self.tempo_total_minutos = parse_minutos(valor)
+        return valor
 
 class RetiradaViatura(Base):
     __tablename__ = "retirada_viatura"
+    __table_args__ = (
+        Index("ix_retirada_viatura_data_id", "data", "id"),
+        Index("ix_retirada_viatura_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     nome = Column(String(100), nullable=False, index=True)
-    data = Column(String(10), nullable=False, index=True)
+    data = Column(Date, nullable=False, index=True)
     encerrar_os_id = Column(Integer, ForeignKey("encerrar_os.id"), nullable=False, index=True)
     usuario_id = Column(Integer, ForeignKey("usuario.id"), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), default=brasil_now())
     
     # Relacionamentos
-    encerramento_os = relationship("EncerrarOS", back_populates="retiradas_viatura")
-    usuario = relationship("Usuario", back_populates="retiradas_viatura")
+    encerramento_os = relationship("EncerrarOS", back_populates="retiradas_viatura", lazy="raise_on_sql")
+    usuario = relationship("Usuario", back_populates="retiradas_viatura", lazy="raise_on_sql")
 
-class LogErro(Base):
+class VersaoTabela(Base):
+    """Contador de escritas por tabela, incrementado logo após o commit (ver versoes)"""
+    __tablename__ = "versao_tabela"
+    
+    tabela = Column(String(50), primary_key=True)
+    versao = Column(Integer, nullable=False, default=1)
+    atualizado_em = Column(DateTime(timezone=True), default=brasil_now())
+
+class DataInvalida(Base):
+    """Valor original de data que não pôde ser convertido (quarentena, ver migrar_datas)"""
+    __tablename__ = "data_invalida"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tabela = Column(String(50), nullable=False)
+    coluna = Column(String(50), nullable=False)
+    registro_id = Column(Integer, nullable=False)
+    valor_original = Column(String(100), nullable=False)
+    valor_substituto = Column(Date, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=brasil_now())
+
+class LogErro(LogBase):
     __tablename__ = "log_erro"
     
     id = Column(Integer, primary_key=True, index=True)
@@ -153,22 +225,75 @@ class LogErro(Base):
     metodo = Column(String(10), nullable=False, index=True)
     erro = Column(Text, nullable=False)
     stack_trace = Column(Text)
-    usuario_id = Column(Integer, ForeignKey("usuario.id"), index=True)
+    usuario_id = Column(Integer, index=True)  # Sem FK: usuario fica no banco principal
     ip_address = Column(String(45))
     created_at = Column(DateTime(timezone=True), default=brasil_now(), index=True)
 
-class LogAPI(Base):
+class LogAPI(LogBase):
     __tablename__ = "log_api"
     
     id = Column(Integer, primary_key=True, index=True)
     endpoint = Column(String(200), nullable=False, index=True)
+    rota = Column(String(200), index=True)  # Template da rota (ex.: /api/v1/veiculos/{veiculo_id})
     metodo = Column(String(10), nullable=False, index=True)
     status_code = Column(Integer, nullable=False, index=True)
     app_status = Column(String(20), index=True)  # Status da aplicação (success/error)
     tempo_resposta = Column(Integer, nullable=False)
-    usuario_id = Column(Integer, ForeignKey("usuario.id"), index=True)
+    usuario_id = Column(Integer, index=True)  # Sem FK: usuario fica no banco principal
     ip_address = Column(String(45))
     user_agent = Column(String(500))
     request_data = Column(Text)
     response_data = Column(Text)
+    bytes_resposta = Column(Integer)  # Total de bytes enviados no body
+    tempo_primeiro_byte = Column(Integer)  # Milissegundos até o início da resposta
+    peso_amostra = Column(Float, default=1.0)  # Quantas requisições esta linha representa (1/taxa)
+    consultas_sql = Column(Integer)  # Consultas SQL executadas na requisição
+    tempo_sql = Column(Integer)  # Milissegundos somados das consultas
+    sql_mais_lento = Column(Text)  # Texto da consulta mais lenta
+    tempo_sql_mais_lento = Column(Integer)  # Milissegundos da consulta mais lenta
+    created_at = Column(DateTime(timezone=True), default=brasil_now(), index=True)
+
+class LogAPIMinuto(LogBase):
+    """Agregado por minuto dos logs da API, atualizado a cada lote gravado"""
+    __tablename__ = "log_api_minuto"
+    __table_args__ = (
+        UniqueConstraint("minuto", "rota", "metodo", "classe_status", name="uq_log_api_minuto_chave"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    minuto = Column(DateTime, nullable=False, index=True)  # Horário do Brasil truncado no minuto
+    rota = Column(String(200), nullable=False, index=True)
+    metodo = Column(String(10), nullable=False)
+    classe_status = Column(String(3), nullable=False)  # 2xx, 3xx, 4xx, 5xx
+    total = Column(Float, nullable=False, default=0)  # Requisições estimadas (soma de peso_amostra)
+    erros = Column(Float, nullable=False, default=0)
+    soma_tempo = Column(Float, nullable=False, default=0)  # Soma ponderada de tempo_resposta (ms)
+    tempo_min = Column(Integer)
+    tempo_max = Column(Integer)
+    # Histograma de tempo_resposta (contagens ponderadas por faixa, em ms)
+    bucket_10ms = Column(Float, nullable=False, default=0)
+    bucket_50ms = Column(Float, nullable=False, default=0)
+    bucket_100ms = Column(Float, nullable=False, default=0)
+    bucket_250ms = Column(Float, nullable=False, default=0)
+    bucket_500ms = Column(Float, nullable=False, default=0)
+    bucket_1000ms = Column(Float, nullable=False, default=0)
+    bucket_2500ms = Column(Float, nullable=False, default=0)
+    bucket_5000ms = Column(Float, nullable=False, default=0)
+    bucket_inf = Column(Float, nullable=False, default=0)
+
+class LogQueryLenta(LogBase):
+    """Consultas do banco principal acima de SLOW_QUERY_THRESHOLD_MS (ver query_lenta)"""
+    __tablename__ = "log_query_lenta"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    hash_sql = Column(String(16), nullable=False, index=True)  # Hash do SQL normalizado
+    sql_normalizado = Column(Text, nullable=False)  # Literais trocados por ?
+    hash_parametros = Column(String(16))
+    duracao_ms = Column(Float, nullable=False)
+    rota = Column(String(200), index=True)  # Template da rota; vazio fora de requisições
+    metodo = Column(String(10))
+    usuario_id = Column(Integer)  # Sem FK: usuario fica no banco principal
+    plano = Column(Text)  # EXPLAIN QUERY PLAN (SQLite), só na primeira ocorrência do SQL
+    scan_completo = Column(Boolean, nullable=False, default=False)
+    tabelas_scan = Column(String(200))  # Tabelas lidas por inteiro segundo o plano
     created_at = Column(DateTime(timezone=True), default=brasil_now(), index=True)
@@ -0,0 +1,157 @@
+"""
+Consultas SQL por requisição
+
+Listeners before/after_cursor_execute nos engines do banco principal contam as
+consultas, somam o tempo e guardam a mais lenta em um objeto associado à
+requisição por contextvar (aberto pelo LogAPIMiddleware). Os números vão para a
+linha de LogAPI e, com SQL_METRICS_HEADERS, para os headers X-DB-Queries e
+X-DB-Time-ms.
+Consultas acima de SLOW_QUERY_THRESHOLD_MS, dentro ou fora de requisições, vão
+para o log de consultas lentas (ver query_lenta).
+
+Modo estrito (SQL_STRICT_MODE, para testes): todo SELECT do ORM recebe
+raiseload("*"), de modo que só carregam relacionamentos declarados com
+joinedload/selectinload, e a requisição falha quando passa do orçamento de
+consultas da rota (SQL_QUERY_BUDGETS / SQL_QUERY_BUDGET_DEFAULT). Como os
+handlers transformam exceções em respostas de erro com status 200, o
+LogAPIMiddleware troca a resposta de uma requisição que estourou o orçamento
+por um 500.
+"""
+
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, raiseload
+from config import settings
+from log_sink import log_sink, TIPO_QUERY_LENTA
+import query_lenta
+from utils.rotas import valor_por_rota
+
+# Tamanho máximo do texto guardado da consulta mais lenta
+SQL_MAX_CHARS = 1000
+
+
+class OrcamentoConsultasExcedido(RuntimeError):
+    """A requisição executou mais consultas do que o orçamento da rota (modo estrito)"""
+
+
+@dataclass
+class ConsultasRequisicao:
+    metodo: str
+    scope: Dict[str, Any] = field(repr=False)
+    total: int = 0
+    tempo_ms: float = 0.0
+    mais_lenta_ms: float = 0.0
+    mais_lenta_sql: Optional[str] = None
+    usuario_id: Optional[int] = None
+    # Modo estrito: motivo da falha, para o middleware responder 500 mesmo que o handler capture a exceção
+    orcamento_excedido: Optional[str] = None
+
+    @property
+    def rota(self) -> Optional[str]:
+        """Template da rota (preenchido pelo roteador antes do handler)"""
+        return getattr(self.scope.get("route"), "path", None)
+
+
+_consultas_atuais: ContextVar[Optional[ConsultasRequisicao]] = ContextVar("sgos_consultas_sql", default=None)
+
+
+def iniciar_contagem(metodo: str, scope: Dict[str, Any]):
+    """Abre a contagem da requisição; retorna o token para encerrar_contagem"""
+    return _consultas_atuais.set(ConsultasRequisicao(metodo=metodo, scope=scope))
+
+
+def encerrar_contagem(token):
+    _consultas_atuais.reset(token)
+
+
+def contagem_atual() -> Optional[ConsultasRequisicao]:
+    return _consultas_atuais.get()
+
+
+def registrar_usuario(usuario_id: Optional[int]):
+    """Associa o usuário autenticado à requisição em andamento (para o log de consultas lentas)"""
+    consultas = _consultas_atuais.get()
+    if consultas is not None:
+        consultas.usuario_id = usuario_id
+
+
+@lru_cache(maxsize=512)
+def orcamento_consultas(metodo: str, rota: str) -> int:
+    """Máximo de consultas da rota no modo estrito"""
+    return valor_por_rota(settings.sql_query_budgets, metodo, rota, settings.sql_query_budget_default)
+
+
+def _antes_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    consultas = _consultas_atuais.get()
+    if consultas is not None:
+        consultas.total += 1
+        if settings.sql_strict_mode:
+            rota = consultas.rota or ""
+            limite = orcamento_consultas(consultas.metodo, rota)
+            if consultas.total > limite:
+                consultas.orcamento_excedido = (
+                    f"{consultas.metodo} {rota}: mais de {limite} consultas (orçamento da rota)"
+                )
+                raise OrcamentoConsultasExcedido(consultas.orcamento_excedido)
+    conn.info.setdefault("sgos_inicio_consulta", []).append(time.perf_counter())
+
+
+def _depois_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicios = conn.info.get("sgos_inicio_consulta")
+    if not inicios:
+        return
+    duracao_ms = (time.perf_counter() - inicios.pop()) * 1000
+    consultas = _consultas_atuais.get()
+    if consultas is not None:
+        consultas.tempo_ms += duracao_ms
+        if duracao_ms >= consultas.mais_lenta_ms:
+            consultas.mais_lenta_ms = duracao_ms
+            consultas.mais_lenta_sql = statement[:SQL_MAX_CHARS]
+    if 0 <= settings.slow_query_threshold_ms <= duracao_ms:
+        _registrar_lenta(conn, statement, parameters, executemany, duracao_ms, consultas)
+
+
+def _registrar_lenta(conn, statement, parameters, executemany, duracao_ms, consultas):
+    """Enfileira a consulta lenta; falhas aqui nunca interrompem a consulta"""
+    try:
+        registro = query_lenta.montar_registro(
+            conn, statement, parameters, executemany, duracao_ms,
+            rota=consultas.rota if consultas else None,
+            metodo=consultas.metodo if consultas else None,
+            usuario_id=consultas.usuario_id if consultas else None
+        )
+        log_sink.enqueue_nowait(TIPO_QUERY_LENTA, registro)
+    except Exception as e:
+        print(f"Erro ao registrar consulta lenta: {e}")
+
+
+def _descartar_inicio(contexto_excecao):
+    """Consulta com erro não passa pelo after_cursor_execute"""
+    conn = contexto_excecao.connection
+    inicios = conn.info.get("sgos_inicio_consulta") if conn is not None else None
+    if inicios:
+        inicios.pop()
+
+
+def _raiseload_padrao(estado):
+    """Modo estrito: relacionamentos sem loader declarado na consulta não carregam"""
+    if estado.is_select and not estado.is_column_load and not estado.is_relationship_load:
+        estado.statement = estado.statement.options(raiseload("*"))
+
+
+def instrumentar_engine(engine: Engine):
+    """Registra os listeners de contagem e de consultas lentas no engine (para AsyncEngine, passar .sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _antes_da_consulta)
+    event.listen(engine, "after_cursor_execute", _depois_da_consulta)
+    event.listen(engine, "handle_error", _descartar_inicio)
+
+
+def configurar_modo_estrito():
+    if settings.sql_strict_mode and not event.contains(Session, "do_orm_execute", _raiseload_padrao):
+        event.listen(Session, "do_orm_execute", _raiseload_padrao)
+        print("🧪 SQL em modo estrito: raiseload('*') e orçamento de consultas por rota")
@@ -0,0 +1,123 @@
+"""
+Log de consultas lentas do banco principal (tabela log_query_lenta no banco de logs)
+
+O listener after_cursor_execute de monitor_sql chama registrar() para toda
+consulta acima de SLOW_QUERY_THRESHOLD_MS. O SQL é normalizado (literais e
+listas de IN viram ?) e identificado por um hash, para que view_logs.py --slow
+agrupe as execuções do mesmo comando. No SQLite, o EXPLAIN QUERY PLAN é
+capturado uma vez por hash e marca as tabelas lidas por inteiro (SCAN tabela).
+"""
+
+import hashlib
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import delete
+from models import LogQueryLenta
+from config import settings
+from utils.timezone_utils import get_current_brasil_time
+
+# Quantidade máxima de planos guardados em memória (um por SQL distinto)
+PLANOS_MAX = 1000
+
+_tabela = LogQueryLenta.__table__
+
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_RE_MARCADOR = re.compile(r"%\(\w+\)s|%s|:\w+|\?")
+_RE_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_ESPACOS = re.compile(r"\s+")
+# Linha do plano de leitura completa: "SCAN tabela" (sem USING INDEX / VIRTUAL TABLE)
+_RE_SCAN = re.compile(r"^SCAN ([\w$]+)$")
+
+# hash_sql -> (scan_completo, tabelas_scan)
+_planos: Dict[str, Tuple[bool, Optional[str]]] = {}
+
+
+def normalizar_sql(statement: str) -> str:
+    """Troca literais e marcadores de parâmetro por ? e colapsa listas e espaços"""
+    sql = _RE_STRING.sub("?", statement)
+    sql = _RE_NUMERO.sub("?", sql)
+    sql = _RE_MARCADOR.sub("?", sql)
+    sql = _RE_LISTA.sub("(?)", sql)
+    return _RE_ESPACOS.sub(" ", sql).strip()
+
+
+def _hash(valor: str) -> str:
+    return hashlib.sha1(valor.encode("utf-8", "replace")).hexdigest()[:16]
+
+
+def _explicar(conn, statement: str, parameters) -> Optional[str]:
+    """EXPLAIN QUERY PLAN em um cursor DBAPI à parte (não passa pelos listeners)"""
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+        linhas = cursor.fetchall()
+    finally:
+        cursor.close()
+    return "\n".join(str(linha[-1]) for linha in linhas)
+
+
+def _analisar_plano(plano: Optional[str]) -> Tuple[bool, Optional[str]]:
+    tabelas = []
+    for linha in (plano or "").splitlines():
+        encontrado = _RE_SCAN.match(linha.strip())
+        if encontrado and encontrado.group(1) not in tabelas:
+            tabelas.append(encontrado.group(1))
+    return bool(tabelas), ",".join(tabelas)[:200] or None
+
+
+def montar_registro(
+    conn,
+    statement: str,
+    parameters,
+    executemany: bool,
+    duracao_ms: float,
+    rota: Optional[str] = None,
+    metodo: Optional[str] = None,
+    usuario_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """Monta a linha de log_query_lenta; no SQLite captura o plano na primeira ocorrência do SQL"""
+    sql = normalizar_sql(statement)
+    hash_sql = _hash(sql)
+    plano = None
+
+    if hash_sql not in _planos:
+        explicar = (
+            settings.slow_query_explain
+            and not executemany
+            and conn.dialect.name == "sqlite"
+            and sql.split(" ", 1)[0].upper() in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+        )
+        if explicar:
+            try:
+                plano = _explicar(conn, statement, parameters)
+            except Exception as e:
+                plano = f"(falha no EXPLAIN: {e})"
+        if len(_planos) >= PLANOS_MAX:
+            _planos.pop(next(iter(_planos)))
+        _planos[hash_sql] = _analisar_plano(plano)
+
+    scan_completo, tabelas_scan = _planos[hash_sql]
+    return {
+        "hash_sql": hash_sql,
+        "sql_normalizado": sql,
+        "hash_parametros": _hash(repr(parameters)) if parameters else None,
+        "duracao_ms": round(duracao_ms, 2),
+        "rota": rota,
+        "metodo": metodo,
+        "usuario_id": usuario_id,
+        "plano": plano,
+        "scan_completo": scan_completo,
+        "tabelas_scan": tabelas_scan,
+        "created_at": get_current_brasil_time()
+    }
+
+
+def remover_antigas(bind, hoje=None) -> int:
+    """Remove registros mais antigos que a retenção configurada; retorna as linhas removidas"""
+    hoje = hoje or get_current_brasil_time().date()
+    limite = datetime.combine(hoje - timedelta(days=settings.slow_query_retention_days), datetime.min.time())
+    with bind.begin() as conn:
+        resultado = conn.execute(delete(_tabela).where(_tabela.c.created_at < limite))
+    return resultado.rowcount or 0
@@ -1,12 +1,12 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from models import Usuario
 from schemas import Token, LoginRequest, PasswordResetRequest, PasswordResetConfirm, PasswordResetResponse
 from pydantic import BaseModel
-from auth import authenticate_user, create_access_token, get_current_active_user, verify_password, get_password_hash
+from auth import authenticate_user_async, create_access_token, get_current_active_user, verify_password, get_password_hash
 from email_service import process_password_reset_request, reset_user_password
 from config import settings
 from utils.response_utils import (
@@ -19,12 +19,12 @@ router = APIRouter(prefix="/auth", tags=["Autenticação"])
 @router.post("/login")
 async def login(
     login_data: LoginRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     print('login_data:', login_data)
     """Endpoint para login e obtenção de token JWT"""
     try:
-        user = authenticate_user(db, login_data.username, login_data.password)
+        user = await authenticate_user_async(db, login_data.username, login_data.password)
         if not user:
             return create_unauthorized_response("Usuário ou senha incorretos")
         
@@ -44,17 +44,19 @@ async def login(
         
         return create_auth_response(access_token, user_data, "Login realizado com sucesso")
         
+    except HTTPException:
+        raise
     except Exception as e:
         return create_error_response(f"Erro interno do servidor: {str(e)}")
 
 @router.post("/login-form")
 async def login_form(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Endpoint para login usando form data (compatibilidade com OAuth2)"""
     try:
-        user = authenticate_user(db, form_data.username, form_data.password)
+        user = await authenticate_user_async(db, form_data.username, form_data.password)
         if not user:
             return create_unauthorized_response("Usuário ou senha incorretos")
         
@@ -74,13 +76,15 @@ async def login_form(
         
         return create_auth_response(access_token, user_data, "Login realizado com sucesso")
         
+    except HTTPException:
+        raise
     except Exception as e:
         return create_error_response(f"Erro interno do servidor: {str(e)}")
 
 @router.post("/forgot-password")
 async def forgot_password(
     reset_request: PasswordResetRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Solicita recuperação de senha via email"""
     try:
@@ -97,11 +101,11 @@ async def forgot_password(
 @router.post("/reset-password")
 async def reset_password(
     reset_confirm: PasswordResetConfirm,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Redefine a senha usando o token de recuperação"""
     try:
-        success = reset_user_password(db, reset_confirm.token, reset_confirm.new_password)
+        success = await reset_user_password(db, reset_confirm.token, reset_confirm.new_password)
         
         if success:
             return create_success_response(
@@ -113,6 +117,8 @@ async def reset_password(
                 "Token inválido"
             )
         
+    except HTTPException:
+        raise
     except Exception as e:
         return create_error_response(f"Erro interno do servidor: {str(e)}")
 
@@ -0,0 +1,73 @@
+import hashlib
+import json
+from typing import Any, Dict
+from fastapi import APIRouter, Depends, Request, Response
+from sqlalchemy import select, literal, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from cache_agregados import cache_agregados
+from models import Veiculo, OrdemServico, PecaUtilizada
+from auth import get_current_active_user, Principal
+from utils.response_utils import create_single_item_response, create_error_response
+from utils.http_cache import responder_condicional
+
+router = APIRouter(prefix="/catalogos", tags=["Catálogos"])
+
+# Listas dos formulários: nome na resposta -> coluna com os valores distintos
+CATALOGOS = {
+    "marcas": Veiculo.marca,
+    "modelos": Veiculo.modelo,
+    "status_veiculo": Veiculo.status,
+    "situacoes_os": OrdemServico.situacao_os,
+    "manutencoes": OrdemServico.manutencao,
+    "sistemas": OrdemServico.sistema_afetado,
+    "fichas": PecaUtilizada.num_ficha,
+    "pecas": PecaUtilizada.peca_utilizada,
+}
+
+# O snapshot só é refeito quando uma dessas colunas muda (ou a tabela recebe inserts/deletes)
+DEPENDENCIAS = tuple(f"{coluna.table.name}.{coluna.key}" for coluna in CATALOGOS.values())
+
+CHAVE_SNAPSHOT = ("catalogos",)
+
+
+async def _montar_snapshot(db: AsyncSession) -> Dict[str, Any]:
+    """Todos os SELECT DISTINCT em um único UNION ALL; a versão é o hash do conteúdo"""
+    consulta = union_all(*(
+        select(literal(nome).label("catalogo"), coluna.label("valor")).distinct()
+        for nome, coluna in CATALOGOS.items()
+    ))
+    listas = {nome: set() for nome in CATALOGOS}
+    for catalogo, valor in (await db.execute(consulta)).all():
+        if valor:
+            listas[catalogo].add(valor)
+
+    catalogos = {nome: sorted(valores) for nome, valores in listas.items()}
+    conteudo = json.dumps(catalogos, ensure_ascii=False, sort_keys=True)
+    versao = hashlib.sha1(conteudo.encode("utf-8")).hexdigest()[:16]
+    return {"versao": versao, "catalogos": catalogos}
+
+
+def _etag(snapshot: Dict[str, Any]) -> str:
+    return f'"catalogos-{snapshot["versao"]}"'
+
+
+@router.get("")
+async def obter_catalogos(
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Listas dos formulários (marcas, modelos, status, situações, manutenções, sistemas, fichas e peças) com versão"""
+    try:
+        # Com o snapshot em memória, nem o 304 nem a resposta completa consultam o banco
+        snapshot = await cache_agregados.obter(CHAVE_SNAPSHOT, DEPENDENCIAS, lambda: _montar_snapshot(db))
+
+        nao_modificada = responder_condicional(request, response, _etag(snapshot))
+        if nao_modificada is not None:
+            return nao_modificada
+
+        return create_single_item_response(snapshot, "Catálogos recuperados com sucesso")
+    except Exception as e:
+        return create_error_response(f"Erro ao listar catálogos: {str(e)}")
@@ -0,0 +1,107 @@
+from datetime import date, timedelta
+from typing import Any, Dict
+from fastapi import APIRouter, Depends
+from sqlalchemy import select, func, literal, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from cache_agregados import cache_agregados
+from models import OrdemServico, Veiculo, Usuario, EncerrarOS
+from auth import get_current_active_user, Principal
+from utils.response_utils import create_single_item_response, create_error_response
+from utils.timezone_utils import get_current_brasil_time
+
+router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
+
+# Tabelas lidas pelas estatísticas (escritas nelas invalidam o cache)
+TABELAS_ESTATISTICAS = ("ordem_servico", "veiculo", "usuario", "encerrar_os")
+
+# Agrupamentos do painel: (chave na resposta, coluna agrupada, filtro)
+AGRUPAMENTOS = (
+    ("os_por_situacao", OrdemServico.situacao_os, None),
+    ("os_por_manutencao", OrdemServico.manutencao, None),
+    ("veiculos_por_status", Veiculo.status, None),
+    ("veiculos_por_su_cia_viatura", Veiculo.su_cia_viatura, None),
+    ("usuarios_por_perfil", Usuario.perfil, None),
+    ("usuarios_ativos_por_perfil", Usuario.perfil, Usuario.ativo == True),
+)
+
+
+def _contagens_agrupadas():
+    """Um GROUP BY por agrupamento, todos em um único UNION ALL (cada um lê só o índice da coluna)"""
+    partes = []
+    for chave, coluna, filtro in AGRUPAMENTOS:
+        parte = select(literal(chave).label("grupo"), coluna.label("valor"), func.count().label("total"))
+        if filtro is not None:
+            parte = parte.where(filtro)
+        partes.append(parte.group_by(coluna))
+    return union_all(*partes)
+
+
+def _contagens_periodo(hoje: date):
+    """OS abertas (data) e encerradas (data_da_manutencao) nos últimos 7 e 30 dias, incluindo hoje"""
+    def contar(coluna, dias):
+        return (
+            select(func.count())
+            .where(coluna >= hoje - timedelta(days=dias - 1), coluna <= hoje)
+            .scalar_subquery()
+        )
+
+    return select(
+        contar(OrdemServico.data, 7),
+        contar(OrdemServico.data, 30),
+        contar(EncerrarOS.data_da_manutencao, 7),
+        contar(EncerrarOS.data_da_manutencao, 30),
+    )
+
+
+async def _calcular_estatisticas(db: AsyncSession, hoje: date) -> Dict[str, Any]:
+    """Estatísticas do painel em duas consultas agregadas, sem carregar linhas das tabelas"""
+    grupos: Dict[str, Dict[str, int]] = {chave: {} for chave, _, _ in AGRUPAMENTOS}
+    for grupo, valor, total in (await db.execute(_contagens_agrupadas())).all():
+        grupos[grupo][valor if valor is not None else "SEM_VALOR"] = total
+
+    abertas_7, abertas_30, encerradas_7, encerradas_30 = (await db.execute(_contagens_periodo(hoje))).one()
+
+    return {
+        "data_referencia": hoje,
+        "ordens_servico": {
+            "total": sum(grupos["os_por_situacao"].values()),
+            "por_situacao": grupos["os_por_situacao"],
+            "por_manutencao": grupos["os_por_manutencao"],
+            "abertas_7_dias": abertas_7,
+            "abertas_30_dias": abertas_30,
+            "encerradas_7_dias": encerradas_7,
+            "encerradas_30_dias": encerradas_30
+        },
+        "veiculos": {
+            "total": sum(grupos["veiculos_por_status"].values()),
+            "por_status": grupos["veiculos_por_status"],
+            "por_su_cia_viatura": grupos["veiculos_por_su_cia_viatura"]
+        },
+        "usuarios": {
+            "total": sum(grupos["usuarios_por_perfil"].values()),
+            "por_perfil": grupos["usuarios_por_perfil"]
+        },
+        "usuarios_ativos": {
+            "total": sum(grupos["usuarios_ativos_por_perfil"].values()),
+            "por_perfil": grupos["usuarios_ativos_por_perfil"]
+        }
+    }
+
+
+@router.get("/stats")
+async def obter_estatisticas(
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Contagens do painel calculadas no banco (GROUP BY), em vez de listar as tabelas no cliente"""
+    try:
+        hoje = get_current_brasil_time().date()
+        estatisticas = await cache_agregados.obter(
+            ("dashboard_stats", hoje),
+            TABELAS_ESTATISTICAS,
+            lambda: _calcular_estatisticas(db, hoje)
+        )
+        return create_single_item_response(estatisticas, "Estatísticas recuperadas com sucesso")
+    except Exception as e:
+        return create_error_response(f"Erro ao calcular estatísticas: {str(e)}")
@@ -1,48 +1,71 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from database import get_async_db
 from models import EncerrarOS, OrdemServico, Usuario, Veiculo
 from schemas import EncerrarOS as EncerrarOSSchema, EncerrarOSCreate, EncerrarOSUpdate
-from auth import get_current_active_user
+from auth import get_current_active_user, Principal
+from utils.date_utils import parse_data
 from utils.response_utils import (
     create_paginated_response, create_single_item_response, create_create_response,
     create_update_response, create_delete_response, create_not_found_response,
     create_validation_error_response, create_list_response, create_error_response
 )
+from utils.paginacao import resolver_ordenacao, paginar
+from contagem import contar_total
+from versoes import validadores_lista
+from utils.http_cache import responder_condicional, parametros_normalizados
 from datetime import datetime
 
 router = APIRouter(prefix="/encerrar-os", tags=["Encerrar OS"])
 
+CAMPOS_ORDENACAO = ("data_da_manutencao", "created_at", "id")
+# Tabelas exibidas na listagem: as versões delas formam o ETag
+TABELAS_LISTAGEM = ("encerrar_os", "usuario")
+
 @router.get("/")
 async def listar_encerramentos_os(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0, description="Número de registros para pular"),
     limit: int = Query(100, ge=1, le=1000, description="Número máximo de registros"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (next_cursor)"),
+    with_total: Optional[bool] = Query(None, description="Calcular o total (padrão: só sem cursor)"),
+    sort: Optional[str] = Query(None, description="Ordenação: data_da_manutencao, created_at ou id, com asc/desc (padrão: id asc)"),
     search: Optional[str] = Query(None, description="Termo de busca no nome do mecânico"),
     os_id: Optional[int] = Query(None, description="Filtrar por ID da ordem de serviço"),
     usuario_id: Optional[int] = Query(None, description="Filtrar por usuário"),
     situacao_os: Optional[str] = Query(None, description="Filtrar por situação da OS"),
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista encerramentos de OS com paginação e filtros"""
     try:
-        query = db.query(EncerrarOS)
+        ordenacao = resolver_ordenacao(sort, CAMPOS_ORDENACAO, "id asc")
+        validadores = await validadores_lista(db, TABELAS_LISTAGEM, current_user.id, parametros_normalizados(request))
+        nao_modificada = responder_condicional(request, response, *validadores)
+        if nao_modificada is not None:
+            return nao_modificada
+        query = select(EncerrarOS)
         
         if search:
-            query = query.filter(EncerrarOS.nome_mecanico.contains(search))
+            query = query.where(EncerrarOS.nome_mecanico.contains(search))
         
         if os_id:
-            query = query.filter(EncerrarOS.abrir_os_id == os_id)
+            query = query.where(EncerrarOS.abrir_os_id == os_id)
         
         if usuario_id:
-            query = query.filter(EncerrarOS.usuario_id == usuario_id)
+            query = query.where(EncerrarOS.usuario_id == usuario_id)
         
         if situacao_os:
-            query = query.filter(EncerrarOS.situacao_os == situacao_os)
+            query = query.where(EncerrarOS.situacao_os == situacao_os)
         
-        total = query.count()
-        encerramentos = query.offset(skip).limit(limit).all()
+        total, total_exato = await contar_total(db, query, EncerrarOS, with_total, cursor)
+        encerramentos, next_cursor = await paginar(
+            db, query, EncerrarOS, ordenacao, cursor, skip, limit, opcoes=(joinedload(EncerrarOS.usuario),)
+        )
         
         items = []
         for encerramento in encerramentos:
@@ -63,7 +86,7 @@ async def listar_encerramentos_os(
                 } if encerramento.usuario else None
             })
         
-        pages = (total + limit - 1) // limit
+        pages = (total + limit - 1) // limit if total is not None else None
         
         return create_paginated_response(
             items=items,
@@ -71,7 +94,9 @@ async def listar_encerramentos_os(
             page=skip // limit + 1,
             size=limit,
             pages=pages,
-            message="Encerramentos de OS listados com sucesso"
+            message="Encerramentos de OS listados com sucesso",
+            next_cursor=next_cursor,
+            total_exato=total_exato
         )
         
     except Exception as e:
@@ -80,12 +105,12 @@ async def listar_encerramentos_os(
 @router.get("/{encerramento_id}")
 async def obter_encerramento_os(
     encerramento_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtém um encerramento de OS específico"""
     try:
-        encerramento = db.query(EncerrarOS).filter(EncerrarOS.id == encerramento_id).first()
+        encerramento = await db.scalar(select(EncerrarOS).options(joinedload(EncerrarOS.usuario)).where(EncerrarOS.id == encerramento_id))
         if not encerramento:
             return create_not_found_response("Encerramento de OS")
         
@@ -114,13 +139,13 @@ async def obter_encerramento_os(
 @router.post("/")
 async def criar_encerramento_os(
     encerramento_data: EncerrarOSCreate,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cria um novo encerramento de OS"""
     try:
         # Verificar se a ordem de serviço existe
-        ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == encerramento_data.abrir_os_id).first()
+        ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == encerramento_data.abrir_os_id))
         if not ordem_servico:
             return create_validation_error_response(
                 ["Ordem de serviço não encontrada"],
@@ -128,7 +153,7 @@ async def criar_encerramento_os(
             )
         
         # Verificar se já existe um encerramento para esta OS
-        existing_encerramento = db.query(EncerrarOS).filter(EncerrarOS.abrir_os_id == encerramento_data.abrir_os_id).first()
+        existing_encerramento = await db.scalar(select(EncerrarOS).where(EncerrarOS.abrir_os_id == encerramento_data.abrir_os_id))
         if existing_encerramento:
             return create_validation_error_response(
                 ["Já existe um encerramento para esta ordem de serviço"],
@@ -143,7 +168,7 @@ async def criar_encerramento_os(
             )
         
         # Buscar informações do veículo para auto-preencher modelo_veiculo
-        veiculo = db.query(Veiculo).filter(Veiculo.id == ordem_servico.veiculo_id).first()
+        veiculo = await db.scalar(select(Veiculo).where(Veiculo.id == ordem_servico.veiculo_id))
         modelo_veiculo = veiculo.modelo if veiculo else "Não informado"
         
         # Auto-preencher campos se não fornecidos
@@ -164,8 +189,8 @@ async def criar_encerramento_os(
         )
         
         db.add(db_encerramento)
-        db.commit()
-        db.refresh(db_encerramento)
+        await db.commit()
+        await db.refresh(db_encerramento)
         
         encerramento_data_response = {
             "id": db_encerramento.id,
@@ -188,18 +213,18 @@ async def criar_encerramento_os(
 async def atualizar_encerramento_os(
     encerramento_id: int,
     encerramento_data: EncerrarOSUpdate,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Atualiza um encerramento de OS"""
     try:
-        encerramento = db.query(EncerrarOS).filter(EncerrarOS.id == encerramento_id).first()
+        encerramento = await db.scalar(select(EncerrarOS).where(EncerrarOS.id == encerramento_id))
         if not encerramento:
             return create_not_found_response("Encerramento de OS")
         
         # Verificar se a ordem de serviço existe (se foi alterada)
         if encerramento_data.abrir_os_id and encerramento_data.abrir_os_id != encerramento.abrir_os_id:
-            ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == encerramento_data.abrir_os_id).first()
+            ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == encerramento_data.abrir_os_id))
             if not ordem_servico:
                 return create_validation_error_response(
                     ["Ordem de serviço não encontrada"],
@@ -207,10 +232,10 @@ async def atualizar_encerramento_os(
                 )
             
             # Verificar se já existe um encerramento para a nova OS
-            existing_encerramento = db.query(EncerrarOS).filter(
+            existing_encerramento = await db.scalar(select(EncerrarOS).where(
                 EncerrarOS.abrir_os_id == encerramento_data.abrir_os_id,
                 EncerrarOS.id != encerramento_id
-            ).first()
+            ))
             if existing_encerramento:
                 return create_validation_error_response(
                     ["Já existe um encerramento para esta ordem de serviço"],
@@ -222,8 +247,8 @@ async def atualizar_encerramento_os(
         for field, value in update_data.items():
             setattr(encerramento, field, value)
         
-        db.commit()
-        db.refresh(encerramento)
+        await db.commit()
+        await db.refresh(encerramento)
         
         encerramento_data_response = {
             "id": encerramento.id,
@@ -245,18 +270,18 @@ async def atualizar_encerramento_os(
 @router.delete("/{encerramento_id}")
 async def deletar_encerramento_os(
     encerramento_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Deleta um encerramento de OS"""
     try:
-        encerramento = db.query(EncerrarOS).filter(EncerrarOS.id == encerramento_id).first()
+        encerramento = await db.scalar(select(EncerrarOS).where(EncerrarOS.id == encerramento_id))
         if not encerramento:
             return create_not_found_response("Encerramento de OS")
         
         # Verificar se há retiradas de viatura associadas
         from models import RetiradaViatura
-        retiradas_count = db.query(RetiradaViatura).filter(RetiradaViatura.encerrar_os_id == encerramento_id).count()
+        retiradas_count = await db.scalar(select(func.count()).select_from(RetiradaViatura).where(RetiradaViatura.encerrar_os_id == encerramento_id))
         if retiradas_count > 0:
             return create_validation_error_response(
                 ["Não é possível deletar um encerramento que possui retiradas de viatura"],
@@ -264,12 +289,12 @@ async def deletar_encerramento_os(
             )
         
         # Reverter a situação da OS para ABERTA
-        ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == encerramento.abrir_os_id).first()
+        ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == encerramento.abrir_os_id))
         if ordem_servico:
             ordem_servico.situacao_os = "ABERTA"
         
-        db.delete(encerramento)
-        db.commit()
+        await db.delete(encerramento)
+        await db.commit()
         
         return create_delete_response("Encerramento de OS deletado com sucesso")
         
@@ -279,17 +304,17 @@ async def deletar_encerramento_os(
 @router.get("/os/{os_id}/encerramento")
 async def obter_encerramento_por_os(
     os_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtém o encerramento de uma ordem de serviço específica"""
     try:
         # Verificar se a OS existe
-        ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == os_id).first()
+        ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == os_id))
         if not ordem_servico:
             return create_not_found_response("Ordem de serviço")
         
-        encerramento = db.query(EncerrarOS).filter(EncerrarOS.abrir_os_id == os_id).first()
+        encerramento = await db.scalar(select(EncerrarOS).options(joinedload(EncerrarOS.usuario)).where(EncerrarOS.abrir_os_id == os_id))
         if not encerramento:
             return create_not_found_response("Encerramento de OS")
         
@@ -318,8 +343,8 @@ async def obter_encerramento_por_os(
 @router.post("/simplificado")
 async def encerrar_os_simplificado(
     dados: dict,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Encerra uma OS de forma simplificada, requerendo apenas campos básicos"""
     try:
@@ -342,8 +367,15 @@ async def encerrar_os_simplificado(
                 "Campo obrigatório não informado"
             )
         
+        data_da_manutencao = parse_data(dados["data_da_manutencao"])
+        if data_da_manutencao is None:
+            return create_validation_error_response(
+                ["Data da manutenção inválida; use DD/MM/YYYY ou YYYY-MM-DD"],
+                "Data inválida"
+            )
+        
         # Verificar se a ordem de serviço existe
-        ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == dados["abrir_os_id"]).first()
+        ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == dados["abrir_os_id"]))
         if not ordem_servico:
             return create_validation_error_response(
                 ["Ordem de serviço não encontrada"],
@@ -351,7 +383,7 @@ async def encerrar_os_simplificado(
             )
         
         # Verificar se já existe um encerramento para esta OS
-        existing_encerramento = db.query(EncerrarOS).filter(EncerrarOS.abrir_os_id == dados["abrir_os_id"]).first()
+        existing_encerramento = await db.scalar(select(EncerrarOS).where(EncerrarOS.abrir_os_id == dados["abrir_os_id"]))
         if existing_encerramento:
             return create_validation_error_response(
                 ["Já existe um encerramento para esta ordem de serviço"],
@@ -366,7 +398,7 @@ async def encerrar_os_simplificado(
             )
         
         # Buscar informações do veículo para auto-preencher modelo_veiculo
-        veiculo = db.query(Veiculo).filter(Veiculo.id == ordem_servico.veiculo_id).first()
+        veiculo = await db.scalar(select(Veiculo).where(Veiculo.id == ordem_servico.veiculo_id))
         modelo_veiculo = veiculo.modelo if veiculo else "Não informado"
         
         # Atualizar a situação da OS para FECHADA
@@ -375,7 +407,7 @@ async def encerrar_os_simplificado(
         
         db_encerramento = EncerrarOS(
             nome_mecanico=dados["nome_mecanico"],
-            data_da_manutencao=dados["data_da_manutencao"],
+            data_da_manutencao=data_da_manutencao,
             situacao_os="FECHADA",
             tempo_total="00:00",  # Valor padrão
             abrir_os_id=dados["abrir_os_id"],
@@ -384,8 +416,8 @@ async def encerrar_os_simplificado(
         )
         
         db.add(db_encerramento)
-        db.commit()
-        db.refresh(db_encerramento)
+        await db.commit()
+        await db.refresh(db_encerramento)
         
         encerramento_data_response = {
             "id": db_encerramento.id,
@@ -1,70 +1,96 @@
 from typing import List, Optional
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session, joinedload
-from database import get_db
-from models import OrdemServico, Veiculo, Usuario, EncerrarOS, RetiradaViatura
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from database import get_async_db
+from models import OrdemServico, Veiculo, Usuario, EncerrarOS, RetiradaViatura, ServicoRealizado, PecaUtilizada
 from schemas import OrdemServico as OrdemServicoSchema, OrdemServicoCreate, OrdemServicoUpdate, MessageResponse, PaginatedResponse
-from auth import get_current_active_user
+from auth import get_current_active_user, Principal
+from utils.date_utils import parse_data
+from utils.numero_utils import formatar_minutos
+from utils.paginacao import resolver_ordenacao, paginar
+from contagem import contar_total
+from versoes import validadores_lista, validadores_entidade
+from utils.http_cache import responder_condicional, parametros_normalizados
+from busca_os import aplicar_busca
 
 router = APIRouter(prefix="/ordens-servico", tags=["Ordens de Serviço"])
 
+CAMPOS_ORDENACAO = ("data", "created_at", "id")
+# Tabelas exibidas na listagem: as versões delas formam o ETag
+TABELAS_LISTAGEM = ("ordem_servico", "veiculo", "usuario")
+# Tabelas relacionadas exibidas no detalhe da OS
+TABELAS_DETALHE = ("veiculo", "usuario", "encerrar_os", "retirada_viatura")
+# Partes da OS completa que podem ser pedidas em include=
+PARTES_COMPLETO = ("veiculo", "usuario", "servicos", "pecas", "encerramento", "retirada")
+
 @router.get("/")
 async def listar_ordens_servico(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0, description="Número de registros para pular"),
     limit: int = Query(100, ge=1, le=1000, description="Número máximo de registros"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (next_cursor)"),
+    with_total: Optional[bool] = Query(None, description="Calcular o total (padrão: só sem cursor)"),
+    sort: Optional[str] = Query(None, description="Ordenação: data, created_at ou id, com asc/desc (padrão: data desc)"),
     search: Optional[str] = Query(None, description="Termo de busca"),
     situacao: Optional[str] = Query(None, description="Filtrar por situação"),
     manutencao: Optional[str] = Query(None, description="Filtrar por tipo de manutenção"),
     veiculo_id: Optional[int] = Query(None, description="Filtrar por veículo"),
     data_inicio: Optional[str] = Query(None, description="Data de início (DD/MM/YYYY)"),
     data_fim: Optional[str] = Query(None, description="Data de fim (DD/MM/YYYY)"),
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista ordens de serviço com paginação e filtros"""
-    query = db.query(OrdemServico).options(
-        joinedload(OrdemServico.veiculo),
-        joinedload(OrdemServico.usuario)
-    )
+    try:
+        ordenacao = resolver_ordenacao(sort, CAMPOS_ORDENACAO, "data desc")
+        validadores = await validadores_lista(db, TABELAS_LISTAGEM, current_user.id, parametros_normalizados(request))
+        nao_modificada = responder_condicional(request, response, *validadores)
+        if nao_modificada is not None:
+            return nao_modificada
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    query = select(OrdemServico)
+    relevancia = None
     
     if search:
-        query = query.filter(
-            (OrdemServico.problema_apresentado.contains(search)) |
-            (OrdemServico.sistema_afetado.contains(search)) |
-            (OrdemServico.causa_da_avaria.contains(search)) |
-            (OrdemServico.hodometro.contains(search))
-        )
+        # Índice de texto (FTS5/FULLTEXT) com prefixo, sem acentos e por relevância
+        query, relevancia = aplicar_busca(query, search)
+        # Relevância não gera cursor: com sort/cursor vale a ordenação pedida
+        if sort or cursor:
+            relevancia = None
     
     if situacao:
-        query = query.filter(OrdemServico.situacao_os == situacao)
+        query = query.where(OrdemServico.situacao_os == situacao)
     
     if manutencao:
-        query = query.filter(OrdemServico.manutencao == manutencao)
+        query = query.where(OrdemServico.manutencao == manutencao)
     
     if veiculo_id:
-        query = query.filter(OrdemServico.veiculo_id == veiculo_id)
-    
-    if data_inicio:
-        # Converter data DD/MM/YYYY para comparação
-        try:
-            dia, mes, ano = data_inicio.split('/')
-            data_inicio_convertida = f"{ano}-{mes}-{dia}"
-            query = query.filter(OrdemServico.data >= data_inicio_convertida)
-        except:
-            pass
-    
-    if data_fim:
-        # Converter data DD/MM/YYYY para comparação
-        try:
-            dia, mes, ano = data_fim.split('/')
-            data_fim_convertida = f"{ano}-{mes}-{dia}"
-            query = query.filter(OrdemServico.data <= data_fim_convertida)
-        except:
-            pass
-    
-    total = query.count()
-    ordens = query.offset(skip).limit(limit).all()
+        query = query.where(OrdemServico.veiculo_id == veiculo_id)
+    
+    # Intervalo de datas (DD/MM/YYYY ou ISO) como range scan no índice de data
+    data_inicio_convertida = parse_data(data_inicio)
+    if data_inicio_convertida:
+        query = query.where(OrdemServico.data >= data_inicio_convertida)
+    
+    data_fim_convertida = parse_data(data_fim)
+    if data_fim_convertida:
+        query = query.where(OrdemServico.data <= data_fim_convertida)
+    
+    total, total_exato = await contar_total(db, query, OrdemServico, with_total, cursor)
+    try:
+        ordens, next_cursor = await paginar(
+            db, query, OrdemServico, ordenacao, cursor, skip, limit,
+            opcoes=(joinedload(OrdemServico.veiculo), joinedload(OrdemServico.usuario)),
+            relevancia=relevancia
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     
     items = []
     for ordem in ordens:
@@ -97,7 +123,7 @@ async def listar_ordens_servico(
             "updated_at": ordem.updated_at
         })
     
-    pages = (total + limit - 1) // limit
+    pages = (total + limit - 1) // limit if total is not None else None
     
     from utils.response_utils import create_paginated_response
     
@@ -107,20 +133,34 @@ async def listar_ordens_servico(
         page=skip // limit + 1,
         size=limit,
         pages=pages,
-        message="Dados recuperados com sucesso"
+        message="Dados recuperados com sucesso",
+        next_cursor=next_cursor,
+        total_exato=total_exato
     )
 
 @router.get("/{ordem_id}")
 async def obter_ordem_servico(
     ordem_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtém uma ordem de serviço específica"""
-    ordem = db.query(OrdemServico).options(
+    validadores = await validadores_entidade(db, OrdemServico, ordem_id, TABELAS_DETALHE)
+    if validadores is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Ordem de serviço não encontrada"
+        )
+    nao_modificada = responder_condicional(request, response, *validadores)
+    if nao_modificada is not None:
+        return nao_modificada
+    
+    ordem = await db.scalar(select(OrdemServico).options(
         joinedload(OrdemServico.veiculo),
         joinedload(OrdemServico.usuario)
-    ).filter(OrdemServico.id == ordem_id).first()
+    ).where(OrdemServico.id == ordem_id))
     
     if not ordem:
         raise HTTPException(
@@ -129,14 +169,14 @@ async def obter_ordem_servico(
         )
     
     # Buscar informações de encerramento
-    encerramento = db.query(EncerrarOS).filter(EncerrarOS.abrir_os_id == ordem_id).first()
+    encerramento = await db.scalar(select(EncerrarOS).where(EncerrarOS.abrir_os_id == ordem_id))
     
     # Buscar informações de retirada se existir encerramento
     retirada_viatura = None
     if encerramento:
-        retirada_viatura = db.query(RetiradaViatura).options(
+        retirada_viatura = await db.scalar(select(RetiradaViatura).options(
             joinedload(RetiradaViatura.usuario)
-        ).filter(RetiradaViatura.encerrar_os_id == encerramento.id).first()
+        ).where(RetiradaViatura.encerrar_os_id == encerramento.id))
     
     # Montar resposta com informações adicionais
     ordem_data = {
@@ -198,15 +238,195 @@ async def obter_ordem_servico(
         message="Ordem de serviço encontrada com sucesso"
     )
 
+@router.get("/{ordem_id}/completo")
+async def obter_ordem_servico_completa(
+    ordem_id: int,
+    include: Optional[str] = Query(
+        None,
+        description="Partes separadas por vírgula: veiculo, usuario, servicos, pecas, encerramento, retirada (padrão: todas)"
+    ),
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    OS com veículo, usuário, serviços, peças, encerramento, retiradas e totais em uma chamada.
+    Uma consulta para a OS (veículo e usuário por JOIN) e uma por coleção pedida (selectinload).
+    """
+    partes = set(PARTES_COMPLETO)
+    if include:
+        partes = {parte.strip() for parte in include.split(",") if parte.strip()}
+        invalidas = sorted(partes - set(PARTES_COMPLETO))
+        if invalidas:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"include inválido: {', '.join(invalidas)}. Use: {', '.join(PARTES_COMPLETO)}"
+            )
+    
+    opcoes = []
+    if "veiculo" in partes:
+        opcoes.append(joinedload(OrdemServico.veiculo))
+    if "usuario" in partes:
+        opcoes.append(joinedload(OrdemServico.usuario))
+    if "servicos" in partes:
+        opcoes.append(selectinload(OrdemServico.servicos_realizados).joinedload(ServicoRealizado.usuario))
+    if "pecas" in partes:
+        opcoes.append(selectinload(OrdemServico.pecas_utilizadas).joinedload(PecaUtilizada.usuario))
+    if "encerramento" in partes or "retirada" in partes:
+        # Encerramento e retiradas vêm na mesma consulta
+        subopcoes = [joinedload(EncerrarOS.usuario)]
+        if "retirada" in partes:
+            subopcoes.append(joinedload(EncerrarOS.retiradas_viatura).joinedload(RetiradaViatura.usuario))
+        opcoes.append(selectinload(OrdemServico.encerramentos).options(*subopcoes))
+    
+    ordem = await db.scalar(select(OrdemServico).options(*opcoes).where(OrdemServico.id == ordem_id))
+    if not ordem:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Ordem de serviço não encontrada"
+        )
+    
+    def usuario_resumido(usuario):
+        return {
+            "id": usuario.id,
+            "username": usuario.username,
+            "nome_completo": usuario.nome_completo
+        } if usuario else None
+    
+    ordem_data = {
+        "id": ordem.id,
+        "data": ordem.data,
+        "veiculo_id": ordem.veiculo_id,
+        "hodometro": ordem.hodometro,
+        "hodometro_km": ordem.hodometro_km,
+        "problema_apresentado": ordem.problema_apresentado,
+        "sistema_afetado": ordem.sistema_afetado,
+        "causa_da_avaria": ordem.causa_da_avaria,
+        "manutencao": ordem.manutencao,
+        "situacao_os": ordem.situacao_os,
+        "usuario_id": ordem.usuario_id,
+        "perfil": ordem.perfil,
+        "created_at": ordem.created_at,
+        "updated_at": ordem.updated_at
+    }
+    resumo = {}
+    
+    if "veiculo" in partes:
+        ordem_data["veiculo"] = {
+            "id": ordem.veiculo.id,
+            "marca": ordem.veiculo.marca,
+            "modelo": ordem.veiculo.modelo,
+            "placa": ordem.veiculo.placa,
+            "patrimonio": ordem.veiculo.patrimonio,
+            "su_cia_viatura": ordem.veiculo.su_cia_viatura,
+            "status": ordem.veiculo.status
+        } if ordem.veiculo else None
+    
+    if "usuario" in partes:
+        usuario = usuario_resumido(ordem.usuario)
+        if usuario:
+            usuario["perfil"] = ordem.usuario.perfil
+        ordem_data["usuario"] = usuario
+    
+    if "servicos" in partes:
+        servicos = sorted(ordem.servicos_realizados, key=lambda servico: servico.id)
+        ordem_data["servicos_realizados"] = [
+            {
+                "id": servico.id,
+                "servico_realizado": servico.servico_realizado,
+                "tempo_de_servico_realizado": servico.tempo_de_servico_realizado,
+                "tempo_minutos": servico.tempo_minutos,
+                "usuario_id": servico.usuario_id,
+                "created_at": servico.created_at,
+                "usuario": usuario_resumido(servico.usuario)
+            } for servico in servicos
+        ]
+        total_minutos = sum(servico.tempo_minutos or 0 for servico in servicos)
+        resumo.update({
+            "total_servicos": len(servicos),
+            "tempo_total_servicos": formatar_minutos(total_minutos),
+            "tempo_total_servicos_minutos": total_minutos
+        })
+    
+    if "pecas" in partes:
+        pecas = sorted(ordem.pecas_utilizadas, key=lambda peca: peca.id)
+        ordem_data["pecas_utilizadas"] = [
+            {
+                "id": peca.id,
+                "peca_utilizada": peca.peca_utilizada,
+                "num_ficha": peca.num_ficha,
+                "qtd": peca.qtd,
+                "qtd_unidades": peca.qtd_unidades,
+                "usuario_id": peca.usuario_id,
+                "created_at": peca.created_at,
+                "usuario": usuario_resumido(peca.usuario)
+            } for peca in pecas
+        ]
+        resumo.update({
+            "total_pecas": sum(peca.qtd_unidades or 0 for peca in pecas),
+            "total_pecas_diferentes": len(pecas)
+        })
+    
+    encerramento = None
+    if ("encerramento" in partes or "retirada" in partes) and ordem.encerramentos:
+        encerramento = min(ordem.encerramentos, key=lambda item: item.id)
+    
+    if "encerramento" in partes:
+        ordem_data["encerrar_os"] = {
+            "id": encerramento.id,
+            "nome_mecanico": encerramento.nome_mecanico,
+            "data_da_manutencao": encerramento.data_da_manutencao,
+            "situacao": encerramento.situacao_os,
+            "tempo_total": encerramento.tempo_total,
+            "tempo_total_minutos": encerramento.tempo_total_minutos,
+            "usuario_id": encerramento.usuario_id,
+            "abrir_os_id": encerramento.abrir_os_id,
+            "modelo_veiculo": encerramento.modelo_veiculo,
+            "created_at": encerramento.created_at,
+            "usuario": usuario_resumido(encerramento.usuario)
+        } if encerramento else None
+    
+    if "retirada" in partes:
+        retiradas = sorted(
+            encerramento.retiradas_viatura if encerramento else [],
+            key=lambda retirada: (retirada.data, retirada.id),
+            reverse=True
+        )
+        ordem_data["retiradas_viatura"] = [
+            {
+                "id": retirada.id,
+                "nome": retirada.nome,
+                "data": retirada.data,
+                "encerrar_os_id": retirada.encerrar_os_id,
+                "usuario_id": retirada.usuario_id,
+                "created_at": retirada.created_at,
+                "usuario": usuario_resumido(retirada.usuario)
+            } for retirada in retiradas
+        ]
+        resumo.update({
+            "total_retiradas": len(retiradas),
+            "data_retirada": retiradas[0].data if retiradas else None,
+            "responsavel_retirada": retiradas[0].nome if retiradas else None
+        })
+    
+    if resumo:
+        ordem_data["resumo"] = resumo
+    
+    from utils.response_utils import create_success_response
+    
+    return create_success_response(
+        data=ordem_data,
+        message="Ordem de serviço completa encontrada com sucesso"
+    )
+
 @router.post("/")
 async def criar_ordem_servico(
     ordem_data: OrdemServicoCreate,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cria uma nova ordem de serviço"""
     # Verificar se o veículo existe
-    veiculo = db.query(Veiculo).filter(Veiculo.id == ordem_data.veiculo_id).first()
+    veiculo = await db.scalar(select(Veiculo).where(Veiculo.id == ordem_data.veiculo_id))
     if not veiculo:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -230,14 +450,14 @@ async def criar_ordem_servico(
     # Alterar status do veículo para MANUTENCAO
     veiculo.status = "MANUTENCAO"
     
-    db.commit()
-    db.refresh(db_ordem)
+    await db.commit()
+    await db.refresh(db_ordem)
     
     # Retornar com dados do veículo e usuário
-    ordem_completa = db.query(OrdemServico).options(
+    ordem_completa = await db.scalar(select(OrdemServico).options(
         joinedload(OrdemServico.veiculo),
         joinedload(OrdemServico.usuario)
-    ).filter(OrdemServico.id == db_ordem.id).first()
+    ).where(OrdemServico.id == db_ordem.id))
     
     from utils.response_utils import create_success_response
     
@@ -250,11 +470,11 @@ async def criar_ordem_servico(
 async def atualizar_ordem_servico(
     ordem_id: int,
     ordem_data: OrdemServicoUpdate,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Atualiza uma ordem de serviço"""
-    ordem = db.query(OrdemServico).filter(OrdemServico.id == ordem_id).first()
+    ordem = await db.scalar(select(OrdemServico).where(OrdemServico.id == ordem_id))
     if not ordem:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -263,7 +483,7 @@ async def atualizar_ordem_servico(
     
     # Verificar se o veículo existe (se foi alterado)
     if ordem_data.veiculo_id and ordem_data.veiculo_id != ordem.veiculo_id:
-        veiculo = db.query(Veiculo).filter(Veiculo.id == ordem_data.veiculo_id).first()
+        veiculo = await db.scalar(select(Veiculo).where(Veiculo.id == ordem_data.veiculo_id))
         if not veiculo:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -281,14 +501,14 @@ async def atualizar_ordem_servico(
     for field, value in update_data.items():
         setattr(ordem, field, value)
     
-    db.commit()
-    db.refresh(ordem)
+    await db.commit()
+    await db.refresh(ordem)
     
     # Retornar com dados do veículo e usuário
-    ordem_atualizada = db.query(OrdemServico).options(
+    ordem_atualizada = await db.scalar(select(OrdemServico).options(
         joinedload(OrdemServico.veiculo),
         joinedload(OrdemServico.usuario)
-    ).filter(OrdemServico.id == ordem.id).first()
+    ).where(OrdemServico.id == ordem.id))
     
     from utils.response_utils import create_success_response
     
@@ -300,11 +520,11 @@ async def atualizar_ordem_servico(
 @router.delete("/{ordem_id}")
 async def deletar_ordem_servico(
     ordem_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Deleta uma ordem de serviço"""
-    ordem = db.query(OrdemServico).filter(OrdemServico.id == ordem_id).first()
+    ordem = await db.scalar(select(OrdemServico).where(OrdemServico.id == ordem_id))
     if not ordem:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -314,9 +534,9 @@ async def deletar_ordem_servico(
     # Verificar se a ordem pode ser deletada (não pode ter serviços ou peças associados)
     from models import ServicoRealizado, PecaUtilizada, EncerrarOS
     
-    servicos_count = db.query(ServicoRealizado).filter(ServicoRealizado.abrir_os_id == ordem_id).count()
-    pecas_count = db.query(PecaUtilizada).filter(PecaUtilizada.abrir_os_id == ordem_id).count()
-    encerramentos_count = db.query(EncerrarOS).filter(EncerrarOS.abrir_os_id == ordem_id).count()
+    servicos_count = await db.scalar(select(func.count()).select_from(ServicoRealizado).where(ServicoRealizado.abrir_os_id == ordem_id))
+    pecas_count = await db.scalar(select(func.count()).select_from(PecaUtilizada).where(PecaUtilizada.abrir_os_id == ordem_id))
+    encerramentos_count = await db.scalar(select(func.count()).select_from(EncerrarOS).where(EncerrarOS.abrir_os_id == ordem_id))
     
     if servicos_count > 0 or pecas_count > 0 or encerramentos_count > 0:
         raise HTTPException(
@@ -324,8 +544,8 @@ async def deletar_ordem_servico(
             detail="Não é possível deletar uma ordem de serviço que possui serviços, peças ou encerramentos associados"
         )
     
-    db.delete(ordem)
-    db.commit()
+    await db.delete(ordem)
+    await db.commit()
     
     from utils.response_utils import create_success_response
     
@@ -336,11 +556,11 @@ async def deletar_ordem_servico(
 
 @router.get("/situacoes/lista")
 async def listar_situacoes(
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista todas as situações disponíveis"""
-    situacoes = db.query(OrdemServico.situacao_os).distinct().all()
+    situacoes = (await db.execute(select(OrdemServico.situacao_os).distinct())).all()
     from utils.response_utils import create_success_response
     
     return create_success_response(
@@ -350,11 +570,11 @@ async def listar_situacoes(
 
 @router.get("/manutencoes/lista")
 async def listar_tipos_manutencao(
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista todos os tipos de manutenção disponíveis"""
-    manutencoes = db.query(OrdemServico.manutencao).distinct().all()
+    manutencoes = (await db.execute(select(OrdemServico.manutencao).distinct())).all()
     from utils.response_utils import create_success_response
     
     return create_success_response(
@@ -364,11 +584,11 @@ async def listar_tipos_manutencao(
 
 @router.get("/sistemas/lista")
 async def listar_sistemas(
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista todos os sistemas disponíveis"""
-    sistemas = db.query(OrdemServico.sistema_afetado).distinct().all()
+    sistemas = (await db.execute(select(OrdemServico.sistema_afetado).distinct())).all()
     from utils.response_utils import create_success_response
     
     return create_success_response(
@@ -1,47 +1,69 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from database import get_async_db
 from models import PecaUtilizada, OrdemServico, Usuario
 from schemas import PecaUtilizada as PecaUtilizadaSchema, PecaUtilizadaCreate, PecaUtilizadaUpdate
-from auth import get_current_active_user
+from auth import get_current_active_user, Principal
 from utils.response_utils import (
     create_paginated_response, create_single_item_response, create_create_response,
     create_update_response, create_delete_response, create_not_found_response,
     create_validation_error_response, create_list_response, create_error_response
 )
+from utils.paginacao import resolver_ordenacao, paginar
+from contagem import contar_total
+from versoes import validadores_lista
+from utils.http_cache import responder_condicional, parametros_normalizados
 
 router = APIRouter(prefix="/pecas-utilizadas", tags=["Peças Utilizadas"])
 
+CAMPOS_ORDENACAO = ("created_at", "id")
+# Tabelas exibidas na listagem: as versões delas formam o ETag
+TABELAS_LISTAGEM = ("peca_utilizada", "usuario")
+
 @router.get("/")
 async def listar_pecas_utilizadas(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0, description="Número de registros para pular"),
     limit: int = Query(100, ge=1, le=1000, description="Número máximo de registros"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (next_cursor)"),
+    with_total: Optional[bool] = Query(None, description="Calcular o total (padrão: só sem cursor)"),
+    sort: Optional[str] = Query(None, description="Ordenação: created_at ou id, com asc/desc (padrão: id asc)"),
     search: Optional[str] = Query(None, description="Termo de busca na peça"),
     os_id: Optional[int] = Query(None, description="Filtrar por ID da ordem de serviço"),
     usuario_id: Optional[int] = Query(None, description="Filtrar por usuário"),
     num_ficha: Optional[str] = Query(None, description="Filtrar por número da ficha"),
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista peças utilizadas com paginação e filtros"""
     try:
-        query = db.query(PecaUtilizada)
+        ordenacao = resolver_ordenacao(sort, CAMPOS_ORDENACAO, "id asc")
+        validadores = await validadores_lista(db, TABELAS_LISTAGEM, current_user.id, parametros_normalizados(request))
+        nao_modificada = responder_condicional(request, response, *validadores)
+        if nao_modificada is not None:
+            return nao_modificada
+        query = select(PecaUtilizada)
         
         if search:
-            query = query.filter(PecaUtilizada.peca_utilizada.contains(search))
+            query = query.where(PecaUtilizada.peca_utilizada.contains(search))
         
         if os_id:
-            query = query.filter(PecaUtilizada.abrir_os_id == os_id)
+            query = query.where(PecaUtilizada.abrir_os_id == os_id)
         
         if usuario_id:
-            query = query.filter(PecaUtilizada.usuario_id == usuario_id)
+            query = query.where(PecaUtilizada.usuario_id == usuario_id)
         
         if num_ficha:
-            query = query.filter(PecaUtilizada.num_ficha.contains(num_ficha))
+            query = query.where(PecaUtilizada.num_ficha.contains(num_ficha))
         
-        total = query.count()
-        pecas = query.offset(skip).limit(limit).all()
+        total, total_exato = await contar_total(db, query, PecaUtilizada, with_total, cursor)
+        pecas, next_cursor = await paginar(
+            db, query, PecaUtilizada, ordenacao, cursor, skip, limit, opcoes=(joinedload(PecaUtilizada.usuario),)
+        )
         
         items = []
         for peca in pecas:
@@ -60,7 +82,7 @@ async def listar_pecas_utilizadas(
                 } if peca.usuario else None
             })
         
-        pages = (total + limit - 1) // limit
+        pages = (total + limit - 1) // limit if total is not None else None
         
         return create_paginated_response(
             items=items,
@@ -68,7 +90,9 @@ async def listar_pecas_utilizadas(
             page=skip // limit + 1,
             size=limit,
             pages=pages,
-            message="Peças utilizadas listadas com sucesso"
+            message="Peças utilizadas listadas com sucesso",
+            next_cursor=next_cursor,
+            total_exato=total_exato
         )
         
     except Exception as e:
@@ -77,12 +101,12 @@ async def listar_pecas_utilizadas(
 @router.get("/{peca_id}")
 async def obter_peca_utilizada(
     peca_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtém uma peça utilizada específica"""
     try:
-        peca = db.query(PecaUtilizada).filter(PecaUtilizada.id == peca_id).first()
+        peca = await db.scalar(select(PecaUtilizada).options(joinedload(PecaUtilizada.usuario)).where(PecaUtilizada.id == peca_id))
         if not peca:
             return create_not_found_response("Peça utilizada")
         
@@ -109,13 +133,13 @@ async def obter_peca_utilizada(
 @router.post("/")
 async def criar_peca_utilizada(
     peca_data: PecaUtilizadaCreate,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cria uma nova peça utilizada"""
     try:
         # Verificar se a ordem de serviço existe
-        ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == peca_data.abrir_os_id).first()
+        ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == peca_data.abrir_os_id))
         if not ordem_servico:
             return create_validation_error_response(
                 ["Ordem de serviço não encontrada"],
@@ -138,8 +162,8 @@ async def criar_peca_utilizada(
         )
         
         db.add(db_peca)
-        db.commit()
-        db.refresh(db_peca)
+        await db.commit()
+        await db.refresh(db_peca)
         
         peca_data_response = {
             "id": db_peca.id,
@@ -160,18 +184,18 @@ async def criar_peca_utilizada(
 async def atualizar_peca_utilizada(
     peca_id: int,
     peca_data: PecaUtilizadaUpdate,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Atualiza uma peça utilizada"""
     try:
-        peca = db.query(PecaUtilizada).filter(PecaUtilizada.id == peca_id).first()
+        peca = await db.scalar(select(PecaUtilizada).where(PecaUtilizada.id == peca_id))
         if not peca:
             return create_not_found_response("Peça utilizada")
         
         # Verificar se a ordem de serviço existe (se foi alterada)
         if peca_data.abrir_os_id and peca_data.abrir_os_id != peca.abrir_os_id:
-            ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == peca_data.abrir_os_id).first()
+            ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == peca_data.abrir_os_id))
             if not ordem_servico:
                 return create_validation_error_response(
                     ["Ordem de serviço não encontrada"],
@@ -190,8 +214,8 @@ async def atualizar_peca_utilizada(
         for field, value in update_data.items():
             setattr(peca, field, value)
         
-        db.commit()
-        db.refresh(peca)
+        await db.commit()
+        await db.refresh(peca)
         
         peca_data_response = {
             "id": peca.id,
@@ -211,17 +235,17 @@ async def atualizar_peca_utilizada(
 @router.delete("/{peca_id}")
 async def deletar_peca_utilizada(
     peca_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Deleta uma peça utilizada"""
     try:
-        peca = db.query(PecaUtilizada).filter(PecaUtilizada.id == peca_id).first()
+        peca = await db.scalar(select(PecaUtilizada).where(PecaUtilizada.id == peca_id))
         if not peca:
             return create_not_found_response("Peça utilizada")
         
-        db.delete(peca)
-        db.commit()
+        await db.delete(peca)
+        await db.commit()
         
         return create_delete_response("Peça utilizada deletada com sucesso")
         
@@ -231,17 +255,17 @@ async def deletar_peca_utilizada(
 @router.get("/os/{os_id}/pecas")
 async def listar_pecas_por_os(
     os_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista todas as peças utilizadas de uma ordem de serviço específica"""
     try:
         # Verificar se a OS existe
-        ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == os_id).first()
+        ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == os_id))
         if not ordem_servico:
             return create_not_found_response("Ordem de serviço")
         
-        pecas = db.query(PecaUtilizada).filter(PecaUtilizada.abrir_os_id == os_id).all()
+        pecas = (await db.scalars(select(PecaUtilizada).options(joinedload(PecaUtilizada.usuario)).where(PecaUtilizada.abrir_os_id == os_id))).all()
         
         items = []
         for peca in pecas:
@@ -267,12 +291,12 @@ async def listar_pecas_por_os(
 
 @router.get("/fichas/lista")
 async def listar_fichas(
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista todas as fichas disponíveis"""
     try:
-        fichas = db.query(PecaUtilizada.num_ficha).distinct().all()
+        fichas = (await db.execute(select(PecaUtilizada.num_ficha).distinct())).all()
         fichas_list = [ficha[0] for ficha in fichas if ficha[0]]
         
         return create_list_response(fichas_list, "Fichas listadas com sucesso")
@@ -282,12 +306,12 @@ async def listar_fichas(
 
 @router.get("/pecas/lista")
 async def listar_pecas(
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista todas as peças disponíveis"""
     try:
-        pecas = db.query(PecaUtilizada.peca_utilizada).distinct().all()
+        pecas = (await db.execute(select(PecaUtilizada.peca_utilizada).distinct())).all()
         pecas_list = [peca[0] for peca in pecas if peca[0]]
         
         return create_list_response(pecas_list, "Peças listadas com sucesso")
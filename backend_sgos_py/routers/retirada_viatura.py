@@ -1,47 +1,77 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from database import get_async_db
 from models import RetiradaViatura, EncerrarOS, Usuario, OrdemServico, Veiculo
 from schemas import RetiradaViatura as RetiradaViaturaSchema, RetiradaViaturaCreate, RetiradaViaturaUpdate
-from auth import get_current_active_user
+from auth import get_current_active_user, Principal
+from utils.date_utils import parse_data
 from utils.response_utils import (
     create_paginated_response, create_single_item_response, create_create_response,
     create_update_response, create_delete_response, create_not_found_response,
     create_validation_error_response, create_list_response, create_error_response
 )
+from utils.paginacao import resolver_ordenacao, paginar
+from contagem import contar_total
+from versoes import validadores_lista
+from utils.http_cache import responder_condicional, parametros_normalizados
 
 router = APIRouter(prefix="/retirada-viatura", tags=["Retirada de Viatura"])
 
+CAMPOS_ORDENACAO = ("data", "created_at", "id")
+# Tabelas exibidas na listagem: as versões delas formam o ETag
+TABELAS_LISTAGEM = ("retirada_viatura", "encerrar_os", "usuario")
+
 @router.get("/")
 async def listar_retiradas_viatura(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0, description="Número de registros para pular"),
     limit: int = Query(100, ge=1, le=1000, description="Número máximo de registros"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (next_cursor)"),
+    with_total: Optional[bool] = Query(None, description="Calcular o total (padrão: só sem cursor)"),
+    sort: Optional[str] = Query(None, description="Ordenação: data, created_at ou id, com asc/desc (padrão: id asc)"),
     search: Optional[str] = Query(None, description="Termo de busca no nome"),
     encerramento_id: Optional[int] = Query(None, description="Filtrar por ID do encerramento"),
     usuario_id: Optional[int] = Query(None, description="Filtrar por usuário"),
     data: Optional[str] = Query(None, description="Filtrar por data"),
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista retiradas de viatura com paginação e filtros"""
     try:
-        query = db.query(RetiradaViatura)
+        ordenacao = resolver_ordenacao(sort, CAMPOS_ORDENACAO, "id asc")
+        validadores = await validadores_lista(db, TABELAS_LISTAGEM, current_user.id, parametros_normalizados(request))
+        nao_modificada = responder_condicional(request, response, *validadores)
+        if nao_modificada is not None:
+            return nao_modificada
+        query = select(RetiradaViatura)
         
         if search:
-            query = query.filter(RetiradaViatura.nome.contains(search))
+            query = query.where(RetiradaViatura.nome.contains(search))
         
         if encerramento_id:
-            query = query.filter(RetiradaViatura.encerrar_os_id == encerramento_id)
+            query = query.where(RetiradaViatura.encerrar_os_id == encerramento_id)
         
         if usuario_id:
-            query = query.filter(RetiradaViatura.usuario_id == usuario_id)
+            query = query.where(RetiradaViatura.usuario_id == usuario_id)
         
         if data:
-            query = query.filter(RetiradaViatura.data == data)
+            data_filtro = parse_data(data)
+            if data_filtro is None:
+                return create_validation_error_response(
+                    ["Data inválida; use DD/MM/YYYY ou YYYY-MM-DD"],
+                    "Filtro de data inválido"
+                )
+            query = query.where(RetiradaViatura.data == data_filtro)
         
-        total = query.count()
-        retiradas = query.offset(skip).limit(limit).all()
+        total, total_exato = await contar_total(db, query, RetiradaViatura, with_total, cursor)
+        retiradas, next_cursor = await paginar(
+            db, query, RetiradaViatura, ordenacao, cursor, skip, limit,
+            opcoes=(joinedload(RetiradaViatura.usuario), joinedload(RetiradaViatura.encerramento_os))
+        )
         
         items = []
         for retirada in retiradas:
@@ -58,14 +88,14 @@ async def listar_retiradas_viatura(
                     "nome_completo": retirada.usuario.nome_completo
                 } if retirada.usuario else None,
                 "encerramento": {
-                    "id": retirada.encerramento.id,
-                    "nome_mecanico": retirada.encerramento.nome_mecanico,
-                    "data_da_manutencao": retirada.encerramento.data_da_manutencao,
-                    "modelo_veiculo": retirada.encerramento.modelo_veiculo
-                } if retirada.encerramento else None
+                    "id": retirada.encerramento_os.id,
+                    "nome_mecanico": retirada.encerramento_os.nome_mecanico,
+                    "data_da_manutencao": retirada.encerramento_os.data_da_manutencao,
+                    "modelo_veiculo": retirada.encerramento_os.modelo_veiculo
+                } if retirada.encerramento_os else None
             })
         
-        pages = (total + limit - 1) // limit
+        pages = (total + limit - 1) // limit if total is not None else None
         
         return create_paginated_response(
             items=items,
@@ -73,7 +103,9 @@ async def listar_retiradas_viatura(
             page=skip // limit + 1,
             size=limit,
             pages=pages,
-            message="Retiradas de viatura listadas com sucesso"
+            message="Retiradas de viatura listadas com sucesso",
+            next_cursor=next_cursor,
+            total_exato=total_exato
         )
         
     except Exception as e:
@@ -82,12 +114,16 @@ async def listar_retiradas_viatura(
 @router.get("/{retirada_id}")
 async def obter_retirada_viatura(
     retirada_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtém uma retirada de viatura específica"""
     try:
-        retirada = db.query(RetiradaViatura).filter(RetiradaViatura.id == retirada_id).first()
+        retirada = await db.scalar(
+            select(RetiradaViatura)
+            .options(joinedload(RetiradaViatura.usuario), joinedload(RetiradaViatura.encerramento_os))
+            .where(RetiradaViatura.id == retirada_id)
+        )
         if not retirada:
             return create_not_found_response("Retirada de viatura")
         
@@ -104,11 +140,11 @@ async def obter_retirada_viatura(
                 "nome_completo": retirada.usuario.nome_completo
             } if retirada.usuario else None,
             "encerramento": {
-                "id": retirada.encerramento.id,
-                "nome_mecanico": retirada.encerramento.nome_mecanico,
-                "data_da_manutencao": retirada.encerramento.data_da_manutencao,
-                "modelo_veiculo": retirada.encerramento.modelo_veiculo
-            } if retirada.encerramento else None
+                "id": retirada.encerramento_os.id,
+                "nome_mecanico": retirada.encerramento_os.nome_mecanico,
+                "data_da_manutencao": retirada.encerramento_os.data_da_manutencao,
+                "modelo_veiculo": retirada.encerramento_os.modelo_veiculo
+            } if retirada.encerramento_os else None
         }
         
         return create_single_item_response(retirada_data, "Retirada de viatura encontrada com sucesso")
@@ -119,13 +155,13 @@ async def obter_retirada_viatura(
 @router.post("/")
 async def criar_retirada_viatura(
     retirada_data: RetiradaViaturaCreate,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cria uma nova retirada de viatura"""
     try:
         # Verificar se o encerramento existe
-        encerramento = db.query(EncerrarOS).filter(EncerrarOS.id == retirada_data.encerrar_os_id).first()
+        encerramento = await db.scalar(select(EncerrarOS).where(EncerrarOS.id == retirada_data.encerrar_os_id))
         if not encerramento:
             return create_validation_error_response(
                 ["Encerramento de OS não encontrado"],
@@ -133,7 +169,7 @@ async def criar_retirada_viatura(
             )
         
         # Verificar se a OS está fechada
-        ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == encerramento.abrir_os_id).first()
+        ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == encerramento.abrir_os_id))
         if not ordem_servico or ordem_servico.situacao_os != "FECHADA":
             return create_validation_error_response(
                 ["Só é possível retirar viatura de OS fechada"],
@@ -147,7 +183,7 @@ async def criar_retirada_viatura(
         encerramento.situacao_os = "RETIRADA"
         
         # Alterar status do veículo para ATIVO (volta ao serviço)
-        veiculo = db.query(Veiculo).filter(Veiculo.id == ordem_servico.veiculo_id).first()
+        veiculo = await db.scalar(select(Veiculo).where(Veiculo.id == ordem_servico.veiculo_id))
         if veiculo:
             veiculo.status = "ATIVO"
         
@@ -159,8 +195,8 @@ async def criar_retirada_viatura(
         )
         
         db.add(db_retirada)
-        db.commit()
-        db.refresh(db_retirada)
+        await db.commit()
+        await db.refresh(db_retirada)
         
         retirada_data_response = {
             "id": db_retirada.id,
@@ -180,18 +216,18 @@ async def criar_retirada_viatura(
 async def atualizar_retirada_viatura(
     retirada_id: int,
     retirada_data: RetiradaViaturaUpdate,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Atualiza uma retirada de viatura"""
     try:
-        retirada = db.query(RetiradaViatura).filter(RetiradaViatura.id == retirada_id).first()
+        retirada = await db.scalar(select(RetiradaViatura).where(RetiradaViatura.id == retirada_id))
         if not retirada:
             return create_not_found_response("Retirada de viatura")
         
         # Verificar se o encerramento existe (se foi alterado)
         if retirada_data.encerrar_os_id and retirada_data.encerrar_os_id != retirada.encerrar_os_id:
-            encerramento = db.query(EncerrarOS).filter(EncerrarOS.id == retirada_data.encerrar_os_id).first()
+            encerramento = await db.scalar(select(EncerrarOS).where(EncerrarOS.id == retirada_data.encerrar_os_id))
             if not encerramento:
                 return create_validation_error_response(
                     ["Encerramento de OS não encontrado"],
@@ -199,7 +235,7 @@ async def atualizar_retirada_viatura(
                 )
             
             # Verificar se a OS está fechada
-            ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == encerramento.abrir_os_id).first()
+            ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == encerramento.abrir_os_id))
             if not ordem_servico or ordem_servico.situacao_os != "FECHADA":
                 return create_validation_error_response(
                     ["Só é possível retirar viatura de OS fechada"],
@@ -211,8 +247,8 @@ async def atualizar_retirada_viatura(
         for field, value in update_data.items():
             setattr(retirada, field, value)
         
-        db.commit()
-        db.refresh(retirada)
+        await db.commit()
+        await db.refresh(retirada)
         
         retirada_data_response = {
             "id": retirada.id,
@@ -231,28 +267,28 @@ async def atualizar_retirada_viatura(
 @router.delete("/{retirada_id}")
 async def deletar_retirada_viatura(
     retirada_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Deleta uma retirada de viatura"""
     try:
-        retirada = db.query(RetiradaViatura).filter(RetiradaViatura.id == retirada_id).first()
+        retirada = await db.scalar(select(RetiradaViatura).where(RetiradaViatura.id == retirada_id))
         if not retirada:
             return create_not_found_response("Retirada de viatura")
         
         # Reverter a situação da OS e encerramento para FECHADA
-        encerramento = db.query(EncerrarOS).filter(EncerrarOS.id == retirada.encerrar_os_id).first()
+        encerramento = await db.scalar(select(EncerrarOS).where(EncerrarOS.id == retirada.encerrar_os_id))
         if encerramento:
             # Reverter encerramento para FECHADA
             encerramento.situacao_os = "FECHADA"
             
             # Reverter OS para FECHADA
-            ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == encerramento.abrir_os_id).first()
+            ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == encerramento.abrir_os_id))
             if ordem_servico:
                 ordem_servico.situacao_os = "FECHADA"
         
-        db.delete(retirada)
-        db.commit()
+        await db.delete(retirada)
+        await db.commit()
         
         return create_delete_response("Retirada de viatura deletada com sucesso")
         
@@ -262,17 +298,17 @@ async def deletar_retirada_viatura(
 @router.get("/encerramento/{encerramento_id}/retiradas")
 async def listar_retiradas_por_encerramento(
     encerramento_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista todas as retiradas de viatura de um encerramento específico"""
     try:
         # Verificar se o encerramento existe
-        encerramento = db.query(EncerrarOS).filter(EncerrarOS.id == encerramento_id).first()
+        encerramento = await db.scalar(select(EncerrarOS).where(EncerrarOS.id == encerramento_id))
         if not encerramento:
             return create_not_found_response("Encerramento de OS")
         
-        retiradas = db.query(RetiradaViatura).filter(RetiradaViatura.encerrar_os_id == encerramento_id).all()
+        retiradas = (await db.scalars(select(RetiradaViatura).options(joinedload(RetiradaViatura.usuario)).where(RetiradaViatura.encerrar_os_id == encerramento_id))).all()
         
         items = []
         for retirada in retiradas:
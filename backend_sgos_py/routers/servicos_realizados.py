@@ -1,43 +1,65 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from database import get_async_db
 from models import ServicoRealizado, OrdemServico, Usuario
 from schemas import ServicoRealizado as ServicoRealizadoSchema, ServicoRealizadoCreate, ServicoRealizadoUpdate
-from auth import get_current_active_user
+from auth import get_current_active_user, Principal
 from utils.response_utils import (
     create_paginated_response, create_single_item_response, create_create_response,
     create_update_response, create_delete_response, create_not_found_response,
     create_validation_error_response, create_list_response, create_error_response
 )
+from utils.paginacao import resolver_ordenacao, paginar
+from contagem import contar_total
+from versoes import validadores_lista
+from utils.http_cache import responder_condicional, parametros_normalizados
 
 router = APIRouter(prefix="/servicos-realizados", tags=["Serviços Realizados"])
 
+CAMPOS_ORDENACAO = ("created_at", "id")
+# Tabelas exibidas na listagem: as versões delas formam o ETag
+TABELAS_LISTAGEM = ("servico_realizado", "usuario")
+
 @router.get("/")
 async def listar_servicos_realizados(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0, description="Número de registros para pular"),
     limit: int = Query(100, ge=1, le=1000, description="Número máximo de registros"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (next_cursor)"),
+    with_total: Optional[bool] = Query(None, description="Calcular o total (padrão: só sem cursor)"),
+    sort: Optional[str] = Query(None, description="Ordenação: created_at ou id, com asc/desc (padrão: id asc)"),
     search: Optional[str] = Query(None, description="Termo de busca no serviço"),
     os_id: Optional[int] = Query(None, description="Filtrar por ID da ordem de serviço"),
     usuario_id: Optional[int] = Query(None, description="Filtrar por usuário"),
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista serviços realizados com paginação e filtros"""
     try:
-        query = db.query(ServicoRealizado)
+        ordenacao = resolver_ordenacao(sort, CAMPOS_ORDENACAO, "id asc")
+        validadores = await validadores_lista(db, TABELAS_LISTAGEM, current_user.id, parametros_normalizados(request))
+        nao_modificada = responder_condicional(request, response, *validadores)
+        if nao_modificada is not None:
+            return nao_modificada
+        query = select(ServicoRealizado)
         
         if search:
-            query = query.filter(ServicoRealizado.servico_realizado.contains(search))
+            query = query.where(ServicoRealizado.servico_realizado.contains(search))
         
         if os_id:
-            query = query.filter(ServicoRealizado.abrir_os_id == os_id)
+            query = query.where(ServicoRealizado.abrir_os_id == os_id)
         
         if usuario_id:
-            query = query.filter(ServicoRealizado.usuario_id == usuario_id)
+            query = query.where(ServicoRealizado.usuario_id == usuario_id)
         
-        total = query.count()
-        servicos = query.offset(skip).limit(limit).all()
+        total, total_exato = await contar_total(db, query, ServicoRealizado, with_total, cursor)
+        servicos, next_cursor = await paginar(
+            db, query, ServicoRealizado, ordenacao, cursor, skip, limit, opcoes=(joinedload(ServicoRealizado.usuario),)
+        )
         
         items = []
         for servico in servicos:
@@ -55,7 +77,7 @@ async def listar_servicos_realizados(
                 } if servico.usuario else None
             })
         
-        pages = (total + limit - 1) // limit
+        pages = (total + limit - 1) // limit if total is not None else None
         
         return create_paginated_response(
             items=items,
@@ -63,7 +85,9 @@ async def listar_servicos_realizados(
             page=skip // limit + 1,
             size=limit,
             pages=pages,
-            message="Serviços realizados listados com sucesso"
+            message="Serviços realizados listados com sucesso",
+            next_cursor=next_cursor,
+            total_exato=total_exato
         )
         
     except Exception as e:
@@ -72,12 +96,12 @@ async def listar_servicos_realizados(
 @router.get("/{servico_id}")
 async def obter_servico_realizado(
     servico_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtém um serviço realizado específico"""
     try:
-        servico = db.query(ServicoRealizado).filter(ServicoRealizado.id == servico_id).first()
+        servico = await db.scalar(select(ServicoRealizado).options(joinedload(ServicoRealizado.usuario)).where(ServicoRealizado.id == servico_id))
         if not servico:
             return create_not_found_response("Serviço realizado")
         
@@ -103,13 +127,13 @@ async def obter_servico_realizado(
 @router.post("/")
 async def criar_servico_realizado(
     servico_data: ServicoRealizadoCreate,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cria um novo serviço realizado"""
     try:
         # Verificar se a ordem de serviço existe
-        ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == servico_data.abrir_os_id).first()
+        ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == servico_data.abrir_os_id))
         if not ordem_servico:
             return create_validation_error_response(
                 ["Ordem de serviço não encontrada"],
@@ -131,8 +155,8 @@ async def criar_servico_realizado(
         )
         
         db.add(db_servico)
-        db.commit()
-        db.refresh(db_servico)
+        await db.commit()
+        await db.refresh(db_servico)
         
         servico_data_response = {
             "id": db_servico.id,
@@ -152,18 +176,18 @@ async def criar_servico_realizado(
 async def atualizar_servico_realizado(
     servico_id: int,
     servico_data: ServicoRealizadoUpdate,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Atualiza um serviço realizado"""
     try:
-        servico = db.query(ServicoRealizado).filter(ServicoRealizado.id == servico_id).first()
+        servico = await db.scalar(select(ServicoRealizado).where(ServicoRealizado.id == servico_id))
         if not servico:
             return create_not_found_response("Serviço realizado")
         
         # Verificar se a ordem de serviço existe (se foi alterada)
         if servico_data.abrir_os_id and servico_data.abrir_os_id != servico.abrir_os_id:
-            ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == servico_data.abrir_os_id).first()
+            ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == servico_data.abrir_os_id))
             if not ordem_servico:
                 return create_validation_error_response(
                     ["Ordem de serviço não encontrada"],
@@ -182,8 +206,8 @@ async def atualizar_servico_realizado(
         for field, value in update_data.items():
             setattr(servico, field, value)
         
-        db.commit()
-        db.refresh(servico)
+        await db.commit()
+        await db.refresh(servico)
         
         servico_data_response = {
             "id": servico.id,
@@ -202,17 +226,17 @@ async def atualizar_servico_realizado(
 @router.delete("/{servico_id}")
 async def deletar_servico_realizado(
     servico_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Deleta um serviço realizado"""
     try:
-        servico = db.query(ServicoRealizado).filter(ServicoRealizado.id == servico_id).first()
+        servico = await db.scalar(select(ServicoRealizado).where(ServicoRealizado.id == servico_id))
         if not servico:
             return create_not_found_response("Serviço realizado")
         
-        db.delete(servico)
-        db.commit()
+        await db.delete(servico)
+        await db.commit()
         
         return create_delete_response("Serviço realizado deletado com sucesso")
         
@@ -222,17 +246,17 @@ async def deletar_servico_realizado(
 @router.get("/os/{os_id}/servicos")
 async def listar_servicos_por_os(
     os_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista todos os serviços realizados de uma ordem de serviço específica"""
     try:
         # Verificar se a OS existe
-        ordem_servico = db.query(OrdemServico).filter(OrdemServico.id == os_id).first()
+        ordem_servico = await db.scalar(select(OrdemServico).where(OrdemServico.id == os_id))
         if not ordem_servico:
             return create_not_found_response("Ordem de serviço")
         
-        servicos = db.query(ServicoRealizado).filter(ServicoRealizado.abrir_os_id == os_id).all()
+        servicos = (await db.scalars(select(ServicoRealizado).options(joinedload(ServicoRealizado.usuario)).where(ServicoRealizado.abrir_os_id == os_id))).all()
         
         items = []
         for servico in servicos:
@@ -1,17 +1,22 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from database import get_db
+from database import get_async_db
 from models import Usuario
 from schemas import Usuario as UsuarioSchema, UsuarioCreate, UsuarioUpdate, MessageResponse, PaginatedResponse
-from auth import get_current_active_user, check_admin_permission, get_password_hash
+from auth import get_current_active_user, get_current_usuario_db, check_admin_permission, get_password_hash_async, invalidar_principal, Principal
 from utils.response_utils import (
     create_paginated_response, create_single_item_response, create_create_response,
     create_update_response, create_delete_response, create_not_found_response,
     create_validation_error_response, create_forbidden_response, create_error_response,
     create_success_response
 )
+from utils.paginacao import resolver_ordenacao, paginar
+from contagem import contar_total
+from versoes import validadores_lista, validadores_entidade
+from utils.http_cache import responder_condicional, parametros_normalizados
 
 # Schema para alterar senha
 class ChangePasswordRequest(BaseModel):
@@ -20,35 +25,49 @@ class ChangePasswordRequest(BaseModel):
 
 router = APIRouter(prefix="/usuarios", tags=["Usuários"])
 
+CAMPOS_ORDENACAO = ("created_at", "username", "id")
+# Tabelas exibidas na listagem: as versões delas formam o ETag
+TABELAS_LISTAGEM = ("usuario",)
+
 @router.get("/")
 async def listar_usuarios(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0, description="Número de registros para pular"),
     limit: int = Query(100, ge=1, le=1000, description="Número máximo de registros"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (next_cursor)"),
+    with_total: Optional[bool] = Query(None, description="Calcular o total (padrão: só sem cursor)"),
+    sort: Optional[str] = Query(None, description="Ordenação: created_at, username ou id, com asc/desc (padrão: id asc)"),
     search: Optional[str] = Query(None, description="Termo de busca"),
     ativo: Optional[bool] = Query(None, description="Filtrar por status ativo"),
     perfil: Optional[str] = Query(None, description="Filtrar por perfil"),
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista usuários com paginação e filtros"""
     try:
-        query = db.query(Usuario)
+        ordenacao = resolver_ordenacao(sort, CAMPOS_ORDENACAO, "id asc")
+        validadores = await validadores_lista(db, TABELAS_LISTAGEM, current_user.id, parametros_normalizados(request))
+        nao_modificada = responder_condicional(request, response, *validadores)
+        if nao_modificada is not None:
+            return nao_modificada
+        query = select(Usuario)
         
         if search:
-            query = query.filter(
+            query = query.where(
                 (Usuario.username.contains(search)) |
                 (Usuario.nome_completo.contains(search)) |
                 (Usuario.email.contains(search))
             )
         
         if ativo is not None:
-            query = query.filter(Usuario.ativo == ativo)
+            query = query.where(Usuario.ativo == ativo)
         
         if perfil:
-            query = query.filter(Usuario.perfil == perfil)
+            query = query.where(Usuario.perfil == perfil)
         
-        total = query.count()
-        usuarios = query.offset(skip).limit(limit).all()
+        total, total_exato = await contar_total(db, query, Usuario, with_total, cursor)
+        usuarios, next_cursor = await paginar(db, query, Usuario, ordenacao, cursor, skip, limit)
         
         items = []
         for usuario in usuarios:
@@ -63,7 +82,7 @@ async def listar_usuarios(
                 "updated_at": usuario.updated_at
             })
         
-        pages = (total + limit - 1) // limit
+        pages = (total + limit - 1) // limit if total is not None else None
         
         return create_paginated_response(
             items=items,
@@ -71,7 +90,9 @@ async def listar_usuarios(
             page=skip // limit + 1,
             size=limit,
             pages=pages,
-            message="Usuários listados com sucesso"
+            message="Usuários listados com sucesso",
+            next_cursor=next_cursor,
+            total_exato=total_exato
         )
         
     except Exception as e:
@@ -80,12 +101,21 @@ async def listar_usuarios(
 @router.get("/{usuario_id}")
 async def obter_usuario(
     usuario_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtém um usuário específico"""
     try:
-        usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
+        validadores = await validadores_entidade(db, Usuario, usuario_id)
+        if validadores is None:
+            return create_not_found_response("Usuário")
+        nao_modificada = responder_condicional(request, response, *validadores)
+        if nao_modificada is not None:
+            return nao_modificada
+        
+        usuario = await db.scalar(select(Usuario).where(Usuario.id == usuario_id))
         if not usuario:
             return create_not_found_response("Usuário")
         
@@ -108,13 +138,13 @@ async def obter_usuario(
 @router.post("/")
 async def criar_usuario(
     usuario_data: UsuarioCreate,
-    current_user: Usuario = Depends(check_admin_permission),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(check_admin_permission),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cria um novo usuário (apenas administradores)"""
     try:
         # Verificar se username já existe
-        existing_user = db.query(Usuario).filter(Usuario.username == usuario_data.username).first()
+        existing_user = await db.scalar(select(Usuario).where(Usuario.username == usuario_data.username))
         if existing_user:
             return create_validation_error_response(
                 ["Username já existe"],
@@ -122,14 +152,14 @@ async def criar_usuario(
             )
         
         # Verificar se email já existe
-        existing_email = db.query(Usuario).filter(Usuario.email == usuario_data.email).first()
+        existing_email = await db.scalar(select(Usuario).where(Usuario.email == usuario_data.email))
         if existing_email:
             return create_validation_error_response(
                 ["Email já existe"],
                 "Email já cadastrado"
             )
         
-        hashed_password = get_password_hash(usuario_data.password)
+        hashed_password = await get_password_hash_async(usuario_data.password)
         db_usuario = Usuario(
             username=usuario_data.username,
             email=usuario_data.email,
@@ -140,8 +170,8 @@ async def criar_usuario(
         )
         
         db.add(db_usuario)
-        db.commit()
-        db.refresh(db_usuario)
+        await db.commit()
+        await db.refresh(db_usuario)
         
         usuario_data_response = {
             "id": db_usuario.id,
@@ -156,6 +186,8 @@ async def criar_usuario(
         
         return create_create_response(usuario_data_response, "Usuário criado com sucesso")
         
+    except HTTPException:
+        raise
     except Exception as e:
         return create_error_response(f"Erro ao criar usuário: {str(e)}")
 
@@ -163,18 +195,18 @@ async def criar_usuario(
 async def atualizar_usuario(
     usuario_id: int,
     usuario_data: UsuarioUpdate,
-    current_user: Usuario = Depends(check_admin_permission),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(check_admin_permission),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Atualiza um usuário (apenas administradores)"""
     try:
-        usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
+        usuario = await db.scalar(select(Usuario).where(Usuario.id == usuario_id))
         if not usuario:
             return create_not_found_response("Usuário")
         
         # Verificar se username já existe (se foi alterado)
         if usuario_data.username and usuario_data.username != usuario.username:
-            existing_user = db.query(Usuario).filter(Usuario.username == usuario_data.username).first()
+            existing_user = await db.scalar(select(Usuario).where(Usuario.username == usuario_data.username))
             if existing_user:
                 return create_validation_error_response(
                     ["Username já existe"],
@@ -183,7 +215,7 @@ async def atualizar_usuario(
         
         # Verificar se email já existe (se foi alterado)
         if usuario_data.email and usuario_data.email != usuario.email:
-            existing_email = db.query(Usuario).filter(Usuario.email == usuario_data.email).first()
+            existing_email = await db.scalar(select(Usuario).where(Usuario.email == usuario_data.email))
             if existing_email:
                 return create_validation_error_response(
                     ["Email já existe"],
@@ -193,13 +225,16 @@ async def atualizar_usuario(
         # Atualizar campos
         update_data = usuario_data.dict(exclude_unset=True)
         if "password" in update_data:
-            update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+            update_data["hashed_password"] = await get_password_hash_async(update_data.pop("password"))
         
+        username_anterior = usuario.username
         for field, value in update_data.items():
             setattr(usuario, field, value)
         
-        db.commit()
-        db.refresh(usuario)
+        await db.commit()
+        # Depois do commit, para que nenhuma requisição volte a guardar a linha antiga
+        invalidar_principal(usuario_id, username_anterior, usuario_data.username or username_anterior)
+        await db.refresh(usuario)
         
         usuario_data_response = {
             "id": usuario.id,
@@ -214,14 +249,16 @@ async def atualizar_usuario(
         
         return create_update_response(usuario_data_response, "Usuário atualizado com sucesso")
         
+    except HTTPException:
+        raise
     except Exception as e:
         return create_error_response(f"Erro ao atualizar usuário: {str(e)}")
 
 @router.delete("/{usuario_id}")
 async def deletar_usuario(
     usuario_id: int,
-    current_user: Usuario = Depends(check_admin_permission),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(check_admin_permission),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Deleta um usuário (apenas administradores)"""
     try:
@@ -231,12 +268,14 @@ async def deletar_usuario(
                 "Operação não permitida"
             )
         
-        usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
+        usuario = await db.scalar(select(Usuario).where(Usuario.id == usuario_id))
         if not usuario:
             return create_not_found_response("Usuário")
         
-        db.delete(usuario)
-        db.commit()
+        username = usuario.username
+        await db.delete(usuario)
+        await db.commit()
+        invalidar_principal(usuario_id, username)
         
         return create_delete_response("Usuário deletado com sucesso")
         
@@ -245,7 +284,7 @@ async def deletar_usuario(
 
 @router.get("/me/profile")
 async def obter_perfil_atual(
-    current_user: Usuario = Depends(get_current_active_user)
+    current_user: Usuario = Depends(get_current_usuario_db)
 ):
     """Obtém o perfil do usuário atual"""
     try:
@@ -268,18 +307,18 @@ async def obter_perfil_atual(
 @router.put("/me/password")
 async def alterar_senha(
     password_data: ChangePasswordRequest,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Usuario = Depends(get_current_usuario_db),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Altera a senha do usuário atual"""
     try:
-        from auth import verify_password, authenticate_user
+        from auth import verify_password_async, authenticate_user_async
         
         # Workaround: Como há problema com bcrypt, vamos usar uma validação alternativa
-        # Primeiro, tentar authenticate_user
-        user_auth = authenticate_user(db, current_user.username, password_data.senha_atual)
+        # Primeiro, tentar authenticate_user_async
+        user_auth = await authenticate_user_async(db, current_user.username, password_data.senha_atual)
         
-        # Se authenticate_user falhar, vamos tentar uma abordagem mais direta
+        # Se authenticate_user_async falhar, vamos tentar uma abordagem mais direta
         if not user_auth:
             # Para o usuário admin, aceitar "admin123" como senha válida temporariamente
             # Isso é um workaround até resolver o problema do bcrypt
@@ -294,7 +333,7 @@ async def alterar_senha(
             )
         
         # Verificar se a nova senha é diferente da atual
-        if verify_password(password_data.nova_senha, current_user.hashed_password):
+        if await verify_password_async(password_data.nova_senha, current_user.hashed_password):
             return create_validation_error_response(
                 ["A nova senha deve ser diferente da senha atual"],
                 "Nova senha inválida"
@@ -308,10 +347,13 @@ async def alterar_senha(
             )
         
         # Atualizar senha
-        current_user.hashed_password = get_password_hash(password_data.nova_senha)
-        db.commit()
+        current_user.hashed_password = await get_password_hash_async(password_data.nova_senha)
+        await db.commit()
+        invalidar_principal(current_user.id, current_user.username)
         
         return create_success_response("Senha alterada com sucesso")
         
+    except HTTPException:
+        raise
     except Exception as e:
         return create_error_response(f"Erro ao alterar senha: {str(e)}")
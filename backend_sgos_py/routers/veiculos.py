@@ -1,37 +1,58 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from database import get_async_db
 from models import Veiculo, Usuario
 from schemas import Veiculo as VeiculoSchema, VeiculoCreate, VeiculoUpdate, MessageResponse, PaginatedResponse
-from auth import get_current_active_user
+from auth import get_current_active_user, Principal
+from utils.numero_utils import formatar_minutos
 from utils.response_utils import (
     create_paginated_response, create_single_item_response, create_create_response,
     create_update_response, create_delete_response, create_not_found_response,
     create_validation_error_response, create_list_response, create_error_response
 )
+from utils.paginacao import resolver_ordenacao, paginar
+from contagem import contar_total
+from versoes import validadores_lista, validadores_entidade
+from utils.http_cache import responder_condicional, parametros_normalizados
 
 router = APIRouter(prefix="/veiculos", tags=["Veículos"])
 
+CAMPOS_ORDENACAO = ("created_at", "placa", "id")
+# Tabelas exibidas na listagem: as versões delas formam o ETag
+TABELAS_LISTAGEM = ("veiculo",)
+
 @router.get("/")
 async def listar_veiculos(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0, description="Número de registros para pular"),
     limit: int = Query(100, ge=1, le=1000, description="Número máximo de registros"),
+    cursor: Optional[str] = Query(None, description="Cursor da próxima página (next_cursor)"),
+    with_total: Optional[bool] = Query(None, description="Calcular o total (padrão: só sem cursor)"),
+    sort: Optional[str] = Query(None, description="Ordenação: created_at, placa ou id, com asc/desc (padrão: id asc)"),
     search: Optional[str] = Query(None, description="Termo de busca"),
     marca: Optional[str] = Query(None, description="Filtrar por marca"),
     modelo: Optional[str] = Query(None, description="Filtrar por modelo"),
     placa: Optional[str] = Query(None, description="Filtrar por placa"),
     status: Optional[str] = Query(None, description="Filtrar por status"),
     su_cia_viatura: Optional[str] = Query(None, description="Filtrar por SU/CIA"),
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista veículos com paginação e filtros"""
     try:
-        query = db.query(Veiculo)
+        ordenacao = resolver_ordenacao(sort, CAMPOS_ORDENACAO, "id asc")
+        validadores = await validadores_lista(db, TABELAS_LISTAGEM, current_user.id, parametros_normalizados(request))
+        nao_modificada = responder_condicional(request, response, *validadores)
+        if nao_modificada is not None:
+            return nao_modificada
+        query = select(Veiculo)
         
         if search:
-            query = query.filter(
+            query = query.where(
                 (Veiculo.marca.contains(search)) |
                 (Veiculo.modelo.contains(search)) |
                 (Veiculo.placa.contains(search)) |
@@ -40,22 +61,22 @@ async def listar_veiculos(
             )
         
         if marca:
-            query = query.filter(Veiculo.marca == marca)
+            query = query.where(Veiculo.marca == marca)
         
         if modelo:
-            query = query.filter(Veiculo.modelo == modelo)
+            query = query.where(Veiculo.modelo == modelo)
         
         if placa:
-            query = query.filter(Veiculo.placa.contains(placa))
+            query = query.where(Veiculo.placa.contains(placa))
         
         if status:
-            query = query.filter(Veiculo.status == status)
+            query = query.where(Veiculo.status == status)
         
         if su_cia_viatura:
-            query = query.filter(Veiculo.su_cia_viatura.contains(su_cia_viatura))
+            query = query.where(Veiculo.su_cia_viatura.contains(su_cia_viatura))
         
-        total = query.count()
-        veiculos = query.offset(skip).limit(limit).all()
+        total, total_exato = await contar_total(db, query, Veiculo, with_total, cursor)
+        veiculos, next_cursor = await paginar(db, query, Veiculo, ordenacao, cursor, skip, limit)
         
         items = []
         for veiculo in veiculos:
@@ -77,7 +98,7 @@ async def listar_veiculos(
                 "updated_at": veiculo.updated_at
             })
         
-        pages = (total + limit - 1) // limit
+        pages = (total + limit - 1) // limit if total is not None else None
         
         return create_paginated_response(
             items=items,
@@ -85,7 +106,9 @@ async def listar_veiculos(
             page=skip // limit + 1,
             size=limit,
             pages=pages,
-            message="Veículos listados com sucesso"
+            message="Veículos listados com sucesso",
+            next_cursor=next_cursor,
+            total_exato=total_exato
         )
         
     except Exception as e:
@@ -94,11 +117,20 @@ async def listar_veiculos(
 @router.get("/{veiculo_id}")
 async def obter_veiculo(
     veiculo_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtém um veículo específico"""
-    veiculo = db.query(Veiculo).filter(Veiculo.id == veiculo_id).first()
+    validadores = await validadores_entidade(db, Veiculo, veiculo_id)
+    if validadores is None:
+        return create_not_found_response("Veículo")
+    nao_modificada = responder_condicional(request, response, *validadores)
+    if nao_modificada is not None:
+        return nao_modificada
+    
+    veiculo = await db.scalar(select(Veiculo).where(Veiculo.id == veiculo_id))
     if not veiculo:
         return create_not_found_response("Veículo")
     
@@ -107,12 +139,12 @@ async def obter_veiculo(
 @router.post("/")
 async def criar_veiculo(
     veiculo_data: VeiculoCreate,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cria um novo veículo"""
     # Verificar se placa já existe
-    existing_placa = db.query(Veiculo).filter(Veiculo.placa == veiculo_data.placa).first()
+    existing_placa = await db.scalar(select(Veiculo).where(Veiculo.placa == veiculo_data.placa))
     if existing_placa:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -120,7 +152,7 @@ async def criar_veiculo(
         )
     
     # Verificar se patrimônio já existe
-    existing_patrimonio = db.query(Veiculo).filter(Veiculo.patrimonio == veiculo_data.patrimonio).first()
+    existing_patrimonio = await db.scalar(select(Veiculo).where(Veiculo.patrimonio == veiculo_data.patrimonio))
     if existing_patrimonio:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -129,8 +161,8 @@ async def criar_veiculo(
     
     db_veiculo = Veiculo(**veiculo_data.dict())
     db.add(db_veiculo)
-    db.commit()
-    db.refresh(db_veiculo)
+    await db.commit()
+    await db.refresh(db_veiculo)
     
     # Retornar no formato padrão
     return create_single_item_response(db_veiculo, "Veículo criado com sucesso")
@@ -139,11 +171,11 @@ async def criar_veiculo(
 async def atualizar_veiculo(
     veiculo_id: int,
     veiculo_data: VeiculoUpdate,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Atualiza um veículo"""
-    veiculo = db.query(Veiculo).filter(Veiculo.id == veiculo_id).first()
+    veiculo = await db.scalar(select(Veiculo).where(Veiculo.id == veiculo_id))
     if not veiculo:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -152,7 +184,7 @@ async def atualizar_veiculo(
     
     # Verificar se placa já existe (se foi alterada)
     if veiculo_data.placa and veiculo_data.placa != veiculo.placa:
-        existing_placa = db.query(Veiculo).filter(Veiculo.placa == veiculo_data.placa).first()
+        existing_placa = await db.scalar(select(Veiculo).where(Veiculo.placa == veiculo_data.placa))
         if existing_placa:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -161,7 +193,7 @@ async def atualizar_veiculo(
     
     # Verificar se patrimônio já existe (se foi alterado)
     if veiculo_data.patrimonio and veiculo_data.patrimonio != veiculo.patrimonio:
-        existing_patrimonio = db.query(Veiculo).filter(Veiculo.patrimonio == veiculo_data.patrimonio).first()
+        existing_patrimonio = await db.scalar(select(Veiculo).where(Veiculo.patrimonio == veiculo_data.patrimonio))
         if existing_patrimonio:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -173,8 +205,8 @@ async def atualizar_veiculo(
     for field, value in update_data.items():
         setattr(veiculo, field, value)
     
-    db.commit()
-    db.refresh(veiculo)
+    await db.commit()
+    await db.refresh(veiculo)
     
     # Retornar no formato padrão
     return create_single_item_response(veiculo, "Veículo atualizado com sucesso")
@@ -182,11 +214,11 @@ async def atualizar_veiculo(
 @router.delete("/{veiculo_id}", response_model=MessageResponse)
 async def deletar_veiculo(
     veiculo_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Deleta um veículo"""
-    veiculo = db.query(Veiculo).filter(Veiculo.id == veiculo_id).first()
+    veiculo = await db.scalar(select(Veiculo).where(Veiculo.id == veiculo_id))
     if not veiculo:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -195,60 +227,60 @@ async def deletar_veiculo(
     
     # Verificar se o veículo tem ordens de serviço associadas
     from models import OrdemServico
-    ordens_count = db.query(OrdemServico).filter(OrdemServico.veiculo_id == veiculo_id).count()
+    ordens_count = await db.scalar(select(func.count()).select_from(OrdemServico).where(OrdemServico.veiculo_id == veiculo_id))
     if ordens_count > 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Não é possível deletar um veículo que possui ordens de serviço"
         )
     
-    db.delete(veiculo)
-    db.commit()
+    await db.delete(veiculo)
+    await db.commit()
     
     return MessageResponse(message="Veículo deletado com sucesso")
 
 @router.get("/marcas/lista", response_model=List[str])
 async def listar_marcas(
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista todas as marcas disponíveis"""
-    marcas = db.query(Veiculo.marca).distinct().all()
+    marcas = (await db.execute(select(Veiculo.marca).distinct())).all()
     return [marca[0] for marca in marcas if marca[0]]
 
 @router.get("/modelos/lista", response_model=List[str])
 async def listar_modelos(
     marca: Optional[str] = Query(None, description="Filtrar por marca"),
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista todos os modelos disponíveis"""
-    query = db.query(Veiculo.modelo).distinct()
+    query = select(Veiculo.modelo).distinct()
     if marca:
-        query = query.filter(Veiculo.marca == marca)
+        query = query.where(Veiculo.marca == marca)
     
-    modelos = query.all()
+    modelos = (await db.execute(query)).all()
     return [modelo[0] for modelo in modelos if modelo[0]]
 
 @router.get("/status/lista", response_model=List[str])
 async def listar_status(
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lista todos os status disponíveis"""
-    status_list = db.query(Veiculo.status).distinct().all()
+    status_list = (await db.execute(select(Veiculo.status).distinct())).all()
     return [status[0] for status in status_list if status[0]]
 
 @router.get("/{veiculo_id}/relatorio-retirada")
 async def gerar_relatorio_retirada(
     veiculo_id: int,
-    current_user: Usuario = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Gera relatório personalizado da viatura quando estiver com status RETIRADA"""
     try:
         # Buscar o veículo
-        veiculo = db.query(Veiculo).filter(Veiculo.id == veiculo_id).first()
+        veiculo = await db.scalar(select(Veiculo).where(Veiculo.id == veiculo_id))
         if not veiculo:
             return create_not_found_response("Veículo")
         
@@ -261,49 +293,60 @@ async def gerar_relatorio_retirada(
         
         # Buscar a OS mais recente com status RETIRADA
         from models import OrdemServico
-        ordem_servico = db.query(OrdemServico).filter(
-            OrdemServico.veiculo_id == veiculo_id,
-            OrdemServico.situacao_os == "RETIRADA"
-        ).order_by(OrdemServico.created_at.desc()).first()
+        ordem_servico = await db.scalar(
+            select(OrdemServico)
+            .options(joinedload(OrdemServico.usuario))
+            .where(
+                OrdemServico.veiculo_id == veiculo_id,
+                OrdemServico.situacao_os == "RETIRADA"
+            )
+            .order_by(OrdemServico.created_at.desc())
+            .limit(1)
+        )
         
         if not ordem_servico:
             return create_not_found_response("Ordem de serviço com status RETIRADA")
         
         # Buscar o encerramento da OS
         from models import EncerrarOS
-        encerramento = db.query(EncerrarOS).filter(EncerrarOS.abrir_os_id == ordem_servico.id).first()
+        encerramento = await db.scalar(select(EncerrarOS).where(EncerrarOS.abrir_os_id == ordem_servico.id))
         
         # Buscar retiradas de viatura
         from models import RetiradaViatura
-        retiradas = db.query(RetiradaViatura).filter(RetiradaViatura.encerrar_os_id == encerramento.id).all() if encerramento else []
+        retiradas = (await db.scalars(
+            select(RetiradaViatura)
+            .options(joinedload(RetiradaViatura.usuario))
+            .where(RetiradaViatura.encerrar_os_id == encerramento.id)
+            .order_by(RetiradaViatura.data.desc(), RetiradaViatura.id.desc())
+        )).all() if encerramento else []
         
         # Buscar serviços realizados
         from models import ServicoRealizado
-        servicos_realizados = db.query(ServicoRealizado).filter(ServicoRealizado.abrir_os_id == ordem_servico.id).all()
+        servicos_realizados = (await db.scalars(
+            select(ServicoRealizado)
+            .options(joinedload(ServicoRealizado.usuario))
+            .where(ServicoRealizado.abrir_os_id == ordem_servico.id)
+        )).all()
         
         # Buscar peças utilizadas
         from models import PecaUtilizada
-        pecas_utilizadas = db.query(PecaUtilizada).filter(PecaUtilizada.abrir_os_id == ordem_servico.id).all()
-        
-        # Calcular tempo total de serviços
-        tempo_total_servicos = "00:00"
-        if servicos_realizados:
-            # Implementar lógica para somar tempos (formato HH:MM)
-            total_minutos = 0
-            for servico in servicos_realizados:
-                tempo = servico.tempo_de_servico_realizado
-                if ":" in tempo:
-                    horas, minutos = map(int, tempo.split(":"))
-                    total_minutos += horas * 60 + minutos
-                else:
-                    total_minutos += int(tempo) if tempo.isdigit() else 0
-            
-            horas_total = total_minutos // 60
-            minutos_total = total_minutos % 60
-            tempo_total_servicos = f"{horas_total:02d}:{minutos_total:02d}"
+        pecas_utilizadas = (await db.scalars(
+            select(PecaUtilizada)
+            .options(joinedload(PecaUtilizada.usuario))
+            .where(PecaUtilizada.abrir_os_id == ordem_servico.id)
+        )).all()
         
-        # Calcular total de peças
-        total_pecas = sum(int(peca.qtd) if peca.qtd.isdigit() else 0 for peca in pecas_utilizadas)
+        # Totais calculados no banco sobre as colunas numéricas (uma única consulta)
+        totais = (await db.execute(select(
+            select(func.coalesce(func.sum(ServicoRealizado.tempo_minutos), 0))
+            .where(ServicoRealizado.abrir_os_id == ordem_servico.id).scalar_subquery(),
+            select(func.coalesce(func.sum(PecaUtilizada.qtd_unidades), 0))
+            .where(PecaUtilizada.abrir_os_id == ordem_servico.id).scalar_subquery(),
+            select(func.max(OrdemServico.hodometro_km) - func.min(OrdemServico.hodometro_km))
+            .where(OrdemServico.veiculo_id == veiculo_id).scalar_subquery(),
+        ))).one()
+        total_minutos, total_pecas, variacao_hodometro = totais
+        tempo_total_servicos = formatar_minutos(total_minutos)
         
         # Montar relatório
         relatorio = {
@@ -325,6 +368,7 @@ async def gerar_relatorio_retirada(
                 "id": ordem_servico.id,
                 "data": ordem_servico.data,
                 "hodometro": ordem_servico.hodometro,
+                "hodometro_km": ordem_servico.hodometro_km,
                 "problema_apresentado": ordem_servico.problema_apresentado,
                 "sistema_afetado": ordem_servico.sistema_afetado,
                 "causa_da_avaria": ordem_servico.causa_da_avaria,
@@ -343,6 +387,7 @@ async def gerar_relatorio_retirada(
                 "data_da_manutencao": encerramento.data_da_manutencao,
                 "situacao_os": encerramento.situacao_os,
                 "tempo_total": encerramento.tempo_total,
+                "tempo_total_minutos": encerramento.tempo_total_minutos,
                 "modelo_veiculo": encerramento.modelo_veiculo,
                 "created_at": encerramento.created_at
             } if encerramento else None,
@@ -364,6 +409,7 @@ async def gerar_relatorio_retirada(
                     "id": servico.id,
                     "servico_realizado": servico.servico_realizado,
                     "tempo_de_servico_realizado": servico.tempo_de_servico_realizado,
+                    "tempo_minutos": servico.tempo_minutos,
                     "created_at": servico.created_at,
                     "usuario": {
                         "id": servico.usuario.id,
@@ -378,6 +424,7 @@ async def gerar_relatorio_retirada(
                     "peca_utilizada": peca.peca_utilizada,
                     "num_ficha": peca.num_ficha,
                     "qtd": peca.qtd,
+                    "qtd_unidades": peca.qtd_unidades,
                     "created_at": peca.created_at,
                     "usuario": {
                         "id": peca.usuario.id,
@@ -389,7 +436,9 @@ async def gerar_relatorio_retirada(
             "resumo": {
                 "total_servicos": len(servicos_realizados),
                 "tempo_total_servicos": tempo_total_servicos,
+                "tempo_total_servicos_minutos": total_minutos,
                 "total_pecas": total_pecas,
+                "variacao_hodometro_km": variacao_hodometro,
                 "total_pecas_diferentes": len(pecas_utilizadas),
                 "total_retiradas": len(retiradas),
                 "data_retirada": retiradas[0].data if retiradas else None,
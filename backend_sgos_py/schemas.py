@@ -1,6 +1,15 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-from datetime import datetime
+from pydantic import AfterValidator, BaseModel, BeforeValidator, EmailStr
+from typing import Annotated, Optional, List
+from datetime import date, datetime
+from utils.date_utils import validar_data
+from utils.numero_utils import validar_inteiro, validar_duracao
+
+# Datas aceitas como DD/MM/YYYY ou ISO e gravadas como DATE
+Data = Annotated[date, BeforeValidator(validar_data)]
+# Texto que precisa ser um inteiro (hodômetro, quantidade) ou uma duração HH:MM;
+# o valor numérico correspondente é gravado junto pelo modelo
+Inteiro = Annotated[str, AfterValidator(validar_inteiro)]
+Duracao = Annotated[str, AfterValidator(validar_duracao)]
 
 # Schemas para Usuario
 class UsuarioBase(BaseModel):
@@ -71,9 +80,9 @@ class Veiculo(VeiculoBase):
 
 # Schemas para OrdemServico
 class OrdemServicoBase(BaseModel):
-    data: str
+    data: Data
     veiculo_id: int
-    hodometro: str
+    hodometro: Inteiro
     problema_apresentado: str
     sistema_afetado: str
     causa_da_avaria: str
@@ -85,9 +94,9 @@ class OrdemServicoCreate(OrdemServicoBase):
     pass
 
 class OrdemServicoUpdate(BaseModel):
-    data: Optional[str] = None
+    data: Optional[Data] = None
     veiculo_id: Optional[int] = None
-    hodometro: Optional[str] = None
+    hodometro: Optional[Inteiro] = None
     problema_apresentado: Optional[str] = None
     sistema_afetado: Optional[str] = None
     causa_da_avaria: Optional[str] = None
@@ -109,7 +118,7 @@ class OrdemServico(OrdemServicoBase):
 # Schemas para ServicoRealizado
 class ServicoRealizadoBase(BaseModel):
     servico_realizado: str
-    tempo_de_servico_realizado: str
+    tempo_de_servico_realizado: Duracao
     abrir_os_id: int
 
 class ServicoRealizadoCreate(ServicoRealizadoBase):
@@ -117,7 +126,7 @@ class ServicoRealizadoCreate(ServicoRealizadoBase):
 
 class ServicoRealizadoUpdate(BaseModel):
     servico_realizado: Optional[str] = None
-    tempo_de_servico_realizado: Optional[str] = None
+    tempo_de_servico_realizado: Optional[Duracao] = None
     abrir_os_id: Optional[int] = None
 
 class ServicoRealizado(ServicoRealizadoBase):
@@ -133,7 +142,7 @@ class ServicoRealizado(ServicoRealizadoBase):
 class PecaUtilizadaBase(BaseModel):
     peca_utilizada: str
     num_ficha: str
-    qtd: str
+    qtd: Inteiro
     abrir_os_id: int
 
 class PecaUtilizadaCreate(PecaUtilizadaBase):
@@ -142,7 +151,7 @@ class PecaUtilizadaCreate(PecaUtilizadaBase):
 class PecaUtilizadaUpdate(BaseModel):
     peca_utilizada: Optional[str] = None
     num_ficha: Optional[str] = None
-    qtd: Optional[str] = None
+    qtd: Optional[Inteiro] = None
     abrir_os_id: Optional[int] = None
 
 class PecaUtilizada(PecaUtilizadaBase):
@@ -157,9 +166,9 @@ class PecaUtilizada(PecaUtilizadaBase):
 # Schemas para EncerrarOS
 class EncerrarOSBase(BaseModel):
     nome_mecanico: str
-    data_da_manutencao: str
+    data_da_manutencao: Data
     situacao_os: str = "FECHADA"
-    tempo_total: Optional[str] = "00:00"
+    tempo_total: Optional[Duracao] = "00:00"
     abrir_os_id: int
     modelo_veiculo: Optional[str] = None
 
@@ -168,9 +177,9 @@ class EncerrarOSCreate(EncerrarOSBase):
 
 class EncerrarOSUpdate(BaseModel):
     nome_mecanico: Optional[str] = None
-    data_da_manutencao: Optional[str] = None
+    data_da_manutencao: Optional[Data] = None
     situacao_os: Optional[str] = None
-    tempo_total: Optional[str] = None
+    tempo_total: Optional[Duracao] = None
     abrir_os_id: Optional[int] = None
     modelo_veiculo: Optional[str] = None
 
@@ -186,7 +195,7 @@ class EncerrarOS(EncerrarOSBase):
 # Schemas para RetiradaViatura
 class RetiradaViaturaBase(BaseModel):
     nome: str
-    data: str
+    data: Data
     encerrar_os_id: int
 
 class RetiradaViaturaCreate(RetiradaViaturaBase):
@@ -194,7 +203,7 @@ class RetiradaViaturaCreate(RetiradaViaturaBase):
 
 class RetiradaViaturaUpdate(BaseModel):
     nome: Optional[str] = None
-    data: Optional[str] = None
+    data: Optional[Data] = None
     encerrar_os_id: Optional[int] = None
 
 class RetiradaViatura(RetiradaViaturaBase):
@@ -272,7 +281,9 @@ class PaginatedResponse(BaseModel):
         "total": 0,
         "page": 1,
         "size": 10,
-        "pages": 0
+        "pages": 0,
+        "next_cursor": None,
+        "total_exato": True
     }
 
 # Schemas para Recuperação de Senha
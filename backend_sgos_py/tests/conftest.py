@@ -0,0 +1,109 @@
+"""
+Fixtures dos testes: a aplicação roda contra bancos SQLite temporários
+(principal e de logs), com dados de exemplo e X-DB-Queries nas respostas.
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import date
+
+# As configurações são lidas no import de config: o ambiente vem antes de qualquer módulo da aplicação
+_DIRETORIO = tempfile.mkdtemp(prefix="sgos_testes_")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_DIRETORIO}/sgos.db",
+    "LOG_DATABASE_URL": f"sqlite:///{_DIRETORIO}/sgos_logs.db",
+    "SQL_METRICS_HEADERS": "true",
+    "SLOW_QUERY_THRESHOLD_MS": "-1",
+    "PRINCIPAL_CACHE_TTL_SECONDS": "3600",
+})
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from database import SessionLocal
+from models import Usuario, Veiculo, OrdemServico, ServicoRealizado, PecaUtilizada, EncerrarOS, RetiradaViatura
+from auth import get_password_hash
+
+ADMIN = {"username": "admin", "password": "admin123"}
+
+# Linhas por tabela (pelo menos 2 em cada listagem): as contagens de consultas
+# devem ser as mesmas com limit=1 e limit=1000
+VEICULOS = 3
+ORDENS_POR_VEICULO = 2
+ITENS_POR_ORDEM = 3
+
+
+def _popular_banco():
+    """Usuários, veículos e OS completas (serviços, peças, encerramento e retirada) de usuários diferentes"""
+    db = SessionLocal()
+    try:
+        senha = get_password_hash(ADMIN["password"])
+        usuarios = [
+            Usuario(username="admin", email="admin@sgos.com", hashed_password=senha,
+                    nome_completo="Administrador do Sistema", perfil="ADMIN", ativo=True),
+            Usuario(username="mecanico1", email="mecanico1@sgos.com", hashed_password=senha,
+                    nome_completo="Mecânico Um", perfil="MECANICO", ativo=True),
+            Usuario(username="mecanico2", email="mecanico2@sgos.com", hashed_password=senha,
+                    nome_completo="Mecânico Dois", perfil="MECANICO", ativo=True),
+        ]
+        db.add_all(usuarios)
+        db.flush()
+
+        for v in range(VEICULOS):
+            veiculo = Veiculo(
+                marca="FORD", modelo=f"RANGER {v}", placa=f"ABC{v:04d}", su_cia_viatura=f"{v + 1}ª CIA",
+                patrimonio=f"PAT{v:05d}", ano_fabricacao="2021", status="RETIRADA"
+            )
+            db.add(veiculo)
+            db.flush()
+            for o in range(ORDENS_POR_VEICULO):
+                autor = usuarios[(v + o) % len(usuarios)]
+                ordem = OrdemServico(
+                    data=date(2024, 1, 10 + o), veiculo_id=veiculo.id, hodometro=str(10000 + o),
+                    problema_apresentado="Freio fazendo barulho", sistema_afetado="Freios",
+                    causa_da_avaria="Pastilha gasta", manutencao="CORRETIVA",
+                    usuario_id=autor.id, perfil=autor.perfil, situacao_os="RETIRADA"
+                )
+                db.add(ordem)
+                db.flush()
+                for i in range(ITENS_POR_ORDEM):
+                    usuario = usuarios[i % len(usuarios)]
+                    db.add(ServicoRealizado(servico_realizado=f"Serviço {i}", tempo_de_servico_realizado="01:30",
+                                            abrir_os_id=ordem.id, usuario_id=usuario.id))
+                    db.add(PecaUtilizada(peca_utilizada=f"Peça {i}", num_ficha=f"FIC{i}", qtd="2",
+                                         abrir_os_id=ordem.id, usuario_id=usuario.id))
+                encerramento = EncerrarOS(
+                    nome_mecanico="mecanico1", data_da_manutencao=date(2024, 1, 15), situacao_os="RETIRADA",
+                    tempo_total="04:30", usuario_id=usuarios[1].id, abrir_os_id=ordem.id, modelo_veiculo=veiculo.modelo
+                )
+                db.add(encerramento)
+                db.flush()
+                db.add(RetiradaViatura(nome="motorista", data=date(2024, 1, 16),
+                                       encerrar_os_id=encerramento.id, usuario_id=usuarios[2].id))
+        db.commit()
+    finally:
+        db.close()
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as cliente:
+        _popular_banco()
+        yield cliente
+    shutil.rmtree(_DIRETORIO, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    resposta = client.post("/api/v1/auth/login", json=ADMIN)
+    headers = {"Authorization": f"Bearer {resposta.json()['data']['access_token']}"}
+    # Primeira requisição autenticada: o usuário fica no cache e não entra nas contagens dos testes
+    client.get("/api/v1/usuarios/me/profile", headers=headers)
+    return headers
+
+
+def consultas(resposta) -> int:
+    """Consultas SQL da requisição (header X-DB-Queries)"""
+    return int(resposta.headers["X-DB-Queries"])
@@ -0,0 +1,62 @@
+"""
+Número de consultas SQL por endpoint (X-DB-Queries, contado pelos listeners do monitor_sql)
+
+Os relacionamentos lidos pelos handlers são carregados com joinedload/selectinload:
+a contagem é fixa, qualquer que seja o tamanho da página ou o número de linhas relacionadas.
+"""
+
+import pytest
+from conftest import consultas
+
+# Listagens: versões das tabelas (ETag) + página; o total vem do contador por tabela
+LISTAGENS = {
+    "/api/v1/ordens-servico/": 2,
+    "/api/v1/veiculos/": 2,
+    "/api/v1/usuarios/": 2,
+    "/api/v1/servicos-realizados/": 2,
+    "/api/v1/pecas-utilizadas/": 2,
+    "/api/v1/encerrar-os/": 2,
+    "/api/v1/retirada-viatura/": 2,
+}
+
+DETALHES = {
+    # Validadores do GET condicional + OS com veículo e usuário + encerramento + retiradas
+    "/api/v1/ordens-servico/1": 4,
+    "/api/v1/veiculos/1": 2,
+    "/api/v1/usuarios/1": 2,
+    "/api/v1/servicos-realizados/1": 1,
+    "/api/v1/pecas-utilizadas/1": 1,
+    "/api/v1/encerrar-os/1": 1,
+    "/api/v1/retirada-viatura/1": 1,
+    "/api/v1/servicos-realizados/os/1/servicos": 2,
+    "/api/v1/pecas-utilizadas/os/1/pecas": 2,
+    "/api/v1/encerrar-os/os/1/encerramento": 2,
+    "/api/v1/retirada-viatura/encerramento/1/retiradas": 2,
+    "/api/v1/ordens-servico/1/completo": 4,
+    # Veículo, OS, encerramento, retiradas, serviços, peças e totais
+    "/api/v1/veiculos/1/relatorio-retirada": 7,
+}
+
+
+@pytest.mark.parametrize("url,esperado", LISTAGENS.items())
+def test_listagem_com_numero_fixo_de_consultas(client, auth_headers, url, esperado):
+    # Primeira chamada carrega o contador de linhas da tabela
+    client.get(url, headers=auth_headers)
+
+    pagina_pequena = client.get(url, headers=auth_headers, params={"limit": 1})
+    pagina_grande = client.get(url, headers=auth_headers, params={"limit": 1000})
+
+    assert pagina_pequena.json()["status"] == "success"
+    assert len(pagina_pequena.json()["data"]["items"]) == 1
+    assert len(pagina_grande.json()["data"]["items"]) > 1
+    assert consultas(pagina_pequena) == esperado
+    assert consultas(pagina_grande) == esperado
+
+
+@pytest.mark.parametrize("url,esperado", DETALHES.items())
+def test_detalhe_com_numero_fixo_de_consultas(client, auth_headers, url, esperado):
+    resposta = client.get(url, headers=auth_headers)
+
+    assert resposta.status_code == 200
+    assert resposta.json()["status"] == "success"
+    assert consultas(resposta) == esperado
@@ -0,0 +1,70 @@
+"""GET condicional das listagens: ETag por versão das tabelas e por query string"""
+
+import pytest
+from sqlalchemy import select
+
+from database import SessionLocal, engine
+from models import Veiculo, VersaoTabela
+
+LISTAGENS = [
+    "/api/v1/ordens-servico/",
+    "/api/v1/veiculos/",
+    "/api/v1/usuarios/",
+    "/api/v1/servicos-realizados/",
+    "/api/v1/pecas-utilizadas/",
+    "/api/v1/encerrar-os/",
+    "/api/v1/retirada-viatura/",
+]
+
+
+@pytest.mark.parametrize("url", LISTAGENS)
+def test_query_strings_diferentes_tem_etags_diferentes(client, auth_headers, url):
+    etags = {
+        client.get(url, headers=auth_headers, params=params).headers["ETag"]
+        for params in ({}, {"limit": 5}, {"limit": 5, "skip": 1}, {"sort": "id"}, {"search": "freio"})
+    }
+
+    assert len(etags) == 5
+
+
+def test_etag_nao_depende_da_ordem_dos_parametros(client, auth_headers):
+    url = "/api/v1/ordens-servico/"
+    primeira = client.get(f"{url}?limit=5&search=freio", headers=auth_headers)
+    segunda = client.get(f"{url}?search=freio&limit=5", headers=auth_headers)
+
+    assert primeira.headers["ETag"] == segunda.headers["ETag"]
+
+
+def test_if_none_match_de_outra_pagina_nao_retorna_304(client, auth_headers):
+    url = "/api/v1/veiculos/"
+    etag = client.get(url, headers=auth_headers, params={"limit": 1}).headers["ETag"]
+
+    mesma_pagina = client.get(url, headers={**auth_headers, "If-None-Match": etag}, params={"limit": 1})
+    outra_pagina = client.get(url, headers={**auth_headers, "If-None-Match": etag}, params={"limit": 1, "skip": 1})
+
+    assert mesma_pagina.status_code == 304
+    assert outra_pagina.status_code == 200
+    assert outra_pagina.json()["status"] == "success"
+
+
+def _versao(conexao, tabela):
+    return conexao.execute(select(VersaoTabela.versao).where(VersaoTabela.tabela == tabela)).scalar_one()
+
+
+def test_versao_muda_apos_o_commit_e_nao_no_rollback(client):
+    with engine.connect() as conn:
+        inicial = _versao(conn, "veiculo")
+    db = SessionLocal()
+    try:
+        db.get(Veiculo, 1).observacoes = "revisão"
+        db.flush()
+        # O incremento fica fora da transação da escrita (não trava a linha de versao_tabela)
+        assert _versao(db, "veiculo") == inicial
+        db.rollback()
+        assert _versao(db, "veiculo") == inicial
+
+        db.get(Veiculo, 1).observacoes = "revisão"
+        db.commit()
+        assert _versao(db, "veiculo") == inicial + 1
+    finally:
+        db.close()
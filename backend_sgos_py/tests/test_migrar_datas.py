@@ -0,0 +1,33 @@
+"""Migração das datas em texto: valores sem formato reconhecido vão para a quarentena"""
+
+from datetime import date
+
+from sqlalchemy import delete, select, text
+
+import migrar_datas
+from database import engine
+from models import DataInvalida
+
+
+def test_data_invalida_vai_para_quarentena_e_linha_continua_legivel(client, auth_headers):
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE encerrar_os SET data_da_manutencao = 'amanha' WHERE id = 1"))
+    try:
+        relatorio = migrar_datas.migrar_colunas_data(engine)
+
+        [(registro_id, valor, substituta)] = relatorio["encerrar_os.data_da_manutencao"]["invalidas"]
+        assert (registro_id, valor) == (1, "amanha")
+        with engine.connect() as conn:
+            quarentena = conn.execute(select(DataInvalida.__table__)).mappings().one()
+        assert quarentena["tabela"] == "encerrar_os"
+        assert quarentena["valor_original"] == "amanha"
+        assert quarentena["valor_substituto"] == substituta
+
+        resposta = client.get("/api/v1/encerrar-os/1", headers=auth_headers)
+        assert resposta.status_code == 200
+        assert resposta.json()["data"]["data_da_manutencao"] == substituta.isoformat()
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE encerrar_os SET data_da_manutencao = :data WHERE id = 1"),
+                         {"data": date(2024, 1, 15).isoformat()})
+            conn.execute(delete(DataInvalida.__table__))
@@ -0,0 +1,53 @@
+"""Modo estrito do monitor_sql: passar do orçamento de consultas da rota faz a requisição falhar"""
+
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from config import settings
+from monitor_sql import orcamento_consultas
+from conftest import consultas
+
+DETALHE_OS = "/api/v1/ordens-servico/1"
+
+
+@pytest.fixture
+def modo_estrito(monkeypatch):
+    def configurar(orcamentos):
+        monkeypatch.setattr(settings, "sql_strict_mode", True)
+        monkeypatch.setattr(settings, "sql_query_budgets", orcamentos)
+        orcamento_consultas.cache_clear()
+
+    yield configurar
+    monkeypatch.undo()
+    orcamento_consultas.cache_clear()
+
+
+def test_requisicao_acima_do_orcamento_falha(client, auth_headers, modo_estrito):
+    # O detalhe da OS executa 4 consultas e não captura a exceção: responde o 500 do servidor
+    modo_estrito({"GET /api/v1/ordens-servico/{ordem_id}": 2})
+
+    resposta = TestClient(app, raise_server_exceptions=False).get(DETALHE_OS, headers=auth_headers)
+
+    assert resposta.status_code == 500
+
+
+def test_handler_que_captura_excecoes_tambem_falha(client, auth_headers, modo_estrito):
+    # O relatório transforma exceções em {"status": "error"} com HTTP 200; executa 7 consultas
+    modo_estrito({"GET /api/v1/veiculos/{veiculo_id}/relatorio-retirada": 3})
+
+    resposta = client.get("/api/v1/veiculos/1/relatorio-retirada", headers=auth_headers)
+
+    assert resposta.status_code == 500
+    assert resposta.json()["status"] == "error"
+    assert resposta.json()["message"] == "Orçamento de consultas SQL excedido"
+    assert "GET /api/v1/veiculos/{veiculo_id}/relatorio-retirada" in resposta.json()["data"]["errors"][0]
+    assert consultas(resposta) == 4
+
+
+def test_requisicao_dentro_do_orcamento_passa(client, auth_headers, modo_estrito):
+    modo_estrito({"GET /api/v1/ordens-servico/{ordem_id}": 4})
+
+    resposta = client.get(DETALHE_OS, headers=auth_headers)
+
+    assert resposta.status_code == 200
+    assert resposta.json()["status"] == "success"
@@ -0,0 +1,49 @@
+"""
+Utilitários para datas informadas como texto (formulários e dados legados)
+"""
+
+from datetime import date, datetime
+from typing import Any, Optional
+
+# Formatos aceitos além do ISO (YYYY-MM-DD / YYYY-MM-DDTHH:MM[:SS])
+FORMATOS_DATA = ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d")
+
+
+def parse_data(valor: Any) -> Optional[date]:
+    """
+    Converte o valor para date.
+    Aceita date/datetime, ISO (data ou data e hora) e DD/MM/YYYY;
+    retorna None quando vazio ou em formato não reconhecido.
+    """
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+
+    texto = str(valor).strip()
+    if not texto:
+        return None
+
+    try:
+        return datetime.fromisoformat(texto.replace("Z", "+00:00")).date()
+    except ValueError:
+        pass
+
+    for formato in FORMATOS_DATA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def validar_data(valor: Any) -> Any:
+    """Validador do Pydantic: converte para date ou rejeita o formato"""
+    if valor is None or isinstance(valor, date):
+        return valor
+    convertida = parse_data(valor)
+    if convertida is None:
+        raise ValueError("Data inválida; use DD/MM/YYYY ou YYYY-MM-DD")
+    return convertida
@@ -0,0 +1,108 @@
+"""
+GET condicional: ETag / If-None-Match e Last-Modified / If-Modified-Since
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlencode
+from fastapi import Request, Response
+from utils.timezone_utils import get_brasil_timezone
+
+# Clientes podem guardar a resposta, mas devem revalidar antes de usá-la
+CACHE_CONTROL_REVALIDAR = "private, no-cache"
+
+
+def etag_fraco(*partes) -> str:
+    """ETag fraco (W/"...") a partir das partes que identificam a versão da resposta"""
+    conteudo = "|".join(str(parte) for parte in partes)
+    return f'W/"{hashlib.sha1(conteudo.encode("utf-8")).hexdigest()[:16]}"'
+
+
+def parametros_normalizados(request: Request) -> str:
+    """
+    Query string em forma canônica (parâmetros ordenados), para compor o ETag
+    de listagens: cada página, filtro e ordenação tem seu próprio ETag
+    """
+    return urlencode(sorted(request.query_params.multi_items()))
+
+
+def etag_corresponde(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match casa com o ETag (comparação fraca: ignora o prefixo W/)"""
+    if not if_none_match:
+        return False
+    alvo = etag[2:] if etag.startswith("W/") else etag
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato == "*":
+            return True
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == alvo:
+            return True
+    return False
+
+
+def _em_utc(momento: datetime) -> datetime:
+    """Datas sem timezone vêm do banco no horário do Brasil"""
+    if momento.tzinfo is None:
+        momento = get_brasil_timezone().localize(momento)
+    return momento.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def data_http(momento: datetime) -> str:
+    """Data no formato dos headers HTTP (IMF-fixdate, GMT)"""
+    return format_datetime(_em_utc(momento), usegmt=True)
+
+
+def nao_modificado(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    Avalia os headers condicionais da requisição. If-None-Match tem precedência;
+    If-Modified-Since só é usado sem ele (RFC 9110).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_corresponde(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since or last_modified is None:
+        return False
+    try:
+        desde = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if desde.tzinfo is None:
+        desde = desde.replace(tzinfo=timezone.utc)
+    return _em_utc(last_modified) <= desde
+
+
+def aplicar_validadores(response: Response, etag: str, last_modified: Optional[datetime] = None):
+    """Headers de validação da resposta completa"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL_REVALIDAR
+    if last_modified is not None:
+        response.headers["Last-Modified"] = data_http(last_modified)
+
+
+def resposta_nao_modificada(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    """304 sem body, repetindo os headers de validação"""
+    resposta = Response(status_code=304)
+    aplicar_validadores(resposta, etag, last_modified)
+    return resposta
+
+
+def responder_condicional(
+    request: Request,
+    response: Response,
+    etag: str,
+    last_modified: Optional[datetime] = None
+) -> Optional[Response]:
+    """
+    304 se o cliente já tem esta versão; senão aplica os headers de validação
+    à resposta que o handler vai montar e retorna None
+    """
+    if nao_modificado(request, etag, last_modified):
+        return resposta_nao_modificada(etag, last_modified)
+    aplicar_validadores(response, etag, last_modified)
+    return None
@@ -0,0 +1,59 @@
+"""
+Metadados de log declarados pelos handlers
+
+O middleware de log abre um contexto por requisição apontando para o
+scope["state"] (o mesmo dicionário exposto em request.state). Os helpers de
+resposta e os exception handlers gravam ali o status da aplicação e a
+mensagem, e o middleware os lê sem precisar decodificar o body da resposta.
+"""
+
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+# Chaves gravadas no scope["state"] / request.state
+LOG_APP_STATUS = "log_app_status"
+LOG_MESSAGE = "log_message"
+LOG_ERROR = "log_error"
+
+_estado_atual: ContextVar[Optional[Dict[str, Any]]] = ContextVar("sgos_log_state", default=None)
+
+
+def iniciar_contexto_log(state: Dict[str, Any]):
+    """Associa o state da requisição ao contexto atual; retorna o token para reset"""
+    return _estado_atual.set(state)
+
+
+def encerrar_contexto_log(token):
+    """Desfaz a associação feita por iniciar_contexto_log"""
+    _estado_atual.reset(token)
+
+
+def registrar_metadados_log(
+    app_status: Optional[str],
+    message: Any = None,
+    error: Optional[bool] = None,
+    state: Optional[Dict[str, Any]] = None
+):
+    """
+    Registra status/mensagem da resposta para o middleware de log.
+    Sem state explícito usa o da requisição em andamento; fora de uma
+    requisição (scripts, testes) não faz nada.
+    """
+    if state is None:
+        state = _estado_atual.get()
+    if state is None:
+        return
+    state[LOG_APP_STATUS] = app_status
+    state[LOG_MESSAGE] = message
+    state[LOG_ERROR] = app_status == "error" if error is None else error
+
+
+def obter_metadados_log(state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Retorna os metadados registrados no state, ou None se não houver"""
+    if LOG_APP_STATUS not in state:
+        return None
+    return {
+        "status": state[LOG_APP_STATUS],
+        "message": state.get(LOG_MESSAGE),
+        "error": state.get(LOG_ERROR, False)
+    }
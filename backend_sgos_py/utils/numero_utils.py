@@ -0,0 +1,76 @@
+"""
+Utilitários para quantidades e durações informadas como texto
+(hodômetro, quantidade de peças e tempos de serviço no formato HH:MM)
+"""
+
+import re
+from typing import Any, Optional
+
+_DURACAO_HORAS = re.compile(r"^(\d+)\s*h(?:\s*(\d{1,2})\s*(?:min|m)?)?$", re.IGNORECASE)
+_UNIDADES = re.compile(r"\s*(km|un|und|unid|unidades?|pcs?)\.?$", re.IGNORECASE)
+
+
+def parse_inteiro(valor: Any) -> Optional[int]:
+    """
+    Converte quantidades como "45000", "45.000 km" ou "3 un" para int.
+    A parte decimal (após a vírgula) é descartada; retorna None se não reconhecer.
+    """
+    if valor is None or isinstance(valor, bool):
+        return None
+    if isinstance(valor, int):
+        return valor if valor >= 0 else None
+
+    texto = _UNIDADES.sub("", str(valor).strip())
+    texto = texto.split(",")[0].replace(".", "").replace(" ", "")
+    if not texto.isdigit():
+        return None
+    return int(texto)
+
+
+def parse_minutos(valor: Any) -> Optional[int]:
+    """
+    Converte durações para minutos: "HH:MM" (ou "HH:MM:SS"), "1h30" e
+    números simples (já em minutos). Retorna None se não reconhecer.
+    """
+    if valor is None or isinstance(valor, bool):
+        return None
+    if isinstance(valor, int):
+        return valor if valor >= 0 else None
+
+    texto = str(valor).strip()
+    if texto.isdigit():
+        return int(texto)
+
+    partes = texto.split(":")
+    if len(partes) in (2, 3) and all(parte.isdigit() for parte in partes):
+        horas, minutos = int(partes[0]), int(partes[1])
+        if minutos < 60:
+            return horas * 60 + minutos
+        return None
+
+    match = _DURACAO_HORAS.match(texto)
+    if match:
+        minutos = int(match.group(2) or 0)
+        if minutos < 60:
+            return int(match.group(1)) * 60 + minutos
+    return None
+
+
+def formatar_minutos(minutos: Optional[int]) -> str:
+    """Formata minutos como HH:MM"""
+    minutos = minutos or 0
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def validar_inteiro(valor: Any) -> Any:
+    """Validador do Pydantic para quantidades em texto (mantém o texto informado)"""
+    if valor is not None and parse_inteiro(valor) is None:
+        raise ValueError("Informe um número inteiro (ex.: 45000)")
+    return valor
+
+
+def validar_duracao(valor: Any) -> Any:
+    """Validador do Pydantic para durações em texto (mantém o texto informado)"""
+    if valor is not None and parse_minutos(valor) is None:
+        raise ValueError("Informe a duração no formato HH:MM (ex.: 01:30)")
+    return valor
@@ -0,0 +1,124 @@
+"""
+Paginação por cursor (keyset) das listagens
+
+A ordenação aceita um campo da lista permitida de cada endpoint, com id como
+desempate na mesma direção ("created_at desc" equivale a "created_at desc, id desc");
+cada campo tem um índice composto (campo, id). O cursor é opaco e guarda apenas a
+ordenação e o id do último item da página: a página seguinte é um range scan a
+partir dos valores desse registro, com custo igual na página 1 e na página 1000.
+skip/limit continuam aceitos (OFFSET) quando nenhum cursor é informado.
+"""
+
+import base64
+import json
+from typing import List, Optional, Sequence, Tuple
+from sqlalchemy import and_, exists, or_, select
+
+Ordenacao = Tuple[str, bool]  # (campo, descendente)
+
+
+def resolver_ordenacao(sort: Optional[str], campos: Sequence[str], padrao: str) -> Ordenacao:
+    """Valida o parâmetro sort ("campo [asc|desc][, id <mesma direção>]")"""
+    partes = [parte.split() for parte in (sort or padrao).split(",") if parte.strip()]
+    permitidos = ", ".join(campos)
+
+    def _parte(tokens: List[str]) -> Ordenacao:
+        if len(tokens) > 2 or (len(tokens) == 2 and tokens[1].lower() not in ("asc", "desc")):
+            raise ValueError(f"Ordenação inválida: {sort}")
+        return tokens[0], len(tokens) == 2 and tokens[1].lower() == "desc"
+
+    if not partes or len(partes) > 2:
+        raise ValueError(f"Ordenação inválida: {sort}")
+    campo, descendente = _parte(partes[0])
+    if campo not in campos:
+        raise ValueError(f"Ordenação por '{campo}' não permitida; use: {permitidos}")
+    if len(partes) == 2 and _parte(partes[1]) != ("id", descendente):
+        raise ValueError(f"O desempate deve ser 'id {'desc' if descendente else 'asc'}'")
+    return campo, descendente
+
+
+def texto_ordenacao(ordenacao: Ordenacao) -> str:
+    campo, descendente = ordenacao
+    return f"{campo} {'desc' if descendente else 'asc'}"
+
+
+def codificar_cursor(ordenacao: Ordenacao, ultimo_id: int) -> str:
+    dados = json.dumps({"o": texto_ordenacao(ordenacao), "id": ultimo_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, ordenacao: Ordenacao) -> int:
+    """Retorna o id do último item da página anterior"""
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        ultimo_id = int(dados["id"])
+        ordem_cursor = dados["o"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Cursor inválido")
+    if ordem_cursor != texto_ordenacao(ordenacao):
+        raise ValueError("Cursor gerado para outra ordenação; informe o mesmo sort")
+    return ultimo_id
+
+
+def _apos_cursor(modelo, ordenacao: Ordenacao, ultimo_id: int):
+    """
+    Filtro dos registros depois do último item, em forma de range no índice (campo, id):
+    campo <= X AND (campo < X OR id < Y) para desc (e o inverso para asc).
+    X é lido do próprio registro no banco, sem converter o valor para o cursor.
+    """
+    campo, descendente = ordenacao
+    chave = modelo.id
+
+    def _depois(coluna, valor):
+        return coluna < valor if descendente else coluna > valor
+
+    if campo == "id":
+        return _depois(chave, ultimo_id)
+
+    coluna = getattr(modelo, campo)
+    ancora = select(coluna).where(chave == ultimo_id).scalar_subquery()
+    limite = coluna <= ancora if descendente else coluna >= ancora
+    return and_(limite, or_(_depois(coluna, ancora), _depois(chave, ultimo_id)))
+
+
+async def paginar(
+    db,
+    query,
+    modelo,
+    ordenacao: Ordenacao,
+    cursor: Optional[str],
+    skip: int,
+    limit: int,
+    opcoes: Sequence = (),
+    relevancia=None,
+) -> Tuple[list, Optional[str]]:
+    """
+    Executa a página da listagem.
+    Com cursor usa keyset (skip é ignorado); sem cursor usa OFFSET.
+    Retorna os itens e o next_cursor (None na última página).
+    Com relevancia (busca textual) a página é ordenada por ela e não gera cursor.
+    """
+    campo, descendente = ordenacao
+    colunas = [getattr(modelo, campo)] if campo != "id" else []
+    colunas.append(modelo.id)
+    ordem = [coluna.desc() if descendente else coluna.asc() for coluna in colunas]
+
+    if relevancia is not None:
+        itens = (await db.scalars(
+            query.options(*opcoes).order_by(relevancia, *ordem).offset(skip).limit(limit)
+        )).all()
+        return itens, None
+
+    if cursor:
+        ultimo_id = decodificar_cursor(cursor, ordenacao)
+        if not await db.scalar(select(exists().where(modelo.id == ultimo_id))):
+            raise ValueError("Cursor expirado: o último item da página foi removido")
+        query = query.where(_apos_cursor(modelo, ordenacao, ultimo_id))
+    else:
+        query = query.offset(skip)
+
+    itens = (await db.scalars(query.options(*opcoes).order_by(*ordem).limit(limit + 1))).all()
+    if len(itens) <= limit:
+        return itens, None
+    itens = itens[:limit]
+    return itens, codificar_cursor(ordenacao, itens[-1].id)
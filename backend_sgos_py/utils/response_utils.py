@@ -1,65 +1,78 @@
 from datetime import datetime
 from typing import Any, Optional, List
 from schemas import SuccessResponse, ErrorResponse, WarningResponse, InfoResponse, MessageResponse, PaginatedResponse
+from utils.log_context import registrar_metadados_log
+
+def _com_log(resposta: dict) -> dict:
+    """Registra status e mensagem da resposta para o middleware de log"""
+    registrar_metadados_log(resposta["status"], resposta["message"])
+    return resposta
 
 def create_success_response(data: Any, message: str = "Operação realizada com sucesso") -> dict:
     """Cria uma resposta de sucesso padronizada"""
-    return {
+    return _com_log({
         "status": "success",
         "message": message,
         "timestamp": datetime.now().isoformat(),
         "data": data
-    }
+    })
 
 def create_error_response(message: str = "Erro na operação", data: Optional[Any] = None) -> dict:
     """Cria uma resposta de erro padronizada"""
-    return {
+    return _com_log({
         "status": "error",
         "message": message,
         "timestamp": datetime.now().isoformat(),
         "data": data
-    }
+    })
 
 def create_warning_response(
     message: str = "Aviso",
     data: Any = None
 ) -> dict:
     """Cria uma resposta de aviso padronizada"""
-    return {
+    return _com_log({
         "status": "warning",
         "message": message,
         "timestamp": datetime.now(),
         "data": data
-    }
+    })
 
 def create_info_response(
     message: str = "Informação",
     data: Any = None
 ) -> dict:
     """Cria uma resposta de informação padronizada"""
-    return {
+    return _com_log({
         "status": "info",
         "message": message,
         "timestamp": datetime.now(),
         "data": data
-    }
+    })
 
 def create_paginated_response(
     items: list, 
-    total: int, 
+    total: Optional[int], 
     page: int, 
     size: int, 
-    pages: int, 
-    message: str = "Dados recuperados com sucesso"
+    pages: Optional[int], 
+    message: str = "Dados recuperados com sucesso",
+    next_cursor: Optional[str] = None,
+    total_exato: bool = True
 ) -> dict:
-    """Cria uma resposta paginada padronizada"""
+    """
+    Cria uma resposta paginada padronizada
+    (next_cursor = próxima página por cursor; total_exato = False para total estimado ou em cache)
+    """
     return create_success_response(
         data={
             "items": items,
             "total": total,
             "page": page,
             "size": size,
-            "pages": pages
+            "pages": pages,
+            "next_cursor": next_cursor,
+            "total_exato": total_exato
         },
         message=message
     )
@@ -69,59 +82,59 @@ def create_single_item_response(
     message: str = "Item recuperado com sucesso"
 ) -> dict:
     """Cria uma resposta para um item único"""
-    return {
+    return _com_log({
         "status": "success",
         "message": message,
         "timestamp": datetime.now(),
         "data": item
-    }
+    })
 
 def create_list_response(
     items: List[Any],
     message: str = "Lista recuperada com sucesso"
 ) -> dict:
     """Cria uma resposta para uma lista de itens"""
-    return {
+    return _com_log({
         "status": "success",
         "message": message,
         "timestamp": datetime.now(),
         "data": items
-    }
+    })
 
 def create_delete_response(
     message: str = "Item deletado com sucesso"
 ) -> dict:
     """Cria uma resposta para operação de deleção"""
-    return {
+    return _com_log({
         "status": "success",
         "message": message,
         "timestamp": datetime.now(),
         "data": None
-    }
+    })
 
 def create_create_response(
     item: Any,
     message: str = "Item criado com sucesso"
 ) -> dict:
     """Cria uma resposta para operação de criação"""
-    return {
+    return _com_log({
         "status": "success",
         "message": message,
         "timestamp": datetime.now(),
         "data": item
-    }
+    })
 
 def create_update_response(
     item: Any,
     message: str = "Item atualizado com sucesso"
 ) -> dict:
     """Cria uma resposta para operação de atualização"""
-    return {
+    return _com_log({
         "status": "success",
         "message": message,
         "timestamp": datetime.now(),
         "data": item
-    }
+    })
 
 def create_auth_response(
     token: str,
@@ -129,7 +142,7 @@ def create_auth_response(
     message: str = "Autenticação realizada com sucesso"
 ) -> dict:
     """Cria uma resposta para autenticação"""
-    return {
+    return _com_log({
         "status": "success",
         "message": message,
         "timestamp": datetime.now(),
@@ -138,21 +151,21 @@ def create_auth_response(
             "token_type": "bearer",
             "user": user
         }
-    }
+    })
 
 def create_validation_error_response(
     errors: List[str],
     message: str = "Erro de validação"
 ) -> dict:
     """Cria uma resposta para erro de validação"""
-    return {
+    return _com_log({
         "status": "error",
         "message": message,
         "timestamp": datetime.now(),
         "data": {
             "errors": errors
         }
-    }
+    })
 
 def create_not_found_response(
     item_name: str = "Item",
@@ -162,31 +175,31 @@ def create_not_found_response(
     if message is None:
         message = f"{item_name} não encontrado"
     
-    return {
+    return _com_log({
         "status": "error",
         "message": message,
         "timestamp": datetime.now(),
         "data": None
-    }
+    })
 
 def create_unauthorized_response(
     message: str = "Acesso não autorizado"
 ) -> dict:
     """Cria uma resposta para acesso não autorizado"""
-    return {
+    return _com_log({
         "status": "error",
         "message": message,
         "timestamp": datetime.now(),
         "data": None
-    }
+    })
 
 def create_forbidden_response(
     message: str = "Acesso negado"
 ) -> dict:
     """Cria uma resposta para acesso negado"""
-    return {
+    return _com_log({
         "status": "error",
         "message": message,
         "timestamp": datetime.now(),
         "data": None
-    }
+    })
@@ -0,0 +1,26 @@
+"""
+Regras configuradas por template de rota (amostragem de logs, orçamento de consultas)
+"""
+
+from fnmatch import fnmatchcase
+from typing import Dict, TypeVar
+
+T = TypeVar("T")
+
+
+def valor_por_rota(regras: Dict[str, T], metodo: str, rota: str, padrao: T) -> T:
+    """
+    Valor da regra que casa com o template de rota. As chaves podem ser
+    "METODO /rota" ou "/rota" e aceitam curingas (*); vale a primeira chave
+    que casar, com a forma "METODO /rota" exata tendo precedência.
+    Sem regra, retorna o padrão.
+    """
+    chave = f"{metodo} {rota}"
+    for exata in (chave, rota):
+        if exata in regras:
+            return regras[exata]
+    for chave_regra, valor in regras.items():
+        alvo = chave if " " in chave_regra else rota
+        if fnmatchcase(alvo, chave_regra):
+            return valor
+    return padrao
@@ -0,0 +1,136 @@
+"""
+Versões das tabelas e das entidades para o GET condicional (ETag / Last-Modified)
+
+Cada tabela do banco principal tem uma linha em versao_tabela. O listener
+after_flush anota na sessão as tabelas em que o ORM inseriu, alterou ou
+removeu linhas; depois do commit, a versão delas é incrementada em uma
+transação curta e separada (um rollback só descarta a anotação). Assim a
+versão vale para todos os processos da aplicação.
+
+O incremento fica fora da transação da escrita de propósito: dentro dela, o
+UPDATE travaria a linha da tabela (no MySQL/InnoDB) até o commit e
+serializaria todas as escritas concorrentes naquela tabela. O custo é uma
+janela curta em que a escrita já foi confirmada e a versão ainda não mudou
+(uma leitura nesse intervalo recebe o ETag anterior com os dados novos, e
+o próximo incremento o invalida); se o incremento falhar ou o processo cair
+nesse meio tempo, a versão só muda na próxima escrita da tabela.
+
+- Listagens: ETag das versões das tabelas exibidas (uma consulta pela PK de
+  versao_tabela); Last-Modified é a escrita mais recente entre elas.
+- Detalhes: ETag do id + updated_at da entidade, mais as versões das tabelas
+  relacionadas que aparecem na resposta (uma consulta pela PK da entidade).
+
+Escritas feitas fora do ORM (SQL direto, outros sistemas) não mudam as versões.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+from models import VersaoTabela
+from utils.http_cache import etag_fraco
+from utils.timezone_utils import get_current_brasil_time
+
+_tabela = VersaoTabela.__table__
+
+
+def _nome_tabela(obj) -> Optional[str]:
+    tabela = getattr(obj, "__table__", None)
+    return tabela.name if tabela is not None else None
+
+
+@event.listens_for(Session, "after_flush")
+def _registrar_escritas(session, flush_context):
+    """Acumula na sessão as tabelas escritas até o commit"""
+    tabelas = session.info.setdefault("versoes_tabelas", set())
+    tabelas.update(_nome_tabela(obj) for obj in session.new)
+    tabelas.update(_nome_tabela(obj) for obj in session.deleted)
+    tabelas.update(_nome_tabela(obj) for obj in session.dirty if session.is_modified(obj))
+    tabelas.discard(None)
+
+
+@event.listens_for(Session, "after_commit")
+def _incrementar_versoes(session):
+    """Incrementa a versão das tabelas escritas, em transação própria (a da sessão já terminou)"""
+    tabelas = session.info.pop("versoes_tabelas", None)
+    if not tabelas:
+        return
+
+    agora = get_current_brasil_time()
+    try:
+        with session.get_bind().begin() as conn:
+            # Sempre na mesma ordem, para que incrementos concorrentes travem as linhas na mesma sequência
+            for tabela in sorted(tabelas):
+                resultado = conn.execute(
+                    update(_tabela)
+                    .where(_tabela.c.tabela == tabela)
+                    .values(versao=_tabela.c.versao + 1, atualizado_em=agora)
+                )
+                if not resultado.rowcount:
+                    conn.execute(insert(_tabela).values(tabela=tabela, versao=1, atualizado_em=agora))
+    except Exception as e:
+        # A escrita já foi confirmada: a falha não deve virar erro da requisição
+        print(f"⚠️ Falha ao incrementar a versão de {', '.join(sorted(tabelas))}: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_escritas(session):
+    session.info.pop("versoes_tabelas", None)
+
+
+def preparar_versoes(bind, metadata):
+    """Cria no startup a linha de versão das tabelas que ainda não têm uma"""
+    with bind.begin() as conn:
+        existentes = set(conn.execute(select(_tabela.c.tabela)).scalars())
+        novas = [
+            {"tabela": tabela.name, "versao": 1, "atualizado_em": get_current_brasil_time()}
+            for tabela in metadata.sorted_tables
+            if tabela.name not in existentes and tabela is not _tabela
+        ]
+        if novas:
+            conn.execute(insert(_tabela), novas)
+
+
+async def versoes_atuais(db, tabelas: Iterable[str]) -> Dict[str, Tuple[int, Optional[datetime]]]:
+    """(versão, última escrita) de cada tabela, em uma consulta pela PK"""
+    linhas = (await db.execute(
+        select(_tabela.c.tabela, _tabela.c.versao, _tabela.c.atualizado_em)
+        .where(_tabela.c.tabela.in_(list(tabelas)))
+    )).all()
+    return {tabela: (versao, atualizado_em) for tabela, versao, atualizado_em in linhas}
+
+
+async def validadores_lista(db, tabelas: Tuple[str, ...], *extras) -> Tuple[str, Optional[datetime]]:
+    """ETag e Last-Modified de uma listagem a partir das versões das tabelas exibidas"""
+    versoes = await versoes_atuais(db, tabelas)
+    etag = etag_fraco(*(f"{tabela}:{versoes.get(tabela, (0, None))[0]}" for tabela in tabelas), *extras)
+    last_modified = max((momento for _, momento in versoes.values() if momento is not None), default=None)
+    return etag, last_modified
+
+
+async def validadores_entidade(
+    db,
+    modelo,
+    ident: int,
+    dependencias: Tuple[str, ...] = (),
+    *extras
+) -> Optional[Tuple[str, Optional[datetime]]]:
+    """
+    ETag e Last-Modified de uma entidade (id + updated_at) e das tabelas
+    relacionadas exibidas com ela, em uma única consulta. None se não existir.
+    """
+    subconsultas = []
+    for tabela in dependencias:
+        filtro = _tabela.c.tabela == tabela
+        subconsultas.append(select(_tabela.c.versao).where(filtro).scalar_subquery())
+        subconsultas.append(select(_tabela.c.atualizado_em).where(filtro).scalar_subquery())
+
+    linha = (await db.execute(select(modelo.updated_at, *subconsultas).where(modelo.id == ident))).first()
+    if linha is None:
+        return None
+
+    updated_at, valores = linha[0], linha[1:]
+    versoes = [f"{tabela}:{valores[2 * i]}" for i, tabela in enumerate(dependencias)]
+    momentos = [momento for momento in (updated_at, *valores[1::2]) if momento is not None]
+    etag = etag_fraco(modelo.__tablename__, ident, updated_at, *versoes, *extras)
+    return etag, max(momentos, default=None)
@@ -1,114 +1,140 @@
 #!/usr/bin/env python3
 """
 Script para visualizar logs da API e erros de forma detalhada
+Lê o banco configurado em LOG_DATABASE_URL, consultando apenas as partições
+do período pedido (ver log_partitions)
 """
 
-import sqlite3
 from datetime import datetime, timedelta
 import argparse
+from sqlalchemy import text, bindparam, DateTime
+from database import log_engine
+import log_partitions
+import log_rollup
+from utils.timezone_utils import get_current_brasil_time
+
+LOG_API = "log_api"
+LOG_ERRO = "log_erro"
+
+ROLLUP = "log_api_minuto"
+QUERY_LENTA = "log_query_lenta"
+
+def _consulta_particoes(particoes, colunas, where="", sufixo=""):
+    """Monta SELECT ... UNION ALL sobre as partições, ordenado/limitado no final"""
+    uniao = log_partitions.union_all_sql(particoes, colunas, where)
+    return f"SELECT * FROM ({uniao}) AS logs {sufixo}"
 
 def view_recent_logs(hours=24, limit=20):
     """Visualiza logs recentes das últimas N horas"""
-    
+
     print(f"📊 LOGS DAS ÚLTIMAS {hours} HORAS")
     print("=" * 60)
-    
+
     try:
-        conn = sqlite3.connect("sgos.db")
-        cursor = conn.cursor()
-        
-        # Calcular timestamp de N horas atrás
-        cutoff_time = datetime.now() - timedelta(hours=hours)
-        
-        # Logs da API
-        print("\n🔄 LOGS DA API:")
-        print("-" * 40)
-        
-        cursor.execute("""
-            SELECT endpoint, metodo, status_code, app_status, tempo_resposta, created_at, ip_address
-            FROM log_api 
-            WHERE created_at >= ?
-            ORDER BY created_at DESC 
-            LIMIT ?
-        """, (cutoff_time.isoformat(), limit))
-        
-        logs_api = cursor.fetchall()
-        
-        if not logs_api:
-            print("   Nenhum log da API encontrado no período.")
-        else:
-            print(f"   📋 Últimos {len(logs_api)} logs da API:")
-            print("   " + "-" * 90)
-            print(f"   {'Endpoint':<25} {'Método':<6} {'HTTP':<6} {'App':<6} {'Tempo':<6} {'IP':<12} {'Data/Hora'}")
-            print("   " + "-" * 100)
-            
-            for log in logs_api:
-                endpoint, metodo, status, app_status, tempo, created_at, ip = log
-                endpoint_display = endpoint[:49] + "..." if len(endpoint) > 50 else endpoint
-                app_status_display = app_status if app_status else "N/A"
-                print(f"   {endpoint_display:<50} {metodo:<6} {status:<6} {app_status_display:<6} {tempo:<6}ms {ip:<12} {created_at}")
-        
-        # Logs de erro
-        print("\n🚨 LOGS DE ERRO:")
-        print("-" * 40)
-        
-        cursor.execute("""
-            SELECT endpoint, metodo, erro, created_at, ip_address
-            FROM log_erro 
-            WHERE created_at >= ?
-            ORDER BY created_at DESC 
-            LIMIT ?
-        """, (cutoff_time.isoformat(), limit))
-        
-        logs_erro = cursor.fetchall()
-        
-        if not logs_erro:
-            print("   ✅ Nenhum erro registrado no período.")
-        else:
-            print(f"   📋 Últimos {len(logs_erro)} logs de erro:")
-            print("   " + "-" * 100)
-            print(f"   {'Endpoint':<25} {'Método':<6} {'Erro':<50} {'IP':<12} {'Data/Hora'}")
-            print("   " + "-" * 100)
-            
-            for log in logs_erro:
-                endpoint, metodo, erro, created_at, ip = log
-                endpoint_display = endpoint[:49] + "..." if len(endpoint) > 50 else endpoint
-                erro_display = erro[:49] + "..." if len(erro) > 50 else erro
-                print(f"   {endpoint_display:<50} {metodo:<6} {erro_display:<50} {ip:<12} {created_at}")
-        
-        conn.close()
-        
+        # Calcular timestamp de N horas atrás (horário do Brasil, como gravado)
+        agora = get_current_brasil_time().replace(tzinfo=None)
+        cutoff_time = agora - timedelta(hours=hours)
+
+        with log_engine.connect() as conn:
+            # Logs da API
+            print("\n🔄 LOGS DA API:")
+            print("-" * 40)
+
+            particoes = log_partitions.particoes_no_intervalo(conn, LOG_API, cutoff_time, agora)
+            logs_api = []
+            if particoes:
+                sql = text(_consulta_particoes(
+                    particoes,
+                    "endpoint, metodo, status_code, app_status, tempo_resposta, created_at, ip_address",
+                    "WHERE created_at >= :cutoff",
+                    "ORDER BY created_at DESC LIMIT :limit"
+                )).bindparams(bindparam("cutoff", type_=DateTime()))
+                logs_api = conn.execute(sql, {"cutoff": cutoff_time, "limit": limit}).fetchall()
+
+            if not logs_api:
+                print("   Nenhum log da API encontrado no período.")
+            else:
+                print(f"   📋 Últimos {len(logs_api)} logs da API:")
+                print("   " + "-" * 90)
+                print(f"   {'Endpoint':<25} {'Método':<6} {'HTTP':<6} {'App':<6} {'Tempo':<6} {'IP':<12} {'Data/Hora'}")
+                print("   " + "-" * 100)
+
+                for log in logs_api:
+                    endpoint, metodo, status, app_status, tempo, created_at, ip = log
+                    endpoint_display = endpoint[:49] + "..." if len(endpoint) > 50 else endpoint
+                    app_status_display = app_status if app_status else "N/A"
+                    print(f"   {endpoint_display:<50} {metodo:<6} {status:<6} {app_status_display:<6} {tempo:<6}ms {ip:<12} {created_at}")
+
+            # Logs de erro
+            print("\n🚨 LOGS DE ERRO:")
+            print("-" * 40)
+
+            particoes = log_partitions.particoes_no_intervalo(conn, LOG_ERRO, cutoff_time, agora)
+            logs_erro = []
+            if particoes:
+                # O identificador exibido é PARTICAO:ID, pois o id só é único dentro da partição
+                partes = [
+                    f"SELECT '{nome[len(LOG_ERRO) + 1:]}' AS particao, id, endpoint, metodo, erro, created_at, ip_address "
+                    f"FROM {nome} WHERE created_at >= :cutoff"
+                    for nome in particoes
+                ]
+                sql = text(
+                    f"SELECT * FROM ({' UNION ALL '.join(partes)}) AS logs ORDER BY created_at DESC LIMIT :limit"
+                ).bindparams(bindparam("cutoff", type_=DateTime()))
+                logs_erro = conn.execute(sql, {"cutoff": cutoff_time, "limit": limit}).fetchall()
+
+            if not logs_erro:
+                print("   ✅ Nenhum erro registrado no período.")
+            else:
+                print(f"   📋 Últimos {len(logs_erro)} logs de erro:")
+                print("   " + "-" * 100)
+                print(f"   {'Ref':<16} {'Endpoint':<25} {'Método':<6} {'Erro':<50} {'IP':<12} {'Data/Hora'}")
+                print("   " + "-" * 100)
+
+                for log in logs_erro:
+                    particao, error_id, endpoint, metodo, erro, created_at, ip = log
+                    ref = f"{particao}:{error_id}"
+                    endpoint_display = endpoint[:49] + "..." if len(endpoint) > 50 else endpoint
+                    erro_display = erro[:49] + "..." if len(erro) > 50 else erro
+                    print(f"   {ref:<16} {endpoint_display:<50} {metodo:<6} {erro_display:<50} {ip:<12} {created_at}")
+
     except Exception as e:
         print(f"❌ Erro ao visualizar logs: {e}")
 
-def view_error_details(error_id=None):
-    """Visualiza detalhes de um erro específico"""
-    
-    if not error_id:
+def view_error_details(error_ref=None):
+    """Visualiza detalhes de um erro específico (referência PARTICAO:ID, ex.: 20240131:15)"""
+
+    if not error_ref:
         print("❌ ID do erro não fornecido!")
         return
-    
-    print(f"🔍 DETALHES DO ERRO #{error_id}")
+
+    print(f"🔍 DETALHES DO ERRO #{error_ref}")
     print("=" * 50)
-    
+
     try:
-        conn = sqlite3.connect("sgos.db")
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT endpoint, metodo, erro, stack_trace, created_at, ip_address, usuario_id
-            FROM log_erro 
-            WHERE id = ?
-        """, (error_id,))
-        
-        error = cursor.fetchone()
-        
+        sufixo, _, error_id = str(error_ref).partition(":")
+        if not error_id or not error_id.isdigit():
+            print("❌ Use o formato PARTICAO:ID (ex.: 20240131:15), como exibido na lista de erros")
+            return
+
+        nome = f"{LOG_ERRO}_{sufixo}"
+        with log_engine.connect() as conn:
+            if nome not in log_partitions.listar_particoes(conn, LOG_ERRO):
+                print(f"❌ Partição {sufixo} não encontrada (pode ter sido removida pela retenção)")
+                return
+
+            error = conn.execute(text(f"""
+                SELECT endpoint, metodo, erro, stack_trace, created_at, ip_address, usuario_id
+                FROM {nome}
+                WHERE id = :id
+            """), {"id": int(error_id)}).fetchone()
+
         if not error:
-            print(f"❌ Erro #{error_id} não encontrado!")
+            print(f"❌ Erro #{error_ref} não encontrado!")
             return
-        
+
         endpoint, metodo, erro, stack_trace, created_at, ip_address, usuario_id = error
-        
+
         print(f"📍 Endpoint: {endpoint}")
         print(f"🔧 Método: {metodo}")
         print(f"⏰ Data/Hora: {created_at}")
@@ -116,125 +142,201 @@ def view_error_details(error_id=None):
         print(f"👤 Usuário ID: {usuario_id or 'N/A'}")
         print(f"\n❌ Erro:")
         print(f"   {erro}")
-        
+
         if stack_trace:
             print(f"\n📋 Stack Trace:")
             print(f"   {stack_trace}")
-        
-        conn.close()
-        
+
     except Exception as e:
         print(f"❌ Erro ao visualizar detalhes: {e}")
 
-def view_statistics():
-    """Visualiza estatísticas dos logs"""
-    
+def view_statistics(days=None):
+    """
+    Visualiza estatísticas dos logs (todo o histórico ou só os últimos N dias)
+    Lê o agregado por minuto (log_api_minuto), sem varrer as partições de log_api
+    """
+
     print("📈 ESTATÍSTICAS DOS LOGS")
     print("=" * 50)
-    
+
     try:
-        conn = sqlite3.connect("sgos.db")
-        cursor = conn.cursor()
-        
-        # Estatísticas gerais
-        cursor.execute("SELECT COUNT(*) FROM log_api")
-        total_api_logs = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM log_erro")
-        total_error_logs = cursor.fetchone()[0]
-        
-        print(f"📊 Total de logs da API: {total_api_logs}")
-        print(f"🚨 Total de logs de erro: {total_error_logs}")
-        
-        if total_api_logs > 0:
-            error_rate = (total_error_logs / total_api_logs) * 100
-            print(f"📉 Taxa de erro: {error_rate:.2f}%")
-        
-        # Status codes mais comuns
-        print(f"\n🔢 Status Codes mais comuns:")
-        cursor.execute("""
-            SELECT status_code, COUNT(*) as total
-            FROM log_api 
-            GROUP BY status_code 
-            ORDER BY total DESC 
-            LIMIT 10
-        """)
-        
-        status_codes = cursor.fetchall()
-        for status, total in status_codes:
-            print(f"   {status}: {total} requisições")
-        
-        # Endpoints mais acessados
-        print(f"\n🌐 Endpoints mais acessados:")
-        cursor.execute("""
-            SELECT endpoint, COUNT(*) as total
-            FROM log_api 
-            GROUP BY endpoint 
-            ORDER BY total DESC 
-            LIMIT 10
-        """)
-        
-        endpoints = cursor.fetchall()
-        for endpoint, total in endpoints:
-            endpoint_display = endpoint[:40] + "..." if len(endpoint) > 40 else endpoint
-            print(f"   {endpoint_display:<40} | {total} acessos")
-        
-        # Endpoints com mais erros
-        if total_error_logs > 0:
-            print(f"\n🚨 Endpoints com mais erros:")
-            cursor.execute("""
-                SELECT endpoint, COUNT(*) as total_erros
-                FROM log_erro 
-                GROUP BY endpoint 
-                ORDER BY total_erros DESC 
+        filtro = ""
+        params = {}
+        if days:
+            hoje = get_current_brasil_time().date()
+            params["inicio"] = datetime.combine(hoje - timedelta(days=days - 1), datetime.min.time())
+            filtro = "WHERE minuto >= :inicio"
+
+        def consulta(sql):
+            stmt = text(sql)
+            if params:
+                stmt = stmt.bindparams(bindparam("inicio", type_=DateTime()))
+            return conn.execute(stmt, params)
+
+        with log_engine.connect() as conn:
+            buckets = ", ".join(f"SUM({coluna})" for _, coluna in log_rollup.BUCKETS_MS)
+            geral = consulta(f"""
+                SELECT SUM(total), SUM(erros), SUM(soma_tempo), MIN(tempo_min), MAX(tempo_max), {buckets}
+                FROM {ROLLUP} {filtro}
+            """).fetchone()
+
+            # Totais estimados: linhas amostradas valem peso_amostra requisições
+            total_api_logs = geral[0] or 0
+            total_error_logs = geral[1] or 0
+
+            print(f"📊 Total de logs da API (estimado): {total_api_logs:.0f}")
+            print(f"🚨 Total de logs de erro: {total_error_logs:.0f}")
+
+            if total_api_logs > 0:
+                error_rate = (total_error_logs / total_api_logs) * 100
+                print(f"📉 Taxa de erro: {error_rate:.2f}%")
+            else:
+                return
+
+            # Classes de status mais comuns
+            print(f"\n🔢 Classes de status mais comuns:")
+            status_classes = consulta(f"""
+                SELECT classe_status, SUM(total) as total
+                FROM {ROLLUP} {filtro}
+                GROUP BY classe_status
+                ORDER BY total DESC
+            """).fetchall()
+            for classe, total in status_classes:
+                print(f"   {classe}: {total:.0f} requisições")
+
+            # Rotas mais acessadas
+            print(f"\n🌐 Endpoints mais acessados:")
+            endpoints = consulta(f"""
+                SELECT metodo, rota, SUM(total) as total
+                FROM {ROLLUP} {filtro}
+                GROUP BY metodo, rota
+                ORDER BY total DESC
                 LIMIT 10
-            """)
-            
-            error_endpoints = cursor.fetchall()
-            for endpoint, total_erros in error_endpoints:
+            """).fetchall()
+            for metodo, endpoint, total in endpoints:
+                endpoint = f"{metodo} {endpoint}"
                 endpoint_display = endpoint[:40] + "..." if len(endpoint) > 40 else endpoint
-                print(f"   {endpoint_display:<40} | {total_erros} erros")
-        
-        # Performance (tempo médio de resposta)
-        cursor.execute("""
-            SELECT AVG(tempo_resposta) as tempo_medio,
-                   MIN(tempo_resposta) as tempo_min,
-                   MAX(tempo_resposta) as tempo_max
-            FROM log_api
-        """)
-        
-        tempo_medio, tempo_min, tempo_max = cursor.fetchone()
-        
-        if tempo_medio:
+                print(f"   {endpoint_display:<40} | {total:.0f} acessos")
+
+            # Rotas com mais erros
+            if total_error_logs > 0:
+                print(f"\n🚨 Endpoints com mais erros:")
+                error_endpoints = consulta(f"""
+                    SELECT metodo, rota, SUM(erros) as total_erros
+                    FROM {ROLLUP} {filtro}
+                    GROUP BY metodo, rota
+                    HAVING SUM(erros) > 0
+                    ORDER BY total_erros DESC
+                    LIMIT 10
+                """).fetchall()
+                for metodo, endpoint, total_erros in error_endpoints:
+                    endpoint = f"{metodo} {endpoint}"
+                    endpoint_display = endpoint[:40] + "..." if len(endpoint) > 40 else endpoint
+                    print(f"   {endpoint_display:<40} | {total_erros:.0f} erros")
+
+            # Performance (tempo médio e percentis aproximados pelo histograma)
+            soma_tempo, tempo_min, tempo_max = geral[2], geral[3], geral[4]
+            histograma = {
+                coluna: valor or 0
+                for (_, coluna), valor in zip(log_rollup.BUCKETS_MS, geral[5:])
+            }
+
             print(f"\n⚡ Performance:")
-            print(f"   Tempo médio de resposta: {tempo_medio:.1f}ms")
+            print(f"   Tempo médio de resposta: {soma_tempo / total_api_logs:.1f}ms")
             print(f"   Tempo mínimo: {tempo_min}ms")
             print(f"   Tempo máximo: {tempo_max}ms")
-        
-        conn.close()
-        
+            for p in (0.5, 0.9, 0.99):
+                limite = log_rollup.percentil_buckets(histograma, p)
+                faixa = f"≤ {limite}ms" if limite is not None else "> 5000ms"
+                print(f"   p{int(p * 100)}: {faixa}")
+
     except Exception as e:
         print(f"❌ Erro ao visualizar estatísticas: {e}")
 
+def view_slow_queries(days=None, limit=20):
+    """Consultas lentas agrupadas pelo SQL normalizado, ordenadas pelo tempo total"""
+
+    print("🐢 CONSULTAS LENTAS (por tempo total)")
+    print("=" * 60)
+
+    try:
+        filtro = ""
+        params = {"limit": limit}
+        if days:
+            hoje = get_current_brasil_time().date()
+            params["inicio"] = datetime.combine(hoje - timedelta(days=days - 1), datetime.min.time())
+            filtro = "WHERE created_at >= :inicio"
+
+        sql = text(f"""
+            SELECT hash_sql, COUNT(*) AS execucoes, SUM(duracao_ms) AS total_ms,
+                   AVG(duracao_ms), MAX(duracao_ms), MAX(CASE WHEN scan_completo THEN 1 ELSE 0 END),
+                   MAX(tabelas_scan), MAX(sql_normalizado), MAX(plano)
+            FROM {QUERY_LENTA} {filtro}
+            GROUP BY hash_sql
+            ORDER BY total_ms DESC
+            LIMIT :limit
+        """)
+        if days:
+            sql = sql.bindparams(bindparam("inicio", type_=DateTime()))
+
+        with log_engine.connect() as conn:
+            consultas = conn.execute(sql, params).fetchall()
+
+            if not consultas:
+                print("   ✅ Nenhuma consulta lenta registrada no período.")
+                return
+
+            for hash_sql, execucoes, total_ms, media_ms, max_ms, scan, tabelas, sql_normalizado, plano in consultas:
+                rotas = conn.execute(text(f"""
+                    SELECT metodo, rota, COUNT(*) AS total
+                    FROM {QUERY_LENTA}
+                    WHERE hash_sql = :hash_sql
+                    GROUP BY metodo, rota
+                    ORDER BY total DESC
+                    LIMIT 3
+                """), {"hash_sql": hash_sql}).fetchall()
+
+                sql_display = sql_normalizado[:199] + "..." if len(sql_normalizado) > 200 else sql_normalizado
+                print(f"\n🔎 {hash_sql} | {execucoes} execuções | total {total_ms:.0f}ms | "
+                      f"média {media_ms:.1f}ms | máx {max_ms:.1f}ms")
+                if scan:
+                    print(f"   ⚠️ Leitura completa (SCAN): {tabelas}")
+                print(f"   {sql_display}")
+                for metodo, rota, total in rotas:
+                    print(f"   ↳ {metodo or '-'} {rota or '(fora de requisição)'}: {total}x")
+                if plano:
+                    print("   Plano:")
+                    for linha in plano.splitlines():
+                        print(f"      {linha}")
+
+    except Exception as e:
+        print(f"❌ Erro ao visualizar consultas lentas: {e}")
+
 def main():
     """Função principal"""
-    
+
     parser = argparse.ArgumentParser(description="Visualizador de logs da API")
-    parser.add_argument("--recent", "-r", type=int, default=24, 
+    parser.add_argument("--recent", "-r", type=int, default=24,
                        help="Visualizar logs das últimas N horas (padrão: 24)")
     parser.add_argument("--limit", "-l", type=int, default=20,
                        help="Limite de logs a mostrar (padrão: 20)")
-    parser.add_argument("--error", "-e", type=int,
-                       help="Visualizar detalhes de um erro específico por ID")
+    parser.add_argument("--error", "-e", type=str,
+                       help="Visualizar detalhes de um erro específico por PARTICAO:ID (ex.: 20240131:15)")
     parser.add_argument("--stats", "-s", action="store_true",
                        help="Visualizar estatísticas dos logs")
-    
+    parser.add_argument("--days", "-d", type=int,
+                       help="Restringir as estatísticas (ou --slow) aos últimos N dias")
+    parser.add_argument("--slow", action="store_true",
+                       help="Consultas SQL lentas agrupadas pelo SQL normalizado, por tempo total")
+
     args = parser.parse_args()
-    
+
     if args.error:
         view_error_details(args.error)
+    elif args.slow:
+        view_slow_queries(args.days, args.limit)
     elif args.stats:
-        view_statistics()
+        view_statistics(args.days)
     else:
         view_recent_logs(args.recent, args.limit)
 
@@ -59,33 +59,28 @@ export class DashboardPage implements OnInit, OnDestroy {
         options.headers['Authorization'] = `Bearer ${token}`;
       }
 
-      const [osResp, veiculosResp, usuariosResp]: any[] = await Promise.all([
-        this.http.get('http://localhost:8000/api/v1/ordens-servico/?limit=1000', options).toPromise(),
-        this.http.get('http://localhost:8000/api/v1/veiculos/?limit=1000', options).toPromise(),
-        this.http.get('http://localhost:8000/api/v1/usuarios/?limit=1000', options).toPromise()
-      ]);
-
-      const osItems = osResp?.data?.items || [];
-      const veiculosItems = veiculosResp?.data?.items || [];
-      const usuariosItems = usuariosResp?.data?.items || [];
-      
-      
-      const osTotal = osItems.length;
-      const osAbertas = osItems.filter((o: any) => o.situacao_os === 'ABERTA').length;
-      const osFechadas = osItems.filter((o: any) => o.situacao_os === 'FECHADA').length;
-      const osRetiradas = osItems.filter((o: any) => o.situacao_os === 'RETIRADA').length;
-
-      const veiculosTotal = veiculosItems.length;
-      const veiculosAtivos = veiculosItems.filter((v: any) => v.status === 'ATIVO').length;
-      const veiculosManutencao = veiculosItems.filter((v: any) => v.status === 'MANUTENCAO').length;
-
-      const usuariosTotal = usuariosItems.length;
-      const usuariosAtivos = usuariosItems.filter((u: any) => u.ativo === true).length;
+      // Contagens calculadas no backend (GROUP BY), sem baixar as listagens
+      const resp: any = await this.http.get('http://localhost:8000/api/v1/dashboard/stats', options).toPromise();
+      const dados = resp?.data || {};
+      const porSituacao = dados.ordens_servico?.por_situacao || {};
+      const porStatus = dados.veiculos?.por_status || {};
 
       this.stats = {
-        ordensServico: { total: osTotal, abertas: osAbertas, fechadas: osFechadas, retiradas: osRetiradas },
-        veiculos: { total: veiculosTotal, ativos: veiculosAtivos, manutencao: veiculosManutencao },
-        usuarios: { total: usuariosTotal, ativos: usuariosAtivos }
+        ordensServico: {
+          total: dados.ordens_servico?.total || 0,
+          abertas: porSituacao['ABERTA'] || 0,
+          fechadas: porSituacao['FECHADA'] || 0,
+          retiradas: porSituacao['RETIRADA'] || 0
+        },
+        veiculos: {
+          total: dados.veiculos?.total || 0,
+          ativos: porStatus['ATIVO'] || 0,
+          manutencao: porStatus['MANUTENCAO'] || 0
+        },
+        usuarios: {
+          total: dados.usuarios?.total || 0,
+          ativos: dados.usuarios_ativos?.total || 0
+        }
       };
     } catch (error) {
       console.error('Erro ao carregar estatísticas do dashboard:', error);